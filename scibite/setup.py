@@ -16,6 +16,11 @@ setuptools.setup(name='termite_toolkit',
                  install_requires=[
                      "requests>=2.8.1"
                  ],
+                 extras_require={
+                     "async": ["aiohttp>=3.6"],
+                     "arrow": ["pyarrow>=6.0"],
+                     "roaring": ["pyroaring>=0.3"]
+                 },
                  author='SciBite DataScience',
                  author_email='joe@scibite.com',
                  long_description=long_description,
@@ -1,3 +1,4 @@
+from .exceptions import *
 from .termite import *
 from .texpress import *
 
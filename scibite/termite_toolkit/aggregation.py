@@ -0,0 +1,249 @@
+"""
+
+  ____       _ ____  _ _         _____ _____ ____  __  __ _ _         _____           _ _    _ _
+ / ___|  ___(_) __ )(_) |_ ___  |_   _| ____|  _ \|  \/  (_) |_ ___  |_   _|__   ___ | | | _(_) |_
+ \___ \ / __| |  _ \| | __/ _ \   | | |  _| | |_) | |\/| | | __/ _ \   | |/ _ \ / _ \| | |/ / | __|
+  ___) | (__| | |_) | | ||  __/   | | | |___|  _ <| |  | | | ||  __/   | | (_) | (_) | |   <| | |_
+ |____/ \___|_|____/|_|\__\___|   |_| |_____|_| \_\_|  |_|_|\__\___|   |_|\___/ \___/|_|_|\_\_|\__|
+
+
+CorpusAggregator- entity statistics accumulated over any number of TERMite responses.
+
+"""
+
+__author__ = 'SciBite DataScience'
+__version__ = '0.2'
+__copyright__ = '(c) 2019, SciBite Ltd'
+__license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from termite_toolkit.termite import ENTITY_SUMMARY_COLUMNS, iter_payload_records
+
+try:
+    from pyroaring import BitMap
+except ImportError:
+    BitMap = None
+
+INITIAL_CAPACITY = 1024
+
+
+class CorpusAggregator():
+    """
+    Class accumulating per-entity statistics over a corpus annotated across many requests: total hit count, maximum
+    relevance score and the documents each entity was found in. Responses are absorbed one at a time and discarded.
+    Counters are held in numpy arrays indexed by entity and documents are numbered, so each entity keeps a set of
+    integers rather than a list of docID strings; with pyroaring installed these are compressed bitmaps.
+    Aggregators built in separate processes can be combined with merge(), and saved and restored with checkpoint() and
+    load()
+    """
+
+    def __init__(self, use_bitmaps=None):
+        """
+        :param use_bitmaps: if True keep document sets as pyroaring bitmaps, by default they are used if installed
+        """
+        if use_bitmaps is None:
+            use_bitmaps = BitMap is not None
+        if use_bitmaps and BitMap is None:
+            raise ImportError('pyroaring is required for bitmap document sets, install it with: pip install pyroaring')
+        self.use_bitmaps = use_bitmaps
+
+        self._entity_index = {}
+        self._ids, self._types, self._names, self._doc_sets = [], [], [], []
+        self._doc_index = {}
+        self._doc_ids = []
+        self._hit_count = np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+        self._max_score = np.full(INITIAL_CAPACITY, -np.inf)
+
+    def __len__(self):
+        return len(self._ids)
+
+    @property
+    def doc_count(self):
+        """
+        Number of distinct documents seen
+        """
+        return len(self._doc_ids)
+
+    def _new_doc_set(self, doc_indices=()):
+        if self.use_bitmaps:
+            return BitMap(doc_indices)
+        return set(doc_indices)
+
+    def _entity(self, entity_type, hit_id, name):
+        """
+        Helper function. Index of an entity, adding it if it has not been seen before.
+        """
+        entity_id = entity_type + '$' + hit_id
+        idx = self._entity_index.get(entity_id)
+        if idx is None:
+            idx = self._entity_index[entity_id] = len(self._ids)
+            self._ids.append(hit_id)
+            self._types.append(entity_type)
+            self._names.append(name)
+            self._doc_sets.append(self._new_doc_set())
+            if idx >= len(self._hit_count):
+                self._grow(2 * len(self._hit_count))
+        return idx
+
+    def _doc(self, doc_id):
+        """
+        Helper function. Index of a document, a docID of None is a new anonymous document every time.
+        """
+        if doc_id is None:
+            self._doc_ids.append(None)
+            return len(self._doc_ids) - 1
+        idx = self._doc_index.get(doc_id)
+        if idx is None:
+            idx = self._doc_index[doc_id] = len(self._doc_ids)
+            self._doc_ids.append(doc_id)
+        return idx
+
+    def _grow(self, capacity):
+        hit_count = np.zeros(capacity, dtype=np.int64)
+        hit_count[:len(self._hit_count)] = self._hit_count
+        max_score = np.full(capacity, -np.inf)
+        max_score[:len(self._max_score)] = self._max_score
+        self._hit_count, self._max_score = hit_count, max_score
+
+    def absorb(self, termite_response, doc_id=None, reject_ambig=True, score_cutoff=0, remove_subsumed=True):
+        """
+        Add the hits of a TERMite response, which can then be discarded
+
+        :param termite_response: JSON or doc.JSONx TERMite response, a TermiteResult, or a stream of documents
+        :param doc_id: document ID for hits without a docID, e.g. those of a single document RESP_PAYLOAD response.
+        If not given, each response without docIDs is counted as a new document with a docID of None
+        :param reject_ambig: boolean
+        :param score_cutoff: a numerical value between 1-5
+        :param remove_subsumed: boolean
+        """
+        self.absorb_records(iter_payload_records(termite_response, reject_ambig=reject_ambig,
+                                                 score_cutoff=score_cutoff, remove_subsumed=remove_subsumed),
+                            doc_id=doc_id)
+
+    def absorb_records(self, records, doc_id=None):
+        """
+        Add TERMite hit records
+
+        :param records: iterable of TERMite hit records
+        :param doc_id: document ID for records without a docID, if not given they are counted as one new document
+        """
+        entities, hit_counts, scores = [], [], []
+        anonymous_doc = None
+        for record in records:
+            idx = self._entity(record['entityType'], record['hitID'], record['name'])
+            record_doc_id = record.get('docID', doc_id)
+            if record_doc_id is None:
+                if anonymous_doc is None:
+                    anonymous_doc = self._doc(None)
+                doc = anonymous_doc
+            else:
+                doc = self._doc(record_doc_id)
+            self._doc_sets[idx].add(doc)
+            entities.append(idx)
+            hit_counts.append(record['hitCount'])
+            scores.append(record['score'])
+
+        if entities:
+            entities = np.asarray(entities, dtype=np.int64)
+            np.add.at(self._hit_count, entities, np.asarray(hit_counts, dtype=np.int64))
+            np.maximum.at(self._max_score, entities, np.asarray(scores, dtype=np.float64))
+
+    def merge(self, other):
+        """
+        Add the statistics of another aggregator, e.g. one filled by a worker process
+
+        :param other: CorpusAggregator
+        :return: this aggregator
+        """
+        doc_map = np.fromiter((self._doc(doc_id) for doc_id in other._doc_ids), dtype=np.int64,
+                              count=len(other._doc_ids))
+        entity_map = np.fromiter((self._entity(other._types[i], other._ids[i], other._names[i])
+                                  for i in range(len(other))), dtype=np.int64, count=len(other))
+
+        n = len(other)
+        np.add.at(self._hit_count, entity_map, other._hit_count[:n])
+        np.maximum.at(self._max_score, entity_map, other._max_score[:n])
+        for idx, doc_set in zip(entity_map, other._doc_sets):
+            if doc_set:
+                remapped = doc_map[np.fromiter(doc_set, dtype=np.int64, count=len(doc_set))]
+                self._doc_sets[idx] |= self._new_doc_set(remapped.tolist())
+        return self
+
+    def checkpoint(self, path):
+        """
+        Save the aggregator to a compressed .npz file. The file is replaced atomically, so an interrupted run can
+        always be resumed from the last complete checkpoint
+
+        :param path: output file
+        """
+        n = len(self)
+        sizes = np.fromiter((len(doc_set) for doc_set in self._doc_sets), dtype=np.int64, count=n)
+        doc_indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(sizes, out=doc_indptr[1:])
+        doc_indices = np.fromiter((doc for doc_set in self._doc_sets for doc in sorted(doc_set)), dtype=np.int64,
+                                  count=int(doc_indptr[-1]))
+        strings = json.dumps({"ids": self._ids, "types": self._types, "names": self._names, "docs": self._doc_ids})
+
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, hit_count=self._hit_count[:n], max_score=self._max_score[:n],
+                                doc_indptr=doc_indptr, doc_indices=doc_indices,
+                                strings=np.frombuffer(strings.encode('utf-8'), dtype=np.uint8))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, use_bitmaps=None):
+        """
+        Restore an aggregator saved with checkpoint()
+
+        :param path: checkpoint file
+        :param use_bitmaps: as for CorpusAggregator
+        :return: CorpusAggregator
+        """
+        aggregator = cls(use_bitmaps=use_bitmaps)
+        with np.load(path) as data:
+            strings = json.loads(data['strings'].tobytes().decode('utf-8'))
+            doc_indptr, doc_indices = data['doc_indptr'], data['doc_indices']
+            n = len(strings["ids"])
+            aggregator._grow(max(INITIAL_CAPACITY, n))
+            aggregator._hit_count[:n] = data['hit_count']
+            aggregator._max_score[:n] = data['max_score']
+
+        aggregator._ids, aggregator._types, aggregator._names = strings["ids"], strings["types"], strings["names"]
+        aggregator._entity_index = {entity_type + '$' + hit_id: idx for idx, (entity_type, hit_id) in
+                                    enumerate(zip(aggregator._types, aggregator._ids))}
+        aggregator._doc_ids = strings["docs"]
+        aggregator._doc_index = {doc_id: idx for idx, doc_id in enumerate(aggregator._doc_ids) if doc_id is not None}
+        aggregator._doc_sets = [aggregator._new_doc_set(doc_indices[doc_indptr[i]:doc_indptr[i + 1]].tolist())
+                                for i in range(n)]
+        return aggregator
+
+    def to_dataframe(self):
+        """
+        Summary of hits per entity, in the same format as termite.all_entities_df, with entities and their documents
+        in order of first appearance
+
+        :return: pandas dataframe
+        """
+        n = len(self)
+        if n == 0:
+            return pd.DataFrame()
+        scores = self._max_score[:n]
+        # scores are stored as floats, return them as integers when that is what TERMite reported
+        if np.array_equal(scores, np.floor(scores)):
+            scores = scores.astype(np.int64)
+        # anonymous documents are reported with the empty docID all_entities_df uses, but still counted separately
+        doc_names = ['' if doc_id is None else doc_id for doc_id in self._doc_ids]
+        doc_ids = [[doc_names[doc] for doc in sorted(doc_set)] for doc_set in self._doc_sets]
+
+        df = pd.DataFrame({"id": self._ids, "type": self._types, "name": self._names,
+                           "hit_count": self._hit_count[:n].tolist(), "max_relevance_score": scores.tolist(),
+                           "doc_id": doc_ids, "doc_count": [len(docs) for docs in doc_ids]},
+                          index=[entity_type + '$' + hit_id for entity_type, hit_id in zip(self._types, self._ids)],
+                          columns=ENTITY_SUMMARY_COLUMNS)
+        return df.astype(object)
@@ -0,0 +1,294 @@
+"""
+
+  ____       _ ____  _ _         _____ _____ ____  __  __ _ _         _____           _ _    _ _
+ / ___|  ___(_) __ )(_) |_ ___  |_   _| ____|  _ \|  \/  (_) |_ ___  |_   _|__   ___ | | | _(_) |_
+ \___ \ / __| |  _ \| | __/ _ \   | | |  _| | |_) | |\/| | | __/ _ \   | |/ _ \ / _ \| | |/ / | __|
+  ___) | (__| | |_) | | ||  __/   | | | |___|  _ <| |  | | | ||  __/   | | (_) | (_) | |   <| | |_
+ |____/ \___|_|____/|_|\__\___|   |_| |_____|_| \_\_|  |_|_|\__\___|   |_|\___/ \___/|_|_|\_\_|\__|
+
+
+AsyncTermiteClient and AsyncTexpressClient- asyncio clients for the TERMite and TExpress APIs.
+Requires the optional aiohttp package.
+
+"""
+
+__author__ = 'SciBite DataScience'
+__version__ = '0.2'
+__copyright__ = '(c) 2019, SciBite Ltd'
+__license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
+
+import asyncio
+import contextlib
+import os
+import ssl
+
+from termite_toolkit.exceptions import TermiteConnectionError, TermiteHTTPError
+from termite_toolkit.session import RetryPolicy
+from termite_toolkit.termite import TermiteRequestBuilder, TermiteResult
+from termite_toolkit.texpress import TexpressRequestBuilder
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class _AsyncClient():
+    """
+    Base class for the asyncio clients, requests are described with the synchronous request builders and sent
+    over a single aiohttp session
+    """
+
+    builder_class = None
+    # output formats whose responses are parsed as JSON
+    json_outputs = ("json", "doc.json", "doc.jsonx")
+
+    def __init__(self, url='http://localhost:9090/termite', max_concurrency=100, limit_per_host=0, timeout=None,
+                 connector=None, retry=None, circuit_breaker=None):
+        """
+        :param url: the URL of the TERMite instance to be hit
+        :param max_concurrency: maximum number of requests in flight at once
+        :param limit_per_host: maximum number of open connections per host, 0 for no limit beyond max_concurrency
+        :param timeout: total timeout in seconds for each request
+        :param connector: optional aiohttp connector to share between several clients, it is not closed by the client
+        :param retry: RetryPolicy for failed requests, by default up to 3 retries with exponential backoff
+        :param circuit_breaker: optional CircuitBreaker shared by every request sent by this client
+        """
+        if aiohttp is None:
+            raise ImportError('aiohttp is required for the asyncio clients, install it with: pip install aiohttp')
+        self.url = url
+        self.max_concurrency = max_concurrency
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self.connector = connector
+        self.retry = retry if retry is not None else RetryPolicy()
+        self.circuit_breaker = circuit_breaker
+        self.basic_auth = ()
+        self.verify_request = True
+        self._semaphore = None
+        self._session = None
+
+    def set_basic_auth(self, username='', password='', verification=True):
+        """
+        Pass basic authentication credentials used for requests built by this client
+        **ONLY change verification if you are calling a known source**
+
+        :param username: username to be used for basic authentication
+        :param password: password to be used for basic authentication
+        :param verification: if set to False the SSL certificate is not verified, can also pass the path to a
+        certificate file
+        """
+        self.basic_auth = (username, password)
+        self.verify_request = verification
+
+    def _get_session(self):
+        """
+        Helper function. Lazily create the aiohttp session, this must happen inside the running event loop.
+
+        :return: aiohttp.ClientSession
+        """
+        if self._session is None or self._session.closed:
+            if self.connector is not None:
+                connector, connector_owner = self.connector, False
+            else:
+                connector = aiohttp.TCPConnector(limit=self.max_concurrency, limit_per_host=self.limit_per_host)
+                connector_owner = True
+            self._session = aiohttp.ClientSession(connector=connector, connector_owner=connector_owner,
+                                                  timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    def new_request(self):
+        """
+        Returns a request builder pointed at this client's URL, use its set_* methods then pass it to execute()
+
+        :return: request builder
+        """
+        builder = self.builder_class()
+        builder.set_url(self.url)
+        if bool(self.basic_auth):
+            builder.set_basic_auth(self.basic_auth[0], self.basic_auth[1], self.verify_request)
+        return builder
+
+    def _returns_json(self, builder, return_text):
+        return builder.payload["output"] in self.json_outputs and not return_text
+
+    def _result(self, parsed):
+        return parsed
+
+    async def execute(self, builder, display_request=False, return_text=False, result=False):
+        """
+        Once all settings are done on a request builder, POST its parameters to the RESTful API
+        Failed requests are retried according to the client's RetryPolicy
+
+        :param builder: request builder holding the payload, e.g. from new_request()
+        :param display_request: if True request will be printed out before being submitted
+        :param return_text: if True return the raw response text rather than parsed JSON
+        :param result: if True wrap a parsed TERMite response in a TermiteResult
+        :return: request response
+        :raises TermiteConnectionError: if TERMite could not be reached
+        :raises TermiteHTTPError: if TERMite answered with an error status
+        :raises CircuitOpenError: if the client's circuit breaker is open
+        """
+        if display_request:
+            print("REQUEST: ", builder.url, builder.payload)
+
+        request_kwargs = {}
+        if bool(builder.basic_auth):
+            request_kwargs["auth"] = aiohttp.BasicAuth(*builder.basic_auth)
+            if builder.verify_request is False:
+                request_kwargs["ssl"] = False
+            elif isinstance(builder.verify_request, str):
+                request_kwargs["ssl"] = ssl.create_default_context(cafile=builder.verify_request)
+
+        session = self._get_session()
+        # file objects are rewound to where they started before every attempt
+        positions = {field: source.tell() for field, (file_name, source) in (builder.binary_content or {}).items()
+                     if hasattr(source, 'seek')}
+        attempt = 0
+        async with self._semaphore:
+            while True:
+                trial = self.circuit_breaker is not None and self.circuit_breaker.before_request(builder.url)
+                try:
+                    with contextlib.ExitStack() as files:
+                        request_kwargs["data"] = self._form_data(builder, files, positions)
+                        async with session.post(builder.url, **request_kwargs) as response:
+                            if response.status < 400:
+                                self._record(True)
+                                if self._returns_json(builder, return_text):
+                                    parsed = await response.json(content_type=None)
+                                    return self._result(parsed) if result else parsed
+                                return await response.text()
+                            retryable = response.status in self.retry.retry_statuses
+                            # as in HttpSession.request, retryable statuses count as failures
+                            self._record(response.status < 500 and not retryable)
+                            if not retryable or attempt >= self.retry.max_retries:
+                                raise TermiteHTTPError(
+                                    "TERMite returned HTTP {} {} for {}\n\nPlease check that the necessary credentials have been provided (done so using the set_basic_auth() function)".format(
+                                        response.status, response.reason, builder.url), url=builder.url,
+                                    status_code=response.status)
+                            delay = self.retry.backoff(attempt, response.headers.get('Retry-After'))
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    self._record(False)
+                    if attempt >= self.retry.max_retries:
+                        raise TermiteConnectionError(
+                            "Failed with the following error {}\n\nPlease check that TERMite can be accessed via the following URL {}".format(
+                                e, builder.url), url=builder.url) from e
+                    delay = self.retry.backoff(attempt)
+                except TermiteHTTPError:
+                    raise
+                except BaseException:
+                    # e.g. cancellation, let another request take the trial
+                    if trial:
+                        self.circuit_breaker.release_trial()
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    @staticmethod
+    def _form_data(builder, files, positions=None):
+        """
+        Helper function. Encode a builder's payload, opening any binary content from disk within files.
+
+        :param builder: request builder
+        :param files: contextlib.ExitStack that closes opened files
+        :param positions: dictionary of the starting position of each file object source, which is sought back to
+        :return: request data
+        """
+        if not builder.binary_content:
+            return {key: str(value) for key, value in builder.payload.items()}
+        data = aiohttp.FormData()
+        for key, value in builder.payload.items():
+            data.add_field(key, str(value))
+        for field, (file_name, source) in builder.binary_content.items():
+            if isinstance(source, (str, os.PathLike)):
+                source = files.enter_context(open(source, 'rb'))
+            elif positions and field in positions:
+                source.seek(positions[field])
+            data.add_field(field, source, filename=file_name)
+        return data
+
+    def _record(self, success):
+        if self.circuit_breaker is None:
+            return
+        if success:
+            self.circuit_breaker.record_success()
+        else:
+            self.circuit_breaker.record_failure()
+
+    async def annotate_text(self, text, options_dict):
+        """
+        Annotate a string of text, the payload is built exactly as by the synchronous annotate_text
+
+        :param text: text to be annotated
+        :param options_dict: dictionary of options to be used during annotation
+        :return: request response
+        """
+        builder = self.new_request()
+        builder.set_text(text)
+        builder.set_options(options_dict)
+        return await self.execute(builder)
+
+    async def annotate_many(self, texts, options_dict, max_in_flight=None):
+        """
+        Annotate many strings of text concurrently. A fixed number of workers take texts from the input one at a
+        time, so texts are consumed lazily and only max_in_flight requests exist at once. If a request fails the
+        remaining workers are cancelled and the error is raised
+
+        :param texts: iterable of texts to be annotated
+        :param options_dict: dictionary of options to be used during annotation
+        :param max_in_flight: maximum number of requests in flight at once, defaults to max_concurrency
+        :return: list of request responses in input order
+        """
+        indexed_texts = enumerate(texts)
+        results = {}
+
+        async def worker():
+            for idx, text in indexed_texts:
+                results[idx] = await self.annotate_text(text, options_dict)
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(max_in_flight or self.max_concurrency)]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            for task in workers:
+                task.cancel()
+            raise
+        return [results[idx] for idx in range(len(results))]
+
+    async def close(self):
+        """
+        Close the underlying aiohttp session, and its connector unless it was shared in
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        self._get_session()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+class AsyncTermiteClient(_AsyncClient):
+    """
+    Class for sending TERMite requests from asyncio code
+    """
+
+    builder_class = TermiteRequestBuilder
+
+    def _returns_json(self, builder, return_text):
+        return "json" in builder.payload["output"] and not return_text
+
+    def _result(self, parsed):
+        return TermiteResult(parsed)
+
+
+class AsyncTexpressClient(_AsyncClient):
+    """
+    Class for sending TExpress requests from asyncio code
+    """
+
+    builder_class = TexpressRequestBuilder
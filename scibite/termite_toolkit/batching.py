@@ -0,0 +1,264 @@
+"""
+
+  ____       _ ____  _ _         _____ _____ ____  __  __ _ _         _____           _ _    _ _
+ / ___|  ___(_) __ )(_) |_ ___  |_   _| ____|  _ \|  \/  (_) |_ ___  |_   _|__   ___ | | | _(_) |_
+ \___ \ / __| |  _ \| | __/ _ \   | | |  _| | |_) | |\/| | | __/ _ \   | |/ _ \ / _ \| | |/ / | __|
+  ___) | (__| | |_) | | ||  __/   | | | |___|  _ <| |  | | | ||  __/   | | (_) | (_) | |   <| | |_
+ |____/ \___|_|____/|_|\__\___|   |_| |_____|_| \_\_|  |_|_|\__\___|   |_|\___/ \___/|_|_|\_\_|\__|
+
+
+Micro-batching- pack many small texts into single multi-document TERMite requests.
+
+"""
+
+__author__ = 'SciBite DataScience'
+__version__ = '0.2'
+__copyright__ = '(c) 2019, SciBite Ltd'
+__license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
+
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from termite_toolkit.parallel import bounded_map
+from termite_toolkit.session import HttpSession
+from termite_toolkit.termite import TermiteRequestBuilder, TermiteResult
+from termite_toolkit.upload import zip_documents
+
+
+def _doc_index(doc_id):
+    """
+    Helper function. Recover the position of a batched text from the docID TERMite reports for it.
+
+    :param doc_id: docID from the TERMite response
+    :return: integer index, or None if the docID was not produced by batching
+    """
+    name = os.path.basename(str(doc_id).replace('\\', '/'))
+    try:
+        return int(name.split('.')[0])
+    except ValueError:
+        return None
+
+
+def split_batch_response(termite_response, n_texts):
+    """
+    Split a multi-document TERMite response for a batch back into one response per input text, each in the same
+    shape annotate_text would have returned for that text on its own
+
+    :param termite_response: JSON or doc.JSONx response for a batch created by this module
+    :param n_texts: number of texts in the batch
+    :return: list of responses in input order
+    """
+    if isinstance(termite_response, TermiteResult):
+        termite_response = termite_response.raw
+    if isinstance(termite_response, dict):
+        shared = {k: v for k, v in termite_response.items() if k not in ("RESP_MULTIDOC_PAYLOAD", "RESP_PAYLOAD")}
+        payloads = [{} for _ in range(n_texts)]
+        for doc_id, doc_payload in termite_response.get("RESP_MULTIDOC_PAYLOAD", {}).items():
+            idx = _doc_index(doc_id)
+            if idx is not None and idx < n_texts:
+                payloads[idx] = doc_payload
+        if "RESP_PAYLOAD" in termite_response and n_texts == 1:
+            payloads[0] = termite_response["RESP_PAYLOAD"]
+        return [dict(shared, RESP_PAYLOAD=payload) for payload in payloads]
+
+    docs = [[] for _ in range(n_texts)]
+    for doc in termite_response:
+        idx = _doc_index(doc.get('docID', ''))
+        if idx is not None and idx < n_texts:
+            docs[idx].append(doc)
+    return docs
+
+
+def _check_output(options_dict):
+    output = options_dict.get('output', 'json')
+    if output not in ['json', 'doc.json', 'doc.jsonx']:
+        raise ValueError('Batched annotation can only split json, doc.json or doc.jsonx output, not %s' % output)
+
+
+def annotate_batch(url, texts, options_dict, session=None):
+    """
+    Annotate a list of texts in a single multi-document TERMite request
+
+    :param url: url of TERMite instance
+    :param texts: list of texts to be annotated
+    :param options_dict: dictionary of options to be used during annotation
+    :param session: optional HttpSession to send the request over
+    :return: list of responses, one per input text
+    """
+    _check_output(options_dict)
+    texts = list(texts)
+    t = TermiteRequestBuilder()
+    t.set_url(url)
+    t.set_session(session)
+    t.set_input_format('txt')
+    t.set_options(options_dict)
+    t.set_binary_data(zip_documents(texts), 'batch.zip')
+    result = t.execute()
+
+    return split_batch_response(result, len(texts))
+
+
+def _iter_batches(texts, max_docs, max_bytes):
+    """
+    Helper function. Group texts into lists within the document and byte budgets.
+    """
+    batch, batch_bytes = [], 0
+    for text in texts:
+        size = len(text.encode('utf-8'))
+        if batch and (len(batch) >= max_docs or batch_bytes + size > max_bytes):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(text)
+        batch_bytes += size
+    if batch:
+        yield batch
+
+
+def annotate_text_batched(url, texts, options_dict, max_docs=200, max_bytes=1000000, max_workers=4,
+                          session=None):
+    """
+    Annotate many short texts by packing them into multi-document requests of up to max_docs texts or max_bytes of
+    text, sent concurrently. Yields one response per input text, in input order, in the same shape annotate_text
+    would return
+
+    :param url: url of TERMite instance
+    :param texts: iterable of texts to be annotated
+    :param options_dict: dictionary of options to be used during annotation
+    :param max_docs: maximum number of texts per request
+    :param max_bytes: maximum number of bytes of text per request
+    :param max_workers: number of batch requests sent in parallel
+    :param session: optional HttpSession to send the requests over
+    :return: generator of responses
+    """
+    _check_output(options_dict)
+    owns_session = session is None
+    if owns_session:
+        session = HttpSession(pool_maxsize=max_workers)
+
+    def annotate(batch):
+        return annotate_batch(url, batch, options_dict, session=session)
+
+    try:
+        for results in bounded_map(annotate, _iter_batches(texts, max_docs, max_bytes), max_workers=max_workers):
+            for result in results:
+                yield result
+    finally:
+        if owns_session:
+            session.close()
+
+
+class TextBatcher():
+    """
+    Class collecting texts submitted one at a time into multi-document requests. A batch is sent as soon as it
+    reaches max_docs texts or max_bytes of text, or once its oldest text has waited max_latency seconds
+    """
+
+    def __init__(self, url, options_dict, max_docs=200, max_bytes=1000000, max_latency=0.05, max_workers=4,
+                 session=None):
+        """
+        :param url: url of TERMite instance
+        :param options_dict: dictionary of options to be used during annotation
+        :param max_docs: maximum number of texts per request
+        :param max_bytes: maximum number of bytes of text per request
+        :param max_latency: maximum number of seconds a text waits before its batch is sent
+        :param max_workers: number of batch requests sent in parallel
+        :param session: optional HttpSession to send the requests over
+        """
+        _check_output(options_dict)
+        self.url = url
+        self.options_dict = options_dict
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self.max_latency = max_latency
+        self.owns_session = session is None
+        self.session = HttpSession(pool_maxsize=max_workers) if session is None else session
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._condition = threading.Condition()
+        self._texts, self._futures, self._bytes, self._oldest = [], [], 0, None
+        self._closed = False
+        self._flusher = threading.Thread(target=self._run, daemon=True)
+        self._flusher.start()
+
+    def submit(self, text):
+        """
+        Queue a text for annotation
+
+        :param text: text to be annotated
+        :return: concurrent.futures.Future resolving to the response for this text
+        """
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('TextBatcher is closed')
+            size = len(text.encode('utf-8'))
+            # as in _iter_batches, a text that would take the batch over max_bytes starts the next one
+            if self._texts and self._bytes + size > self.max_bytes:
+                self._dispatch()
+            self._texts.append(text)
+            self._futures.append(future)
+            self._bytes += size
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            if len(self._texts) >= self.max_docs or self._bytes >= self.max_bytes:
+                self._dispatch()
+            else:
+                self._condition.notify()
+        return future
+
+    def flush(self):
+        """
+        Send any queued texts now rather than waiting for the batch to fill
+        """
+        with self._condition:
+            self._dispatch()
+
+    def _dispatch(self):
+        # caller must hold the condition
+        if not self._texts:
+            return
+        texts, futures = self._texts, self._futures
+        self._texts, self._futures, self._bytes, self._oldest = [], [], 0, None
+        self._executor.submit(self._send, texts, futures)
+
+    def _send(self, texts, futures):
+        try:
+            results = annotate_batch(self.url, texts, self.options_dict, session=self.session)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+        for future, result in zip(futures, results):
+            future.set_result(result)
+
+    def _run(self):
+        with self._condition:
+            while not self._closed:
+                if self._oldest is None:
+                    self._condition.wait()
+                    continue
+                remaining = self._oldest + self.max_latency - time.monotonic()
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                else:
+                    self._dispatch()
+
+    def close(self):
+        """
+        Send any queued texts, wait for all outstanding batches and release the worker threads
+        """
+        with self._condition:
+            self._dispatch()
+            self._closed = True
+            self._condition.notify()
+        self._flusher.join()
+        self._executor.shutdown(wait=True)
+        if self.owns_session:
+            self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
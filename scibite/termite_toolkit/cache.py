@@ -0,0 +1,290 @@
+"""
+
+  ____       _ ____  _ _         _____ _____ ____  __  __ _ _         _____           _ _    _ _
+ / ___|  ___(_) __ )(_) |_ ___  |_   _| ____|  _ \|  \/  (_) |_ ___  |_   _|__   ___ | | | _(_) |_
+ \___ \ / __| |  _ \| | __/ _ \   | | |  _| | |_) | |\/| | | __/ _ \   | |/ _ \ / _ \| | |/ / | __|
+  ___) | (__| | |_) | | ||  __/   | | | |___|  _ <| |  | | | ||  __/   | | (_) | (_) | |   <| | |_
+ |____/ \___|_|____/|_|\__\___|   |_| |_____|_| \_\_|  |_|_|\__\___|   |_|\___/ \___/|_|_|\_\_|\__|
+
+
+Response caching- a content-addressed on-disk cache for TERMite and TExpress responses, and an in-process LRU cache
+for entity lookups.
+
+"""
+
+__author__ = 'SciBite DataScience'
+__version__ = '0.2'
+__copyright__ = '(c) 2019, SciBite Ltd'
+__license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _normalise_payload(payload):
+    """
+    Helper function. Put a request payload into a canonical form, so that the same request built with its options
+    set in a different order maps to the same cache key.
+
+    :param payload: request builder payload
+    :return: sorted list of (key, value) pairs
+    """
+    normalised = []
+    for key, value in payload.items():
+        value = str(value)
+        if key == 'opts':
+            value = '&'.join(sorted(option for option in value.split('&') if option))
+        elif key == 'entities':
+            value = ','.join(sorted(entity.strip() for entity in value.split(',') if entity.strip()))
+        normalised.append((key, value))
+    return sorted(normalised)
+
+
+def _digest_source(digest, source):
+    """
+    Helper function. Feed the content of a file path, bytes or binary file object into a hash.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        digest.update(source)
+        return
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as file_obj:
+            for chunk in iter(lambda: file_obj.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return
+    position = source.tell()
+    for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+    source.seek(position)
+
+
+def request_key(url, payload, binary_content=None, user=None):
+    """
+    Returns the cache key for a request: a hash of the URL, the user, the normalised payload and the file name and
+    digest of any binary content. Users may be entitled to different vocabularies, so they never share entries
+
+    :param url: URL of the TERMite instance
+    :param payload: request builder payload
+    :param binary_content: request builder binary content
+    :param user: basic authentication username, if any
+    :return: hex digest
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([url, user, _normalise_payload(payload)]).encode('utf-8'))
+    for field, (file_name, source) in sorted((binary_content or {}).items()):
+        digest.update(json.dumps([field, file_name]).encode('utf-8'))
+        _digest_source(digest, source)
+    return digest.hexdigest()
+
+
+class ResponseCache():
+    """
+    Class for an on-disk SQLite cache of response texts, keyed by request_key. Entries expire after ttl seconds and
+    the least recently used entries are evicted once the cache grows beyond max_bytes.
+    Bind to a request builder with set_cache()
+    """
+
+    def __init__(self, path='termite_cache.sqlite', max_bytes=1024 ** 3, ttl=None):
+        """
+        :param path: path to the SQLite database file, created if it does not exist
+        :param max_bytes: maximum total size of cached responses
+        :param ttl: number of seconds an entry stays valid, None for no expiry
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                           'size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+        # the total size is kept up to date by triggers, so it is never summed over the whole table on a write
+        self._conn.execute('CREATE TABLE IF NOT EXISTS cache_size (id INTEGER PRIMARY KEY CHECK (id = 0), '
+                           'total INTEGER NOT NULL)')
+        self._conn.execute('INSERT OR IGNORE INTO cache_size SELECT 0, COALESCE(SUM(size), 0) FROM responses')
+        self._conn.execute('CREATE TRIGGER IF NOT EXISTS responses_insert AFTER INSERT ON responses '
+                           'BEGIN UPDATE cache_size SET total = total + NEW.size; END')
+        self._conn.execute('CREATE TRIGGER IF NOT EXISTS responses_delete AFTER DELETE ON responses '
+                           'BEGIN UPDATE cache_size SET total = total - OLD.size; END')
+        self._conn.commit()
+
+    def key(self, url, payload, binary_content=None, user=None):
+        """
+        Returns the cache key for a request, see request_key
+
+        :return: hex digest
+        """
+        return request_key(url, payload, binary_content, user)
+
+    def _total(self):
+        return self._conn.execute('SELECT total FROM cache_size').fetchone()[0]
+
+    def get(self, key):
+        """
+        Look up a cached response text
+
+        :param key: cache key
+        :return: response text, or None on a miss
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT value, created FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is not None and self.ttl is not None and row[1] + self.ttl < now:
+                self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, value):
+        """
+        Store a response text, evicting the least recently used entries if the cache is over max_bytes
+
+        :param key: cache key
+        :param value: response text
+        """
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            # delete then insert rather than REPLACE, which would not fire the delete trigger
+            self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self._conn.execute('INSERT INTO responses VALUES (?, ?, ?, ?, ?)', (key, value, size, now, now))
+            total = self._total()
+            while total > self.max_bytes:
+                rows = self._conn.execute('SELECT key, size FROM responses WHERE key != ? ORDER BY accessed LIMIT 64',
+                                          (key,)).fetchall()
+                if not rows:
+                    break
+                for old_key, old_size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    self._conn.execute('DELETE FROM responses WHERE key = ?', (old_key,))
+                    total -= old_size
+                    self.evictions += 1
+            self._conn.commit()
+
+    def stats(self):
+        """
+        Returns hit/miss statistics and the current size of the cache
+
+        :return: dictionary of statistics
+        """
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+            size = self._total()
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions, "entries": entries, "bytes": size}
+
+    def clear(self):
+        """
+        Remove every cached response
+        """
+        with self._lock:
+            self._conn.execute('DELETE FROM responses')
+            self._conn.commit()
+
+    def close(self):
+        """
+        Close the underlying database
+        """
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class LRUCache():
+    """
+    Class for a thread-safe, bounded, in-memory least recently used cache with optional expiry.
+    Bind to a UtilitiesRequestBuilder with set_cache()
+    """
+
+    def __init__(self, maxsize=10000, ttl=None):
+        """
+        :param maxsize: maximum number of entries held
+        :param ttl: number of seconds an entry stays valid, None for no expiry
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        """
+        Look up a cached value
+
+        :param key: any hashable key
+        :param default: value returned on a miss
+        :return: cached value, or default on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and entry[1] + self.ttl < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        """
+        Store a value, evicting the least recently used entry if the cache is full
+
+        :param key: any hashable key
+        :param value: value to be cached
+        """
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        """
+        Returns hit/miss statistics and the current size of the cache
+
+        :return: dictionary of statistics
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0,
+                    "evictions": self.evictions, "entries": len(self._entries)}
+
+    def clear(self):
+        """
+        Remove every cached value
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
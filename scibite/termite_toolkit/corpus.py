@@ -0,0 +1,302 @@
+"""
+
+  ____       _ ____  _ _         _____ _____ ____  __  __ _ _         _____           _ _    _ _
+ / ___|  ___(_) __ )(_) |_ ___  |_   _| ____|  _ \|  \/  (_) |_ ___  |_   _|__   ___ | | | _(_) |_
+ \___ \ / __| |  _ \| | __/ _ \   | | |  _| | |_) | |\/| | | __/ _ \   | |/ _ \ / _ \| | |/ / | __|
+  ___) | (__| | |_) | | ||  __/   | | | |___|  _ <| |  | | | ||  __/   | | (_) | (_) | |   <| | |_
+ |____/ \___|_|____/|_|\__\___|   |_| |_____|_| \_\_|  |_|_|\__\___|   |_|\___/ \___/|_|_|\_\_|\__|
+
+
+Corpus preprocessing- run prep.markup and prep.label over whole corpora on a pool of processes, writing shards.
+
+"""
+
+__author__ = 'SciBite DataScience'
+__version__ = '0.2'
+__copyright__ = '(c) 2019, SciBite Ltd'
+__license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
+
+import glob
+import hashlib
+import itertools
+import json
+import os
+import re
+
+from termite_toolkit import prep
+from termite_toolkit.parallel import bounded_map
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+OUTPUT_FORMATS = ['jsonl', 'parquet']
+MANIFEST = '_manifest.json'
+# fingerprint of the documents in each completed shard, one JSON line per shard
+SHARD_LOG = '_shards.jsonl'
+SHARD_PATTERN = re.compile(r'part-\d{5}\.(%s)(\.tmp)?$' % '|'.join(OUTPUT_FORMATS))
+
+
+def iter_documents(paths):
+    """
+    Yields doc.JSONx documents one at a time from files: .jsonl files hold one document per line, other files a
+    doc.JSONx array or a single document
+
+    :param paths: path or list of paths, in the order the documents should be read
+    :return: generator of documents
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            if path.endswith('.jsonl'):
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+                continue
+            docs = json.load(f)
+        if isinstance(docs, dict):
+            docs = [docs]
+        for doc in docs:
+            yield doc
+
+
+def _iter_chunks(docs, chunk_size):
+    docs = iter(docs)
+    while True:
+        chunk = list(itertools.islice(docs, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _shard_path(output_dir, shard_idx, output_format):
+    return os.path.join(output_dir, 'part-%05d.%s' % (shard_idx, output_format))
+
+
+def _read_manifest(output_dir):
+    path = os.path.join(output_dir, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_manifest(output_dir, manifest):
+    tmp_path = os.path.join(output_dir, MANIFEST + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, os.path.join(output_dir, MANIFEST))
+
+
+def _remove_shards(output_dir, keep=()):
+    """
+    Helper function. Delete shards written by this module, and temporary files of interrupted writes, other than those
+    named in keep. Other files in output_dir, e.g. part-0.parquet written by another tool, are left alone.
+    """
+    for path in glob.glob(os.path.join(output_dir, 'part-*')):
+        name = os.path.basename(path)
+        if SHARD_PATTERN.match(name) and name not in keep:
+            os.remove(path)
+
+
+def _fingerprint(docs):
+    return hashlib.sha256(json.dumps(docs, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _read_shard_log(output_dir):
+    """
+    Helper function. Fingerprints of the shards completed so far, by shard name.
+    """
+    fingerprints = {}
+    path = os.path.join(output_dir, SHARD_LOG)
+    if not os.path.exists(path):
+        return fingerprints
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # the last line of an interrupted run may be incomplete
+                continue
+            fingerprints[entry['shard']] = entry['fingerprint']
+    return fingerprints
+
+
+def _write_shard_log(output_dir, fingerprints):
+    tmp_path = os.path.join(output_dir, SHARD_LOG + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for name, fingerprint in fingerprints.items():
+            f.write(json.dumps({'shard': name, 'fingerprint': fingerprint}) + '\n')
+    os.replace(tmp_path, os.path.join(output_dir, SHARD_LOG))
+
+
+def _start_manifest(output_dir, manifest, resume):
+    """
+    Helper function. Record how the corpus is being sharded, refusing to resume shards written with other settings.
+    Without resume any previous output is removed first
+    """
+    manifest = json.loads(json.dumps(manifest))
+    existing = _read_manifest(output_dir)
+    if resume and existing is not None:
+        existing.pop('shards', None)
+        if existing != manifest:
+            raise ValueError('Cannot resume: %s was written with different settings %s' % (output_dir, existing))
+    if not resume:
+        _remove_shards(output_dir)
+        if os.path.exists(os.path.join(output_dir, SHARD_LOG)):
+            os.remove(os.path.join(output_dir, SHARD_LOG))
+    # the shard list is only recorded once the run completes
+    _write_manifest(output_dir, manifest)
+    return manifest
+
+
+def _process_chunk(task):
+    """
+    Helper function. Runs in a worker process: apply markup or label to a chunk of documents and write its shard.
+    """
+    func, start, docs, options, path, output_format, fingerprint = task
+    results = func(docs, **options)
+    rows = []
+    for idx, doc in enumerate(docs):
+        row = {'docIdx': start + idx, 'docID': doc.get('docID')}
+        row.update(results[idx])
+        rows.append(row)
+
+    # write under a temporary name so a shard that exists is always complete
+    tmp_path = path + '.tmp'
+    if output_format == 'parquet':
+        # from_pydict rather than from_pylist, which needs pyarrow 7
+        columns = {key: [row[key] for row in rows] for key in (rows[0] if rows else {})}
+        pq.write_table(pa.Table.from_pydict(columns), tmp_path)
+    else:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(row))
+                f.write('\n')
+    os.replace(tmp_path, path)
+    return os.path.basename(path), fingerprint
+
+
+def _run(func, docs, output_dir, options, chunk_size, output_format, resume, max_workers, max_in_flight):
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError('output_format must be one of %s' % OUTPUT_FORMATS)
+    if output_format == 'parquet' and pa is None:
+        raise ImportError('pyarrow is required for Parquet output, install it with: pip install pyarrow')
+    if chunk_size < 1:
+        raise ValueError('chunk_size must be at least 1')
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = _start_manifest(output_dir, {'function': func.__name__, 'options': options, 'chunk_size': chunk_size,
+                                            'output_format': output_format}, resume)
+
+    paths = []
+    fingerprints = _read_shard_log(output_dir) if resume else {}
+
+    def tasks():
+        for shard_idx, chunk in enumerate(_iter_chunks(docs, chunk_size)):
+            path = _shard_path(output_dir, shard_idx, output_format)
+            paths.append(path)
+            fingerprint = _fingerprint(chunk)
+            # a shard is only kept if it is known to have been written from the same documents
+            if resume and os.path.exists(path) and os.path.basename(path) in fingerprints:
+                if fingerprints[os.path.basename(path)] != fingerprint:
+                    raise ValueError('Cannot resume: the documents of %s have changed since it was written, rerun '
+                                     'with resume=False' % path)
+                continue
+            yield func, shard_idx * chunk_size, chunk, options, path, output_format, fingerprint
+
+    with open(os.path.join(output_dir, SHARD_LOG), 'a', encoding='utf-8') as log:
+        for name, fingerprint in bounded_map(_process_chunk, tasks(), max_workers=max_workers or os.cpu_count() or 1,
+                                             max_in_flight=max_in_flight, processes=True):
+            fingerprints[name] = fingerprint
+            log.write(json.dumps({'shard': name, 'fingerprint': fingerprint}) + '\n')
+            log.flush()
+
+    # a resumed run over a shorter corpus leaves shards beyond its end
+    manifest['shards'] = [os.path.basename(path) for path in paths]
+    _remove_shards(output_dir, keep=manifest['shards'])
+    _write_shard_log(output_dir, {name: fingerprints[name] for name in manifest['shards']})
+    _write_manifest(output_dir, manifest)
+    return paths
+
+
+def markup_corpus(docs, output_dir, chunk_size=1000, output_format='jsonl', resume=False, max_workers=None,
+                  max_in_flight=None, **markup_options):
+    """
+    Run prep.markup over a corpus of doc.JSONx documents on a pool of processes. Documents are read lazily in chunks
+    of chunk_size and each chunk is written to its own shard, part-00000.jsonl, part-00001.jsonl, ... in output_dir.
+    Shard n holds documents n * chunk_size to (n + 1) * chunk_size - 1 in input order, each row carrying its docIdx
+    position in the corpus, its docID and termited_text. Shards are written atomically, so with resume an interrupted
+    run can be restarted on the same input and only the missing shards are processed. A fingerprint of the documents
+    of each shard is recorded, and resuming with documents that differ from those a shard was written from raises
+    ValueError. Without resume, any shards already in output_dir are deleted first
+    Pass vocabs so overlaps are prioritised the same way in every chunk
+
+    :param docs: iterable of doc.JSONx documents, e.g. from iter_documents() or execute(stream=True)
+    :param output_dir: directory the shards are written to
+    :param chunk_size: number of documents per shard
+    :param output_format: 'jsonl' or 'parquet'
+    :param resume: if True keep shards already written from the same documents, otherwise delete existing shards
+    :param max_workers: number of worker processes, defaults to the number of CPUs
+    :param max_in_flight: maximum number of chunks read but not yet written, defaults to twice max_workers
+    :param markup_options: keyword arguments for prep.markup, e.g. vocabs, normalisation or replacementDict
+    :return: list of shard paths in corpus order
+    """
+    return _run(prep.markup, docs, output_dir, markup_options, chunk_size, output_format, resume, max_workers,
+                max_in_flight)
+
+
+def label_corpus(docs, output_dir, vocabs, labelLevel='word', scheme='int', chunk_size=1000, output_format='jsonl',
+                 resume=False, max_workers=None, max_in_flight=None):
+    """
+    Run prep.label over a corpus of doc.JSONx documents on a pool of processes, writing split_text and labels for each
+    document to shards as markup_corpus does
+
+    :param docs: iterable of doc.JSONx documents, e.g. from iter_documents() or execute(stream=True)
+    :param output_dir: directory the shards are written to
+    :param vocabs: list of vocabs to label, ordered by priority
+    :param labelLevel: 'word' or 'char'
+    :param scheme: 'int', 'bio' or 'iob2', see prep.label
+    :param chunk_size: number of documents per shard
+    :param output_format: 'jsonl' or 'parquet'
+    :param resume: if True keep shards already written from the same documents, otherwise delete existing shards
+    :param max_workers: number of worker processes, defaults to the number of CPUs
+    :param max_in_flight: maximum number of chunks read but not yet written, defaults to twice max_workers
+    :return: list of shard paths in corpus order
+    """
+    options = {'vocabs': list(vocabs), 'labelLevel': labelLevel, 'scheme': scheme}
+    return _run(prep.label, docs, output_dir, options, chunk_size, output_format, resume, max_workers,
+                max_in_flight)
+
+
+def read_shards(output_dir):
+    """
+    Yields the rows written by markup_corpus or label_corpus, in corpus order. Only the shards recorded in the
+    manifest are read, or for an unfinished run the shards written so far in the manifest's format
+
+    :param output_dir: directory the shards were written to
+    :return: generator of dictionaries
+    """
+    manifest = _read_manifest(output_dir)
+    if manifest is None:
+        raise ValueError('%s has no %s, it was not written by markup_corpus or label_corpus' % (output_dir, MANIFEST))
+    output_format = manifest['output_format']
+    if 'shards' in manifest:
+        paths = [os.path.join(output_dir, name) for name in manifest['shards']]
+    else:
+        paths = sorted(glob.glob(os.path.join(output_dir, 'part-*.' + output_format)))
+
+    for path in paths:
+        if output_format == 'parquet':
+            if pa is None:
+                raise ImportError('pyarrow is required for Parquet input, install it with: pip install pyarrow')
+            columns = pq.read_table(path).to_pydict()
+            for values in zip(*columns.values()):
+                yield dict(zip(columns, values))
+        else:
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    yield json.loads(line)
@@ -0,0 +1,50 @@
+"""
+
+  ____       _ ____  _ _         _____ _____ ____  __  __ _ _         _____           _ _    _ _
+ / ___|  ___(_) __ )(_) |_ ___  |_   _| ____|  _ \|  \/  (_) |_ ___  |_   _|__   ___ | | | _(_) |_
+ \___ \ / __| |  _ \| | __/ _ \   | | |  _| | |_) | |\/| | | __/ _ \   | |/ _ \ / _ \| | |/ / | __|
+  ___) | (__| | |_) | | ||  __/   | | | |___|  _ <| |  | | | ||  __/   | | (_) | (_) | |   <| | |_
+ |____/ \___|_|____/|_|\__\___|   |_| |_____|_| \_\_|  |_|_|\__\___|   |_|\___/ \___/|_|_|\_\_|\__|
+
+
+Exceptions raised when a TERMite or TExpress request fails.
+
+"""
+
+__author__ = 'SciBite DataScience'
+__version__ = '0.2'
+__copyright__ = '(c) 2019, SciBite Ltd'
+__license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
+
+
+class TermiteError(Exception):
+    """
+    Base class for all errors raised by the toolkit when a request fails
+    """
+
+    def __init__(self, message, url=None):
+        super().__init__(message)
+        self.url = url
+
+
+class TermiteConnectionError(TermiteError):
+    """
+    The server could not be reached, or did not answer in time, after all retries
+    """
+
+
+class TermiteHTTPError(TermiteError):
+    """
+    The server answered with an error status, after all retries for retryable statuses
+    """
+
+    def __init__(self, message, url=None, status_code=None, response=None):
+        super().__init__(message, url=url)
+        self.status_code = status_code
+        self.response = response
+
+
+class CircuitOpenError(TermiteError):
+    """
+    The request was not sent because recent requests to the server kept failing
+    """
@@ -0,0 +1,211 @@
+"""
+
+  ____       _ ____  _ _         _____ _____ ____  __  __ _ _         _____           _ _    _ _
+ / ___|  ___(_) __ )(_) |_ ___  |_   _| ____|  _ \|  \/  (_) |_ ___  |_   _|__   ___ | | | _(_) |_
+ \___ \ / __| |  _ \| | __/ _ \   | | |  _| | |_) | |\/| | | __/ _ \   | |/ _ \ / _ \| | |/ / | __|
+  ___) | (__| | |_) | | ||  __/   | | | |___|  _ <| |  | | | ||  __/   | | (_) | (_) | |   <| | |_
+ |____/ \___|_|____/|_|\__\___|   |_| |_____|_| \_\_|  |_|_|\__\___|   |_|\___/ \___/|_|_|\_\_|\__|
+
+
+Arrow and Parquet export- write TERMite and TExpress hit records without building a DataFrame.
+Requires the optional pyarrow package.
+
+"""
+
+__author__ = 'SciBite DataScience'
+__version__ = '0.2'
+__copyright__ = '(c) 2019, SciBite Ltd'
+__license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
+
+import itertools
+import os
+import shutil
+
+from termite_toolkit.termite import records_to_columns
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+BATCH_SIZE = 65536
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError('pyarrow is required for Arrow and Parquet export, install it with: pip install pyarrow')
+
+
+def termite_schema(cols_to_add=""):
+    """
+    Arrow schema for TERMite hits: the get_termite_dataframe columns with list columns kept as lists and docID and
+    entityType dictionary encoded. Additional columns are stored as strings
+
+    :param cols_to_add: comma separated list of additional fields to include
+    :return: pyarrow.Schema
+    """
+    _require_pyarrow()
+    fields = [pa.field("docID", pa.dictionary(pa.int32(), pa.string())),
+              pa.field("entityType", pa.dictionary(pa.int32(), pa.string())),
+              pa.field("hitID", pa.string()),
+              pa.field("name", pa.string()),
+              pa.field("score", pa.float64()),
+              pa.field("realSynList", pa.list_(pa.string())),
+              pa.field("totnosyns", pa.int64()),
+              pa.field("nonambigsyns", pa.int64()),
+              pa.field("frag_vector_array", pa.list_(pa.string())),
+              pa.field("hitCount", pa.int64())]
+    return pa.schema(fields + _extra_fields(fields, cols_to_add))
+
+
+def texpress_schema(cols_to_add=""):
+    """
+    Arrow schema for TExpress hits: the get_texpress_dataframe columns with matchEntities kept as a list and docID and
+    patternID dictionary encoded. Additional columns are stored as strings
+
+    :param cols_to_add: comma separated list of additional fields to include
+    :return: pyarrow.Schema
+    """
+    _require_pyarrow()
+    fields = [pa.field("docID", pa.dictionary(pa.int32(), pa.string())),
+              pa.field("patternID", pa.dictionary(pa.int32(), pa.string())),
+              pa.field("originalFragment", pa.string()),
+              pa.field("matchEntities", pa.list_(pa.string())),
+              pa.field("originalSentence", pa.string()),
+              pa.field("sentence", pa.string()),
+              pa.field("subsumed", pa.bool_())]
+    return pa.schema(fields + _extra_fields(fields, cols_to_add))
+
+
+def _extra_fields(fields, cols_to_add):
+    if not cols_to_add:
+        return []
+    existing = set(field.name for field in fields)
+    return [pa.field(col, pa.string()) for col in cols_to_add.replace(" ", "").split(",") if col not in existing]
+
+
+def _to_arrow(values, arrow_type):
+    """
+    Helper function. Convert a column of python values to an arrow array of the schema type.
+    """
+    if pa.types.is_dictionary(arrow_type):
+        return pa.array(_as_strings(values), pa.string()).dictionary_encode()
+    if pa.types.is_string(arrow_type):
+        return pa.array(_as_strings(values), arrow_type)
+    if pa.types.is_list(arrow_type) and pa.types.is_string(arrow_type.value_type):
+        return pa.array([None if v is None else _as_strings(v) for v in values], arrow_type)
+    if pa.types.is_boolean(arrow_type):
+        return pa.array([None if v is None else v in (True, 'true', 'True') for v in values], arrow_type)
+    return pa.array(values, arrow_type)
+
+
+def _as_strings(values):
+    return [v if v is None or isinstance(v, str) else str(v) for v in values]
+
+
+def record_batches(records, schema, batch_size=BATCH_SIZE):
+    """
+    Convert hit records into Arrow record batches, consuming the records lazily
+
+    :param records: iterable of hit records, e.g. from termite.iter_payload_records()
+    :param schema: pyarrow.Schema, e.g. from termite_schema() or texpress_schema()
+    :param batch_size: number of records per batch
+    :return: generator of pyarrow.RecordBatch
+    """
+    _require_pyarrow()
+    records = iter(records)
+    cols = schema.names
+    while True:
+        columns, _ = records_to_columns(itertools.islice(records, batch_size), cols)
+        if not columns[cols[0]]:
+            return
+        arrays = [_to_arrow(columns[field.name], field.type) for field in schema]
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def termite_record_batches(records, cols_to_add="", batch_size=BATCH_SIZE):
+    """
+    Convert TERMite hit records into Arrow record batches, see termite_schema
+
+    :param records: iterable of TERMite hit records, e.g. from termite.iter_payload_records()
+    :param cols_to_add: comma separated list of additional fields to include
+    :param batch_size: number of records per batch
+    :return: generator of pyarrow.RecordBatch
+    """
+    return record_batches(records, termite_schema(cols_to_add), batch_size=batch_size)
+
+
+def texpress_record_batches(records, cols_to_add="", batch_size=BATCH_SIZE):
+    """
+    Convert TExpress hit records into Arrow record batches, see texpress_schema
+
+    :param records: iterable of TExpress hit records, e.g. from texpress.texpress_records()
+    :param cols_to_add: comma separated list of additional fields to include
+    :param batch_size: number of records per batch
+    :return: generator of pyarrow.RecordBatch
+    """
+    return record_batches(records, texpress_schema(cols_to_add), batch_size=batch_size)
+
+
+def write_parquet(batches, schema, path, partition_cols=None, compression='snappy', overwrite=False):
+    """
+    Write record batches to Parquet one batch at a time. Without partition_cols a single file is written to path,
+    otherwise a hive-partitioned dataset is written under the path directory. A partitioned write refuses a non-empty
+    directory unless overwrite is True, in which case the whole directory is removed first, so partitions left by an
+    earlier write cannot be read back as part of the new dataset
+
+    :param batches: iterable of pyarrow.RecordBatch
+    :param schema: pyarrow.Schema of the batches
+    :param path: output file, or output directory when partitioning
+    :param partition_cols: optional list of columns to partition by, e.g. ['entityType']
+    :param compression: Parquet compression codec
+    :param overwrite: if True replace an existing partitioned dataset under path
+    """
+    _require_pyarrow()
+    if partition_cols:
+        if os.path.isdir(path) and os.listdir(path):
+            if not overwrite:
+                raise ValueError('%s is not empty, pass overwrite=True to replace it' % path)
+            shutil.rmtree(path)
+        ds.write_dataset(batches, path, schema=schema, format='parquet', partitioning=partition_cols,
+                         partitioning_flavor='hive', existing_data_behavior='overwrite_or_ignore',
+                         file_options=ds.ParquetFileFormat().make_write_options(compression=compression))
+        return
+    with pq.ParquetWriter(path, schema, compression=compression) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+
+
+def write_termite_parquet(records, path, cols_to_add="", partition_cols=None, batch_size=BATCH_SIZE, overwrite=False):
+    """
+    Write TERMite hit records to Parquet incrementally, so a corpus-wide hit table never has to fit in memory
+
+    :param records: iterable of TERMite hit records, e.g. from termite.iter_payload_records()
+    :param path: output file, or output directory when partitioning
+    :param cols_to_add: comma separated list of additional fields to include
+    :param partition_cols: optional list of columns to partition by, e.g. ['entityType']
+    :param batch_size: number of records per batch
+    :param overwrite: if True replace an existing partitioned dataset under path
+    """
+    schema = termite_schema(cols_to_add)
+    write_parquet(record_batches(records, schema, batch_size=batch_size), schema, path, partition_cols=partition_cols,
+                  overwrite=overwrite)
+
+
+def write_texpress_parquet(records, path, cols_to_add="", partition_cols=None, batch_size=BATCH_SIZE,
+                           overwrite=False):
+    """
+    Write TExpress hit records to Parquet incrementally, so a corpus-wide hit table never has to fit in memory
+
+    :param records: iterable of TExpress hit records, e.g. from texpress.texpress_records()
+    :param path: output file, or output directory when partitioning
+    :param cols_to_add: comma separated list of additional fields to include
+    :param partition_cols: optional list of columns to partition by, e.g. ['patternID']
+    :param batch_size: number of records per batch
+    :param overwrite: if True replace an existing partitioned dataset under path
+    """
+    schema = texpress_schema(cols_to_add)
+    write_parquet(record_batches(records, schema, batch_size=batch_size), schema, path, partition_cols=partition_cols,
+                  overwrite=overwrite)
@@ -0,0 +1,74 @@
+"""
+
+  ____       _ ____  _ _         _____ _____ ____  __  __ _ _         _____           _ _    _ _
+ / ___|  ___(_) __ )(_) |_ ___  |_   _| ____|  _ \|  \/  (_) |_ ___  |_   _|__   ___ | | | _(_) |_
+ \___ \ / __| |  _ \| | __/ _ \   | | |  _| | |_) | |\/| | | __/ _ \   | |/ _ \ / _ \| | |/ / | __|
+  ___) | (__| | |_) | | ||  __/   | | | |___|  _ <| |  | | | ||  __/   | | (_) | (_) | |   <| | |_
+ |____/ \___|_|____/|_|\__\___|   |_| |_____|_| \_\_|  |_|_|\__\___|   |_|\___/ \___/|_|_|\_\_|\__|
+
+
+Concurrency helpers- bounded fan-out of blocking calls over a thread pool.
+
+"""
+
+__author__ = 'SciBite DataScience'
+__version__ = '0.2'
+__copyright__ = '(c) 2019, SciBite Ltd'
+__license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+def bounded_map(func, iterable, max_workers=4, max_in_flight=None, ordered=True, processes=False):
+    """
+    Apply func to every item of iterable over a pool of worker threads, or of worker processes if processes is True,
+    never holding more than max_in_flight submitted items. The input is consumed lazily, so memory stays flat however
+    long the iterable is.
+
+    Threads suit I/O-bound work such as TERMite requests. CPU-bound work such as post-processing responses should
+    use processes, which are not held back by the GIL. Each item is then pickled to a worker process and each result
+    pickled back, so func must be picklable (a module level function, not a lambda or closure) and so must the items
+    and results. Generators, open files and sessions cannot be sent to a process.
+
+    :param func: callable applied to each item, picklable if processes is True
+    :param iterable: any iterable, including generators. The iterable itself stays in the calling process, only its
+    items are sent to the workers
+    :param max_workers: number of worker threads or processes
+    :param max_in_flight: maximum number of items submitted but not yet yielded, defaults to twice max_workers
+    :param ordered: if True yield results in input order, otherwise yield (index, result) tuples as they complete
+    :param processes: if True use a ProcessPoolExecutor rather than a ThreadPoolExecutor
+    :return: generator of results
+    """
+    if max_in_flight is None:
+        max_in_flight = 2 * max_workers
+    if max_workers < 1 or max_in_flight < 1:
+        raise ValueError('max_workers and max_in_flight must be at least 1')
+
+    items = enumerate(iterable)
+    executor_class = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executor_class(max_workers=max_workers) as executor:
+        if ordered:
+            pending = deque()
+            for idx, item in items:
+                pending.append(executor.submit(func, item))
+                if len(pending) >= max_in_flight:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        else:
+            pending = {}
+            exhausted = False
+            while True:
+                while not exhausted and len(pending) < max_in_flight:
+                    try:
+                        idx, item = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending[executor.submit(func, item)] = idx
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future.result()
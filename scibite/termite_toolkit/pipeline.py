@@ -0,0 +1,197 @@
+"""
+
+  ____       _ ____  _ _         _____ _____ ____  __  __ _ _         _____           _ _    _ _
+ / ___|  ___(_) __ )(_) |_ ___  |_   _| ____|  _ \|  \/  (_) |_ ___  |_   _|__   ___ | | | _(_) |_
+ \___ \ / __| |  _ \| | __/ _ \   | | |  _| | |_) | |\/| | | __/ _ \   | |/ _ \ / _ \| | |/ / | __|
+  ___) | (__| | |_) | | ||  __/   | | | |___|  _ <| |  | | | ||  __/   | | (_) | (_) | |   <| | |_
+ |____/ \___|_|____/|_|\__\___|   |_| |_____|_| \_\_|  |_|_|\__\___|   |_|\___/ \___/|_|_|\_\_|\__|
+
+
+Post-processing pipeline- decode, filter and tabulate TERMite and TExpress responses over a pool of processes.
+
+"""
+
+__author__ = 'SciBite DataScience'
+__version__ = '0.2'
+__copyright__ = '(c) 2019, SciBite Ltd'
+__license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
+
+import json
+import os
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from termite_toolkit.parallel import bounded_map
+from termite_toolkit.termite import TERMITE_DATAFRAME_COLUMNS, columns_to_dataframe, iter_payload_records, \
+    records_to_columns
+from termite_toolkit.texpress import TEXPRESS_DATAFRAME_COLUMNS, texpress_records
+
+
+def _columns(default_cols, cols_to_add):
+    """
+    Helper function. Returns the output columns, the columns the workers extract and the columns asked for in
+    cols_to_add. Each field is extracted once, a default column also asked for in cols_to_add is repeated in the output
+    as in get_termite_dataframe
+    """
+    cols = list(default_cols)
+    extra_cols = []
+    if cols_to_add:
+        extra_cols = cols_to_add.replace(" ", "").split(",")
+        cols = cols + extra_cols
+    return cols, list(dict.fromkeys(cols)), extra_cols
+
+
+def _select(df, cols):
+    if len(df.columns) < len(cols):
+        df = df[cols]
+    return df
+
+
+def _batch(df, found, cols, extra_cols):
+    """
+    Helper function. Selects the output columns of one response, or returns None as get_termite_dataframe does if a
+    column in cols_to_add is not a field of its hits
+    """
+    missing = [col for col in extra_cols if col not in found]
+    if missing and len(df):
+        print("Invalid column selection.", KeyError(missing))
+        return None
+    return _select(df, cols)
+
+
+def _process_termite(task):
+    """
+    Helper function. Runs in a worker process: decode one raw TERMite response and return its hits as a dataframe.
+    """
+    payload, cols, reject_ambig, score_cutoff, remove_subsumed = task
+    records = iter_payload_records(json.loads(payload), reject_ambig=reject_ambig, score_cutoff=score_cutoff,
+                                   remove_subsumed=remove_subsumed)
+    columns, found = records_to_columns(records, cols)
+    return columns_to_dataframe(columns, cols), found
+
+
+def _process_texpress(task):
+    """
+    Helper function. Runs in a worker process: decode one raw TExpress response and return its hits as a dataframe.
+    """
+    payload, cols, remove_subsumed = task
+    records = texpress_records(json.loads(payload), remove_subsumed=remove_subsumed)
+    columns, found = records_to_columns(records, cols)
+    return columns_to_dataframe(columns, cols), found
+
+
+def _map_termite(payloads, cols, reject_ambig, score_cutoff, remove_subsumed, max_workers, max_in_flight):
+    tasks = ((payload, cols, reject_ambig, score_cutoff, remove_subsumed) for payload in payloads)
+    return bounded_map(_process_termite, tasks, max_workers=max_workers or os.cpu_count() or 1,
+                       max_in_flight=max_in_flight, processes=True)
+
+
+def _map_texpress(payloads, cols, remove_subsumed, max_workers, max_in_flight):
+    tasks = ((payload, cols, remove_subsumed) for payload in payloads)
+    return bounded_map(_process_texpress, tasks, max_workers=max_workers or os.cpu_count() or 1,
+                       max_in_flight=max_in_flight, processes=True)
+
+
+def iter_termite_batches(payloads, cols_to_add="", reject_ambig=True, score_cutoff=0, remove_subsumed=True,
+                         max_workers=None, max_in_flight=None):
+    """
+    Decode, filter and tabulate raw TERMite responses in a pool of worker processes, so post-processing uses every
+    core rather than being held to one by the GIL. Each response comes back from its worker as a dataframe with the
+    get_termite_dataframe columns, which is much cheaper to send between processes than a list of hit dictionaries
+
+    :param payloads: iterable of raw JSON or doc.JSONx responses as bytes or str, e.g. from execute(return_text=True)
+    :param cols_to_add: comma separated list of additional fields to include
+    :param reject_ambig: boolean
+    :param score_cutoff: a numerical value between 1-5
+    :param remove_subsumed: boolean
+    :param max_workers: number of worker processes, defaults to the number of CPUs
+    :param max_in_flight: maximum number of responses handed to the pool but not yet yielded
+    :return: generator of dataframes in input order, one per response, None for a response without a cols_to_add field
+    """
+    cols, unique_cols, extra_cols = _columns(TERMITE_DATAFRAME_COLUMNS, cols_to_add)
+    for df, found in _map_termite(payloads, unique_cols, reject_ambig, score_cutoff, remove_subsumed, max_workers,
+                                  max_in_flight):
+        yield _batch(df, found, cols, extra_cols)
+
+
+def iter_texpress_batches(payloads, cols_to_add="", remove_subsumed=True, max_workers=None, max_in_flight=None):
+    """
+    Decode, filter and tabulate raw TExpress responses in a pool of worker processes, see iter_termite_batches
+
+    :param payloads: iterable of raw JSON or doc.JSONx responses as bytes or str, e.g. from execute(return_text=True)
+    :param cols_to_add: comma separated list of additional fields to include
+    :param remove_subsumed: boolean
+    :param max_workers: number of worker processes, defaults to the number of CPUs
+    :param max_in_flight: maximum number of responses handed to the pool but not yet yielded
+    :return: generator of dataframes in input order, one per response, None for a response without a cols_to_add field
+    """
+    cols, unique_cols, extra_cols = _columns(TEXPRESS_DATAFRAME_COLUMNS, cols_to_add)
+    for df, found in _map_texpress(payloads, unique_cols, remove_subsumed, max_workers, max_in_flight):
+        yield _batch(df, found, cols, extra_cols)
+
+
+def concat_batches(batches, cols):
+    """
+    Concatenate hit dataframes, keeping columns that are categorical in every batch categorical
+
+    :param batches: list of dataframes with the same columns
+    :param cols: column order
+    :return: pandas dataframe
+    """
+    batches = [batch for batch in batches if len(batch)]
+    if not batches:
+        return pd.DataFrame(columns=cols)
+    df = pd.concat(batches, ignore_index=True)
+    for col in cols:
+        if all(isinstance(batch[col].dtype, pd.CategoricalDtype) for batch in batches):
+            df[col] = union_categoricals([batch[col] for batch in batches])
+    return df
+
+
+def _collect(batches, cols, unique_cols, extra_cols):
+    frames, found = [], set()
+    for df, batch_found in batches:
+        frames.append(df)
+        found.update(batch_found)
+    missing = [col for col in extra_cols if col not in found]
+    if missing and any(len(df) for df in frames):
+        print("Invalid column selection.", KeyError(missing))
+        return None
+    return _select(concat_batches(frames, unique_cols), cols)
+
+
+def termite_dataframe(payloads, cols_to_add="", reject_ambig=True, score_cutoff=0, remove_subsumed=True,
+                      max_workers=None, max_in_flight=None):
+    """
+    Multi-process equivalent of get_termite_dataframe over many raw TERMite responses, see iter_termite_batches
+
+    :param payloads: iterable of raw JSON or doc.JSONx responses as bytes or str, e.g. from execute(return_text=True)
+    :param cols_to_add: comma separated list of additional fields to include
+    :param reject_ambig: boolean
+    :param score_cutoff: a numerical value between 1-5
+    :param remove_subsumed: boolean
+    :param max_workers: number of worker processes, defaults to the number of CPUs
+    :param max_in_flight: maximum number of responses handed to the pool but not yet collected
+    :return: dataframe of TERMite hits
+    """
+    cols, unique_cols, extra_cols = _columns(TERMITE_DATAFRAME_COLUMNS, cols_to_add)
+    batches = _map_termite(payloads, unique_cols, reject_ambig, score_cutoff, remove_subsumed, max_workers,
+                           max_in_flight)
+    return _collect(batches, cols, unique_cols, extra_cols)
+
+
+def texpress_dataframe(payloads, cols_to_add="", remove_subsumed=True, max_workers=None, max_in_flight=None):
+    """
+    Multi-process equivalent of get_texpress_dataframe over many raw TExpress responses, see iter_texpress_batches
+
+    :param payloads: iterable of raw JSON or doc.JSONx responses as bytes or str, e.g. from execute(return_text=True)
+    :param cols_to_add: comma separated list of additional fields to include
+    :param remove_subsumed: boolean
+    :param max_workers: number of worker processes, defaults to the number of CPUs
+    :param max_in_flight: maximum number of responses handed to the pool but not yet collected
+    :return: dataframe of TExpress hits
+    """
+    cols, unique_cols, extra_cols = _columns(TEXPRESS_DATAFRAME_COLUMNS, cols_to_add)
+    batches = _map_texpress(payloads, unique_cols, remove_subsumed, max_workers, max_in_flight)
+    return _collect(batches, cols, unique_cols, extra_cols)
@@ -14,21 +14,37 @@ __version__ = '0.2'
 __copyright__ = '(c) 2019, SciBite Ltd'
 __license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
 
+import termite_toolkit.batching as batching
 import termite_toolkit.termite as termite
 import json
+import re
+from bisect import bisect_left, bisect_right
+from collections import deque
+from operator import itemgetter
+
+import numpy as np
 
 
 def get_hits(termiteTags, hierarchy=None, vocabs=None):
     '''
     Helper function. Uses termiteTags and hierarchy to collect info on the highest priority hits.
+    Overlaps are resolved by taking hits in order of priority (position in the hierarchy, then the longest hit, then the
+    earliest) and keeping each one that does not overlap a hit already kept. Kept hits never overlap, so only the kept
+    hit with the last start before a candidate ends can overlap it; that hit is found in a Fenwick tree over the
+    distinct start locations, which takes O(log n) per lookup and per kept hit, so a document with n hits takes
+    O(n log n) overall. Subsumed hits come last, so they are only kept where they do not overlap another hit.
+    Hit locations are half-open, [startLoc, endLoc), so adjacent hits do not conflict.
 
     :param array termiteTags: Locations of TERMite hits found, extracted from the TERMite json
     :param dict hierarchy: Dictionary with a hierarchy of vocabs to prioritise in case of overlap
     :param array(str) vocabs: List of vocabs to be substituted, ordered by priority. These vocabs MUST be in the TERMite results. If left
     empty, all vocabs found will be used with random priority where overlaps are found.
-    :return array(dict):
+    :return array(dict): non-overlapping hits, ordered by startLoc
     '''
-    hits = []
+    if hierarchy is None:
+        hierarchy = {}
+
+    candidates = []
     for hit in termiteTags:
         if not vocabs:
             if hit['entityType'] not in hierarchy:
@@ -40,37 +56,85 @@ def get_hits(termiteTags, hierarchy=None, vocabs=None):
         hitLocs, subsumeStates = hit['exact_array'], hit['subsume']
         assert len(hitLocs) == len(subsumeStates)
 
-        for idx, hitLoc in enumerate(hitLocs):
+        for hitLoc, subsumed in zip(hitLocs, subsumeStates):
             if hitLoc['fls'][0] < 1:
                 continue
             hitInfo = {}
             hitInfo['entityType'], hitInfo['entityID'], hitInfo['entityName'] = hit['entityType'], hit['hitID'], hit[
                 'name']
-            breakBool = False
             hitInfo['startLoc'], hitInfo['endLoc'] = hitLoc['fls'][1], hitLoc['fls'][2]
-            if subsumeStates[idx] == False:  # If hit is not subsumed...
-                for hitIdx, hit_ in enumerate(hits):
-                    # Compare to already found hits to check there's no conflict
-                    if ((hit_['endLoc'] >= hitInfo['startLoc'] and hit_['endLoc'] <= hitInfo['endLoc']) or
-                            (hit_['startLoc'] >= hitInfo['startLoc'] and hit_['startLoc'] <= hitInfo['endLoc'])):
-                        # If they overlap, check their position in the hierarchy
-                        if hierarchy[hit_['entityType']] >= hierarchy[hitInfo['entityType']]:
-                            del hits[hitIdx]
-                            break
-                        else:
-                            breakBool = True
-                            break
-            if not breakBool:
-                hits.append(hitInfo)
+            priority = (subsumed is True, hierarchy[hit['entityType']], hitInfo['startLoc'] - hitInfo['endLoc'],
+                        hitInfo['startLoc'])
+            candidates.append((priority, hitInfo))
+    candidates.sort(key=itemgetter(0))
+
+    # Fenwick tree counting the kept hits at each distinct start location, with the furthest end kept at each start
+    startLocs = sorted(set(hitInfo['startLoc'] for priority, hitInfo in candidates))
+    rank = {start: idx + 1 for idx, start in enumerate(startLocs)}
+    size = len(startLocs)
+    tree = [0] * (size + 1)
+    furthestEnd = [None] * (size + 1)
+    topStep = 1 << (size.bit_length() - 1) if size else 0
+
+    hits = []
+    for priority, hitInfo in candidates:
+        start, end = hitInfo['startLoc'], hitInfo['endLoc']
+        # number of kept hits starting before this one ends
+        idx, kept = bisect_left(startLocs, end), 0
+        while idx > 0:
+            kept += tree[idx]
+            idx &= idx - 1
+        if kept:
+            # descend the tree to the start location of the last of them, which is the only one that can overlap
+            pos, step = 0, topStep
+            while step:
+                if pos + step <= size and tree[pos + step] < kept:
+                    pos += step
+                    kept -= tree[pos]
+                step >>= 1
+            if furthestEnd[pos + 1] > start:
+                continue
+
+        idx = rank[start]
+        if furthestEnd[idx] is None:
+            furthestEnd[idx] = end
+            while idx <= size:
+                tree[idx] += 1
+                idx += idx & -idx
+        else:
+            furthestEnd[idx] = max(furthestEnd[idx], end)
+        hits.append(hitInfo)
+
+    hits.sort(key=itemgetter('startLoc', 'endLoc'))
     return hits
 
 
+NORMALISATION_TEMPLATES = {'id': '%(entityType)s_%(entityID)s',
+                           'type': '%(entityType)s',
+                           'name': '%(entityName)s',
+                           'typeplusname': '%(entityType)s %(entityName)s',
+                           'typeplusid': '%(entityType)s %(entityType)s_%(entityID)s'}
+TEMPLATE_FIELDS = {'~TYPE~': '%(entityType)s', '~ID~': '%(entityID)s', '~NAME~': '%(entityName)s'}
+TEMPLATE_PATTERN = re.compile('|'.join(TEMPLATE_FIELDS))
+
+
+def _compile_template(replacement):
+    '''
+    Helper function. Turns a replacementDict string, e.g. 'ENTITY_~TYPE~_~ID~', into a %-format string filled from a hit.
+
+    :param str replacement: string with ~TYPE~, ~ID~ and ~NAME~ placeholders
+    :return str:
+    '''
+    return TEMPLATE_PATTERN.sub(lambda match: TEMPLATE_FIELDS[match.group(0)], replacement.replace('%', '%%'))
+
+
 def markup(docjsonx, normalisation='id', substitute=True, wrap=False,
            wrapChars=('{!', '!}'), vocabs=None, labels=None, replacementDict=None):
     '''
     Receives TERMite docjsonx output. Processes the original text, normalising identified hits.
 
-    :param str docjsonx: JSON string generated by TERMite. Must be docjsonx.
+    :param str docjsonx: JSON string generated by TERMite. Must be docjsonx. Parsed docjsonx, or the documents streamed by
+    execute(stream=True), are also accepted.
     :param str normalisation: Type of normalisation to substitute/add (must be 'id', 'type', 'name', 'typeplusname' or 'typeplusid')
     :param bool substitute: Whether to replace the found term (or add normalisation alongside)
     :param bool wrap: Whether to wrap found hits with 'bookends'
@@ -100,6 +164,18 @@ def markup(docjsonx, normalisation='id', substitute=True, wrap=False,
         for idx, vocab in enumerate(vocabs):
             hierarchy[vocab] = idx
 
+    # substitution templates are compiled once, into %-format strings filled from each hit
+    if replacementDict:
+        templates = {vocab: _compile_template(replacement) for vocab, replacement in replacementDict.items()}
+    else:
+        template = NORMALISATION_TEMPLATES[normalisation]
+
+    if wrap:
+        prefix = wrapChars[0]
+        postfix = wrapChars[1]
+    else:
+        prefix, postfix = '', ''
+
     if isinstance(docjsonx, str):
         j = json.loads(docjsonx)
     else:
@@ -114,42 +190,22 @@ def markup(docjsonx, normalisation='id', substitute=True, wrap=False,
             results[docIdx] = {'termited_text': text}
             continue
 
-        if len(substitutions) > 0:
-            substitutions.sort(key=lambda x: x['startLoc'])
-            substitutions = reversed(substitutions)
-
-        if wrap:
-            prefix = wrapChars[0]
-            postfix = wrapChars[1]
-        else:
-            prefix, postfix = '', ''
-
+        # one forward pass over the text, hits from get_hits are ordered and do not overlap
+        pieces = []
+        cursor = 0
         for sub in substitutions:
-            subText = ''
+            start, end = sub['startLoc'], sub['endLoc']
             if replacementDict:
-                subText = replacementDict[sub['entityType']].replace(
-                    '~TYPE~', sub['entityType']).replace('~ID~', sub['entityID']).replace('~NAME~', sub['entityName'])
-            elif normalisation == 'id':
-                subText = '_'.join([sub['entityType'], sub['entityID']])
+                subText = templates[sub['entityType']] % sub
+            else:
+                subText = template % sub
                 if not substitute:
-                    subText += ' %s' % text[sub['startLoc']:sub['endLoc']]
-            elif normalisation == 'type':
-                subText = sub['entityType']
-                if not substitute:
-                    subText += ' %s' % text[sub['startLoc']:sub['endLoc']]
-            elif normalisation == 'name':
-                subText = sub['entityName']
-                if not substitute:
-                    subText += ' %s' % text[sub['startLoc']:sub['endLoc']]
-            elif normalisation == 'typeplusname':
-                subText = '%s %s' % (sub['entityType'], sub['entityName'])
-                if not substitute:
-                    subText += ' %s' % text[sub['startLoc']:sub['endLoc']]
-            elif normalisation == 'typeplusid':
-                subText = '%s %s' % (sub['entityType'], '_'.join([sub['entityType'], sub['entityID']]))
-                if not substitute:
-                    subText += ' %s' % text[sub['startLoc']:sub['endLoc']]
-            text = text[:sub['startLoc']] + prefix + subText + postfix + text[sub['endLoc']:]
+                    subText += ' %s' % text[start:end]
+            pieces.append(text[cursor:start])
+            pieces.append(prefix + subText + postfix)
+            cursor = end
+        pieces.append(text[cursor:])
+        text = ''.join(pieces)
 
         results[docIdx] = {'termited_text': text}
 
@@ -186,22 +242,97 @@ def text_markup(text, termiteAddr='http://localhost:9090/termite', vocabs=['GENE
                   wrapChars=wrapChars, substitute=substitute, replacementDict=replacementDict)[0]['termited_text']
 
 
-def label(docjsonx, vocabs, labelLevel='word'):
+def text_markup_many(texts, termiteAddr='http://localhost:9090/termite', vocabs=['GENE', 'INDICATION', 'DRUG'],
+                     normalisation='id', wrap=False, wrapChars=('{!', '!}'), substitute=True, replacementDict=None,
+                     max_docs=200, max_bytes=1000000, max_workers=4, session=None):
+    '''
+    Receives many plain texts, returns each with TERMited substitutions as text_markup would. The texts are packed into
+    multi-document requests sent concurrently over a pooled session, rather than one request per text.
+
+    :param iterable(str) texts: Texts to be marked up
+    :param str termiteAddr: URL of the TERMite instance
+    :param array(str) vocabs: List of vocabs to be substituted, ordered by priority, see text_markup
+    :param str normalisation: Type of normalisation to substitute/add, see text_markup
+    :param bool wrap: Whether to wrap found hits with 'bookends'
+    :param tuple(str) wrapChars: Tuple of length 2, containing strings to insert at start/end of found hits
+    :param bool substitute: Whether to replace the found term (or add normalisation alongside)
+    :param dict replacementDict: Dictionary with <VOCAB>:<string_to_replace_hits_in_vocab>, see text_markup
+    :param int max_docs: Maximum number of texts per request
+    :param int max_bytes: Maximum number of bytes of text per request
+    :param int max_workers: Number of requests sent in parallel
+    :param HttpSession session: Optional session to send the requests over
+    :return generator(str): Marked up texts, in input order
+    '''
+    options = {'entities': ','.join(vocabs), 'subsume': 'true', 'output': 'doc.jsonx'}
+    # texts are held until their response arrives, so a text without hits is returned unchanged
+    pending = deque()
+
+    def submit(texts):
+        for text in texts:
+            pending.append(text)
+            yield text
+
+    for docjsonx in batching.annotate_text_batched(termiteAddr, submit(texts), options, max_docs=max_docs,
+                                                   max_bytes=max_bytes, max_workers=max_workers, session=session):
+        text = pending.popleft()
+        if not docjsonx:
+            yield text
+            continue
+        yield markup(list(docjsonx), vocabs=vocabs, normalisation=normalisation, wrap=wrap, wrapChars=wrapChars,
+                     substitute=substitute, replacementDict=replacementDict)[0]['termited_text']
+
+
+TOKEN_PATTERN = re.compile(r'\S+')
+LABEL_SCHEMES = ['int', 'bio', 'iob2']
+
+
+def tokenise(text, labelLevel='word'):
+    '''
+    Helper function. Splits text into whitespace separated words, or characters, along with their character offsets.
+
+    :param str text: text to be split
+    :param str labelLevel: 'word' or 'char'
+    :return tuple: list of tokens, list of token start offsets, list of token end offsets
+    '''
+    if labelLevel == 'char':
+        return list(text), range(len(text)), range(1, len(text) + 1)
+    tokens, starts, ends = [], [], []
+    for match in TOKEN_PATTERN.finditer(text):
+        tokens.append(match.group())
+        starts.append(match.start())
+        ends.append(match.end())
+    return tokens, starts, ends
+
+
+def label(docjsonx, vocabs, labelLevel='word', scheme='int', as_numpy=False):
     '''
     Receives TERMite output docjsonx and returns split text with labels as to what entities are found in that part of the text.
+    Each hit is mapped to the tokens it overlaps by binary search over the tokens' character offsets, so text with
+    newlines or repeated spaces is labelled correctly and a document is labelled in O((words + hits) log words).
 
-    :param str docjsonx: JSON string generated by TERMite. Must be docjsonx.
+    :param str docjsonx: JSON string generated by TERMite. Must be docjsonx. Parsed docjsonx, or the documents streamed by
+    execute(stream=True), are also accepted.
     :param str labelLevel: Labels for where hits are found in the text. Must be 'char' or 'word', word by default
     :param array(str) vocabs: List of vocabs to be substituted, ordered by priority. These vocabs MUST be in the TERMite results. If left
     empty, all vocabs found will be used with random priority where overlaps are found.
+    :param str scheme: 'int' labels tokens with the position of their vocab in vocabs plus one, 0 outside hits. 'bio' (or
+    its synonym 'iob2') labels them with 'B-<VOCAB>' on the first token of a hit, 'I-<VOCAB>' on the rest and 'O' outside hits
+    :param bool as_numpy: Whether to return the labels as a NumPy array rather than a list
     :return dict:
     '''
+    if labelLevel not in ['word', 'char']:
+        raise ValueError('labelLevel must be either \'word\' or \'char\'')
+    if scheme not in LABEL_SCHEMES:
+        raise ValueError('scheme must be one of \'int\', \'bio\' or \'iob2\'')
+    tagged = scheme != 'int'
 
     results = {}
-    substitutions = []
     hierarchy = {}
     for idx, vocab in enumerate(vocabs):
         hierarchy[vocab] = idx
+    if tagged and as_numpy:
+        # integer codes index into the tag names: 0 is 'O', then B- and I- for each vocab in turn
+        tag_names = np.array(['O'] + ['%s-%s' % (prefix, vocab) for vocab in vocabs for prefix in ('B', 'I')])
 
     if isinstance(docjsonx, str):
         j = json.loads(docjsonx)
@@ -210,31 +341,40 @@ def label(docjsonx, vocabs, labelLevel='word'):
 
     for docIdx, doc in enumerate(j):
         text = doc['body']
+        splitText, starts, ends = tokenise(text, labelLevel)
 
-        splitText, labels = None, None
-        if labelLevel == 'word':
-            splitText = text.split()
-        elif labelLevel == 'char':
-            splitText = list(text)
-        labels = [0 for i in splitText]
+        if as_numpy:
+            labels = np.zeros(len(splitText), dtype=np.int32)
+        elif tagged:
+            labels = ['O'] * len(splitText)
+        else:
+            labels = [0] * len(splitText)
 
         try:
             hits = get_hits(doc['termiteTags'], hierarchy=hierarchy, vocabs=vocabs)
         except KeyError:
-            results[docIdx] = {'split_text': splitText, 'labels': labels}
-            continue
+            hits = []
 
         for hit in hits:
-            if labelLevel == 'char':
-                for i in range(hit['startLoc'], hit['endLoc']):
-                    labels[i] = hierarchy[hit['entityType']] + 1
-            elif labelLevel == 'word':
-                cursor = 0
-                for wIdx, w in enumerate(splitText):
-                    if cursor >= hit['startLoc'] and cursor <= hit['endLoc']:
-                        labels[wIdx] = hierarchy[hit['entityType']] + 1
-                    cursor += len(w) + 1
-
+            # tokens ending after the hit starts, up to the first token starting at or after its end
+            first = bisect_right(ends, hit['startLoc'])
+            last = bisect_left(starts, hit['endLoc'], first)
+            if first >= last:
+                continue
+            rank = hierarchy[hit['entityType']]
+            if as_numpy and tagged:
+                labels[first] = 2 * rank + 1
+                labels[first + 1:last] = 2 * rank + 2
+            elif as_numpy:
+                labels[first:last] = rank + 1
+            elif tagged:
+                labels[first] = 'B-' + hit['entityType']
+                labels[first + 1:last] = ['I-' + hit['entityType']] * (last - first - 1)
+            else:
+                labels[first:last] = [rank + 1] * (last - first)
+
+        if tagged and as_numpy:
+            labels = tag_names[labels]
         results[docIdx] = {'split_text': splitText, 'labels': labels}
 
     return results
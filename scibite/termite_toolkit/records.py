@@ -0,0 +1,67 @@
+"""
+
+  ____       _ ____  _ _         _____ _____ ____  __  __ _ _         _____           _ _    _ _
+ / ___|  ___(_) __ )(_) |_ ___  |_   _| ____|  _ \|  \/  (_) |_ ___  |_   _|__   ___ | | | _(_) |_
+ \___ \ / __| |  _ \| | __/ _ \   | | |  _| | |_) | |\/| | | __/ _ \   | |/ _ \ / _ \| | |/ / | __|
+  ___) | (__| | |_) | | ||  __/   | | | |___|  _ <| |  | | | ||  __/   | | (_) | (_) | |   <| | |_
+ |____/ \___|_|____/|_|\__\___|   |_| |_____|_| \_\_|  |_|_|\__\___|   |_|\___/ \___/|_|_|\_\_|\__|
+
+
+RecordView- read-only hit records that point into the parsed response instead of copying it.
+
+"""
+
+__author__ = 'SciBite DataScience'
+__version__ = '0.2'
+__copyright__ = '(c) 2019, SciBite Ltd'
+__license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
+
+from collections.abc import Mapping
+
+
+class RecordView(Mapping):
+    """
+    Class presenting several dictionaries of a response, e.g. an entity hit and the document it was found in, as a
+    single read-only record. Lookups go through the layers in order so earlier layers take precedence, keys in exclude
+    are hidden. Nothing is copied, so a view costs the same small amount of memory however large the document is,
+    and the response is left untouched. Use dict(view) for an independent copy
+    """
+
+    __slots__ = ('_layers', '_exclude')
+
+    def __init__(self, layers, exclude=frozenset()):
+        """
+        :param layers: tuple of dictionaries, highest precedence first
+        :param exclude: set of keys to hide
+        """
+        self._layers = layers
+        self._exclude = exclude
+
+    def __getitem__(self, key):
+        if key not in self._exclude:
+            for layer in self._layers:
+                if key in layer:
+                    return layer[key]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        if key in self._exclude:
+            return False
+        for layer in self._layers:
+            if key in layer:
+                return True
+        return False
+
+    def __iter__(self):
+        seen = set(self._exclude)
+        for layer in reversed(self._layers):
+            for key in layer:
+                if key not in seen:
+                    seen.add(key)
+                    yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return 'RecordView(%r)' % dict(self)
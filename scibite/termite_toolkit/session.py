@@ -0,0 +1,296 @@
+"""
+
+  ____       _ ____  _ _         _____ _____ ____  __  __ _ _         _____           _ _    _ _
+ / ___|  ___(_) __ )(_) |_ ___  |_   _| ____|  _ \|  \/  (_) |_ ___  |_   _|__   ___ | | | _(_) |_
+ \___ \ / __| |  _ \| | __/ _ \   | | |  _| | |_) | |\/| | | __/ _ \   | |/ _ \ / _ \| | |/ / | __|
+  ___) | (__| | |_) | | ||  __/   | | | |___|  _ <| |  | | | ||  __/   | | (_) | (_) | |   <| | |_
+ |____/ \___|_|____/|_|\__\___|   |_| |_____|_| \_\_|  |_|_|\__\___|   |_|\___/ \___/|_|_|\_\_|\__|
+
+
+HttpSession- pooled, keep-alive HTTP connections shared by the request builders, with retries and a circuit breaker.
+
+"""
+
+__author__ = 'SciBite DataScience'
+__version__ = '0.2'
+__copyright__ = '(c) 2019, SciBite Ltd'
+__license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from termite_toolkit.exceptions import CircuitOpenError, TermiteConnectionError
+
+
+class RetryPolicy():
+    """
+    Class describing when and how long to wait before retrying a failed request. Connection errors, timeouts and the
+    statuses in retry_statuses are retried with exponential backoff and full jitter, honouring any Retry-After header
+    """
+
+    def __init__(self, max_retries=3, backoff_factor=0.5, max_backoff=30, retry_statuses=(429, 500, 502, 503, 504),
+                 respect_retry_after=True):
+        """
+        :param max_retries: number of retries after the first attempt, 0 to disable retrying
+        :param backoff_factor: the n-th retry waits a random time up to backoff_factor * 2 ** n seconds
+        :param max_backoff: maximum number of seconds to wait between attempts, including any Retry-After
+        :param retry_statuses: HTTP statuses that are retried
+        :param respect_retry_after: if True wait as long as the server's Retry-After header asks
+        """
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.retry_statuses = frozenset(retry_statuses)
+        self.respect_retry_after = respect_retry_after
+
+    def backoff(self, attempt, retry_after=None):
+        """
+        Number of seconds to wait before the next attempt
+
+        :param attempt: number of attempts already made, starting at 0
+        :param retry_after: value of the Retry-After header of the failed response, if any
+        :return: seconds to sleep
+        """
+        if self.respect_retry_after and retry_after:
+            delay = _parse_retry_after(retry_after)
+            if delay is not None:
+                return min(delay, self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * (2 ** attempt)))
+
+
+def _parse_retry_after(value):
+    """
+    Helper function. Convert a Retry-After header, in seconds or as an HTTP date, into seconds from now.
+    """
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker():
+    """
+    Class that stops requests being sent to a struggling server. After failure_threshold consecutive failures the
+    circuit opens and requests fail immediately with CircuitOpenError; after reset_timeout seconds one trial request
+    is let through, closing the circuit again if it succeeds
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        """
+        :param failure_threshold: number of consecutive failures that opens the circuit
+        :param reset_timeout: number of seconds the circuit stays open before a trial request is allowed
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """
+        'closed', 'open' or 'half-open'
+        """
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def before_request(self, url=None):
+        """
+        Raise CircuitOpenError unless a request may be sent now
+
+        :return: True if the request is the trial request of a half-open circuit
+        """
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return False
+            if state == 'half-open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+        raise CircuitOpenError('Circuit open after {} consecutive failures, not calling {}'.format(self.failures, url),
+                               url=url)
+
+    def record_success(self):
+        """
+        Close the circuit after a successful request
+        """
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        """
+        Count a failed request, opening the circuit once failure_threshold is reached or a trial request fails
+        """
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """
+        Give up the trial slot without recording an outcome, when the trial request ended in an error that says
+        nothing about the server, so the next request can be sent as the trial
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+
+class HttpSession():
+    """
+    Class wrapping a pooled requests.Session, bind one instance to any number of TermiteRequestBuilder,
+    TexpressRequestBuilder or UtilitiesRequestBuilder objects so back-to-back calls reuse open connections
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, keep_alive=True, timeout=None, pool_block=False,
+                 retry=None, circuit_breaker=None):
+        """
+        :param pool_connections: number of distinct hosts to keep connection pools for
+        :param pool_maxsize: maximum number of connections kept open per host
+        :param keep_alive: if False every request asks the server to close the connection afterwards
+        :param timeout: default timeout in seconds, either a single number or a (connect, read) tuple
+        :param pool_block: if True, wait for a free connection rather than opening one above pool_maxsize
+        :param retry: RetryPolicy for failed requests, by default up to 3 retries with exponential backoff
+        :param circuit_breaker: optional CircuitBreaker shared by every request sent over this session
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.pool_block = pool_block
+        self.retry = retry if retry is not None else RetryPolicy()
+        self.circuit_breaker = circuit_breaker
+        self.session = requests.Session()
+
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=pool_block)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
+
+    def request(self, method, url, **kwargs):
+        """
+        Send a request over the pooled connections, applying the session default timeout if none is given.
+        Connection errors, timeouts and retryable statuses are retried according to the session's RetryPolicy,
+        the response to the last attempt is returned whatever its status
+
+        :param method: HTTP method e.g. 'GET' or 'POST'
+        :param url: URL to be hit
+        :param kwargs: any further keyword arguments accepted by requests
+        :return: request response
+        """
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+
+        attempt = 0
+        while True:
+            trial = self.circuit_breaker is not None and self.circuit_breaker.before_request(url)
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._record(False)
+                if attempt >= self.retry.max_retries:
+                    raise TermiteConnectionError(
+                        "Failed with the following error {}\n\nPlease check that TERMite can be accessed via the following URL {}".format(
+                            e, url), url=url) from e
+                time.sleep(self.retry.backoff(attempt))
+                attempt += 1
+                continue
+            except BaseException:
+                # e.g. an invalid URL or KeyboardInterrupt, let another request take the trial
+                if trial:
+                    self.circuit_breaker.release_trial()
+                raise
+
+            if response.status_code not in self.retry.retry_statuses:
+                self._record(response.status_code < 500)
+                return response
+            self._record(False)
+            if attempt >= self.retry.max_retries:
+                return response
+            delay = self.retry.backoff(attempt, response.headers.get('Retry-After'))
+            response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def _record(self, success):
+        if self.circuit_breaker is None:
+            return
+        if success:
+            self.circuit_breaker.record_success()
+        else:
+            self.circuit_breaker.record_failure()
+
+    def post(self, url, **kwargs):
+        """
+        POST over the pooled connections
+
+        :param url: URL to be hit
+        :return: request response
+        """
+        return self.request('POST', url, **kwargs)
+
+    def get(self, url, **kwargs):
+        """
+        GET over the pooled connections
+
+        :param url: URL to be hit
+        :return: request response
+        """
+        return self.request('GET', url, **kwargs)
+
+    def close(self):
+        """
+        Close all pooled connections
+        """
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+_default_session = None
+_default_session_lock = threading.Lock()
+
+
+def get_default_session():
+    """
+    Returns the process-wide session used by request builders that have not been bound to their own session
+
+    :return: HttpSession
+    """
+    global _default_session
+    if _default_session is None:
+        with _default_session_lock:
+            if _default_session is None:
+                _default_session = HttpSession()
+    return _default_session
+
+
+def set_default_session(session):
+    """
+    Replace the process-wide session used by request builders that have not been bound to their own session
+
+    :param session: HttpSession to be used by default
+    """
+    global _default_session
+    with _default_session_lock:
+        _default_session = session
@@ -0,0 +1,200 @@
+"""
+
+  ____       _ ____  _ _         _____ _____ ____  __  __ _ _         _____           _ _    _ _
+ / ___|  ___(_) __ )(_) |_ ___  |_   _| ____|  _ \|  \/  (_) |_ ___  |_   _|__   ___ | | | _(_) |_
+ \___ \ / __| |  _ \| | __/ _ \   | | |  _| | |_) | |\/| | | __/ _ \   | |/ _ \ / _ \| | |/ / | __|
+  ___) | (__| | |_) | | ||  __/   | | | |___|  _ <| |  | | | ||  __/   | | (_) | (_) | |   <| | |_
+ |____/ \___|_|____/|_|\__\___|   |_| |_____|_| \_\_|  |_|_|\__\___|   |_|\___/ \___/|_|_|\_\_|\__|
+
+
+Corpus sharding- split large zip archives and multi-record XML files into smaller requests and merge the results.
+
+"""
+
+__author__ = 'SciBite DataScience'
+__version__ = '0.2'
+__copyright__ = '(c) 2019, SciBite Ltd'
+__license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
+
+import os
+import re
+import zipfile
+from xml.parsers import expat
+
+from termite_toolkit.upload import zip_documents
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def iter_zip_shards(input_file_path, shard_size, max_docs=None):
+    """
+    Split a zip archive into in-memory zip archives of at most shard_size documents each, reading one shard at a time
+
+    :param input_file_path: path to the zip archive
+    :param shard_size: number of documents per shard
+    :param max_docs: optional limit on the total number of documents read, as set_max_docs
+    :return: generator of zip archives as bytes
+    """
+    with zipfile.ZipFile(input_file_path) as archive:
+        names = [info.filename for info in archive.infolist() if not info.is_dir()]
+        if max_docs is not None:
+            names = names[:max_docs]
+        for start in range(0, len(names), shard_size):
+            yield zip_documents((name, archive.read(name)) for name in names[start:start + shard_size])
+
+
+def iter_xml_shards(input_file_path, shard_size, max_docs=None, chunk_size=CHUNK_SIZE):
+    """
+    Split a multi-record XML file, e.g. a MEDLINE export, into XML documents of at most shard_size records each.
+    Records are the children of the root element. Every shard starts with the original prolog, including any XML
+    declaration and DOCTYPE, and the original root start tag with its attributes and namespace declarations, and the
+    records are copied byte for byte. The file is read incrementally so it is never held in memory as a whole
+
+    :param input_file_path: path to the XML file
+    :param shard_size: number of records per shard
+    :param max_docs: optional limit on the total number of records read, as set_max_docs
+    :param chunk_size: number of bytes read from the file at a time
+    :return: generator of XML documents as bytes
+    """
+    # expat reports the byte offset at which each event starts, so a tag ends where the next event begins
+    parser = expat.ParserCreate()
+    buffer = bytearray()
+    state = {'offset': 0, 'depth': 0, 'head': None, 'root_start': None, 'record_start': None, 'record_end': False}
+    records = []
+
+    def mark():
+        idx = parser.CurrentByteIndex
+        offset = state['offset']
+        if state['root_start'] is not None:
+            state['head'] = bytes(buffer[:idx - offset])
+            state['root_start'] = None
+        elif state['record_end']:
+            records.append(bytes(buffer[state['record_start'] - offset:idx - offset]))
+            state['record_end'] = False
+            state['record_start'] = None
+        if state['head'] is not None and state['record_start'] is None:
+            del buffer[:idx - offset]
+            state['offset'] = idx
+
+    def start_element(name, attrs):
+        mark()
+        if state['depth'] == 0:
+            state['root_start'] = parser.CurrentByteIndex
+        elif state['depth'] == 1:
+            state['record_start'] = parser.CurrentByteIndex
+        state['depth'] += 1
+
+    def end_element(name):
+        mark()
+        state['depth'] -= 1
+        if state['depth'] == 1:
+            state['record_end'] = True
+
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    parser.DefaultHandlerExpand = lambda data: mark()
+
+    n_docs = 0
+    with open(input_file_path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            buffer += chunk
+            parser.Parse(chunk, not chunk)
+            if max_docs is not None and n_docs + len(records) >= max_docs:
+                del records[max_docs - n_docs:]
+            while len(records) >= shard_size:
+                yield _xml_shard(state['head'], records[:shard_size])
+                n_docs += shard_size
+                del records[:shard_size]
+            if not chunk or (max_docs is not None and n_docs + len(records) >= max_docs):
+                break
+    if records:
+        yield _xml_shard(state['head'], records)
+
+
+def _xml_shard(head, records):
+    """
+    Helper function. Wrap records in the prolog and root start tag of the original file, closing the root element.
+    """
+    root_name = re.match(rb'\s*<([^\s/>]+)', head[head.rindex(b'<'):]).group(1)
+    return b''.join([head, b'\n'] + [record + b'\n' for record in records] + [b'</', root_name, b'>\n'])
+
+
+def iter_shards(input_file_path, shard_size, max_docs=None):
+    """
+    Split a zip archive or multi-record XML file into shards, see iter_zip_shards and iter_xml_shards
+
+    :param input_file_path: path to the zip archive or XML file
+    :param shard_size: number of documents per shard
+    :param max_docs: optional limit on the total number of documents read, as set_max_docs
+    :return: generator of (file_name, content) pairs, one per shard
+    """
+    if shard_size < 1:
+        raise ValueError('shard_size must be at least 1')
+    base_name, extension = os.path.splitext(os.path.basename(input_file_path))
+    if zipfile.is_zipfile(input_file_path):
+        shards = iter_zip_shards(input_file_path, shard_size, max_docs=max_docs)
+        extension = '.zip'
+    elif extension.lower() == '.xml':
+        shards = iter_xml_shards(input_file_path, shard_size, max_docs=max_docs)
+    else:
+        raise ValueError('Only zip archives and multi-record XML files can be sharded, not %s' % input_file_path)
+
+    for idx, shard in enumerate(shards):
+        yield '%s-shard%d%s' % (base_name, idx, extension), shard
+
+
+MERGEABLE_OUTPUTS = ['json', 'doc.json', 'doc.jsonx']
+
+
+def merge_responses(responses, names=None):
+    """
+    Merge the JSON or doc.JSONx responses for several shards into a single response of the same format.
+    JSON responses are merged into one RESP_MULTIDOC_PAYLOAD keyed by docID: documents keep the docIDs TERMite
+    reported for them, and a shard answered with a single-document RESP_PAYLOAD is keyed by the name of that shard,
+    e.g. medline-shard3.xml. doc.JSONx documents are concatenated in shard order and keep their own docIDs
+
+    :param responses: iterable of TERMite responses
+    :param names: optional list of shard names in the same order as responses, needed for single-document responses
+    :return: merged response
+    :raises ValueError: if a docID occurs in more than one shard, a response is not JSON or doc.JSONx, or a
+    single-document response has no shard name
+    """
+    merged = None
+    seen = set()
+    for idx, response in enumerate(responses):
+        # a TermiteResult is merged through the response it wraps
+        response = getattr(response, 'raw', response)
+        if isinstance(response, list):
+            doc_ids = [doc['docID'] for doc in response if doc.get('docID') is not None]
+            documents = response
+        elif isinstance(response, dict):
+            if "RESP_MULTIDOC_PAYLOAD" in response:
+                documents = response["RESP_MULTIDOC_PAYLOAD"]
+            elif "RESP_PAYLOAD" in response:
+                if names is None:
+                    raise ValueError('Shard names are needed to merge single-document responses')
+                documents = {names[idx]: response["RESP_PAYLOAD"]}
+            else:
+                documents = {}
+            doc_ids = list(documents)
+        else:
+            raise ValueError('Only JSON, doc.JSON or doc.JSONx responses can be merged, not %s'
+                             % type(response).__name__)
+
+        collisions = seen.intersection(doc_ids)
+        if collisions:
+            raise ValueError('docIDs occur in more than one shard: %s' % sorted(collisions))
+        seen.update(doc_ids)
+
+        if isinstance(response, list):
+            if merged is None:
+                merged = []
+            merged.extend(documents)
+            continue
+        if merged is None:
+            merged = {k: v for k, v in response.items() if k not in ("RESP_MULTIDOC_PAYLOAD", "RESP_PAYLOAD")}
+            merged["RESP_MULTIDOC_PAYLOAD"] = {}
+        merged["RESP_MULTIDOC_PAYLOAD"].update(documents)
+
+    return merged
@@ -0,0 +1,186 @@
+"""
+
+  ____       _ ____  _ _         _____ _____ ____  __  __ _ _         _____           _ _    _ _
+ / ___|  ___(_) __ )(_) |_ ___  |_   _| ____|  _ \|  \/  (_) |_ ___  |_   _|__   ___ | | | _(_) |_
+ \___ \ / __| |  _ \| | __/ _ \   | | |  _| | |_) | |\/| | | __/ _ \   | |/ _ \ / _ \| | |/ / | __|
+  ___) | (__| | |_) | | ||  __/   | | | |___|  _ <| |  | | | ||  __/   | | (_) | (_) | |   <| | |_
+ |____/ \___|_|____/|_|\__\___|   |_| |_____|_| \_\_|  |_|_|\__\___|   |_|\___/ \___/|_|_|\_\_|\__|
+
+
+Streaming JSON parsing- yield one document at a time from a TERMite or TExpress response body as it arrives.
+
+"""
+
+__author__ = 'SciBite DataScience'
+__version__ = '0.2'
+__copyright__ = '(c) 2019, SciBite Ltd'
+__license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
+
+import codecs
+import json
+
+CHUNK_SIZE = 64 * 1024
+
+# response keys holding one entry per document, these are split up rather than parsed whole
+MULTIDOC_KEYS = ("RESP_MULTIDOC_PAYLOAD", "RESP_TEXPRESS")
+# response keys holding the payload of a single document
+SINGLE_DOC_KEYS = ("RESP_PAYLOAD",)
+
+_WHITESPACE = ' \t\n\r'
+
+
+class _Scanner():
+    """
+    Incremental JSON scanner over an iterable of text or byte chunks. Only the value currently being decoded is held
+    in memory, the buffer is trimmed as values are consumed
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _read(self, size=1):
+        """
+        Read chunks until at least size characters are pending, then join them onto the unconsumed part of the buffer
+        in a single copy. Returns False if the input is exhausted first
+        """
+        pending = len(self.buffer) - self.pos
+        if pending >= size:
+            return True
+        pieces = [self.buffer[self.pos:]]
+        while pending < size and not self.eof:
+            try:
+                chunk = next(self._chunks)
+            except StopIteration:
+                self.eof = True
+                chunk = self._decoder.decode(b'', final=True)
+            else:
+                if isinstance(chunk, bytes):
+                    chunk = self._decoder.decode(chunk)
+            pieces.append(chunk)
+            pending += len(chunk)
+        self.buffer = ''.join(pieces)
+        self.pos = 0
+        return pending >= size
+
+    def peek(self):
+        """
+        Skip whitespace and return the next character without consuming it, '' at the end of the input
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._read():
+                return ''
+
+    def next_char(self):
+        char = self.peek()
+        self.pos += 1
+        return char
+
+    def expect(self, char):
+        found = self.next_char()
+        if found != char:
+            raise ValueError('Malformed JSON response: expected %r but found %r' % (char, found))
+
+    def decode_value(self):
+        """
+        Decode the next complete JSON value, reading more input until it is available. After a failed attempt the
+        pending input is at least doubled before retrying, so a value spread over many chunks is copied and re-scanned
+        a logarithmic number of times rather than once per chunk
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self.buffer, self.pos)
+                # a number at the very end of the buffer may continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._read(2 * (len(self.buffer) - self.pos) + CHUNK_SIZE)
+
+    def iter_members(self):
+        """
+        Yields the keys of the object whose '{' has just been consumed, the caller must consume each value
+        """
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.decode_value()
+            self.expect(':')
+            yield key
+            char = self.next_char()
+            if char == '}':
+                return
+            if char != ',':
+                raise ValueError('Malformed JSON response: expected \',\' or \'}\' but found %r' % char)
+
+    def iter_items(self):
+        """
+        Yields the values of the array whose '[' has just been consumed
+        """
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.decode_value()
+            char = self.next_char()
+            if char == ']':
+                return
+            if char != ',':
+                raise ValueError('Malformed JSON response: expected \',\' or \']\' but found %r' % char)
+
+
+def iter_json_documents(chunks):
+    """
+    Incrementally parse a JSON, doc.JSON or doc.JSONx response body, yielding one document at a time:
+    - for doc.JSON/doc.JSONx, each document of the top level array
+    - for JSON, {"RESP_MULTIDOC_PAYLOAD": {docID: payload}} for each document, or {"RESP_TEXPRESS": {docID: hits}}
+    for TExpress, and {"RESP_PAYLOAD": payload} for a single document response
+    Every item has the same shape as a whole response, so it can be passed to the usual record and dataframe functions
+
+    :param chunks: iterable of bytes or str, e.g. response.iter_content()
+    :return: generator of documents
+    """
+    scanner = _Scanner(chunks)
+    first = scanner.next_char()
+    if first == '[':
+        for doc in scanner.iter_items():
+            yield doc
+    elif first == '{':
+        for key in scanner.iter_members():
+            if key in MULTIDOC_KEYS and scanner.peek() == '{':
+                scanner.pos += 1
+                for doc_id in scanner.iter_members():
+                    yield {key: {doc_id: scanner.decode_value()}}
+            elif key in SINGLE_DOC_KEYS:
+                yield {key: scanner.decode_value()}
+            else:
+                scanner.decode_value()
+    elif first != '':
+        raise ValueError('Malformed JSON response: expected \'[\' or \'{\' but found %r' % first)
+
+
+def iter_response_documents(response, chunk_size=CHUNK_SIZE):
+    """
+    Stream the documents of a requests response opened with stream=True, closing it once exhausted
+
+    :param response: requests response
+    :param chunk_size: number of bytes read from the connection at a time
+    :return: generator of documents, see iter_json_documents
+    """
+    try:
+        for doc in iter_json_documents(response.iter_content(chunk_size=chunk_size)):
+            yield doc
+    finally:
+        response.close()
@@ -16,10 +16,22 @@ __version__ = '0.2'
 __copyright__ = '(c) 2019, SciBite Ltd'
 __license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
 
-import requests
+import collections
+import copy
+import heapq
+import itertools
+import json
 import os
 import pandas as pd
 
+from termite_toolkit.exceptions import TermiteHTTPError
+from termite_toolkit.parallel import bounded_map
+from termite_toolkit.records import RecordView
+from termite_toolkit.session import HttpSession, get_default_session
+from termite_toolkit.streaming import iter_response_documents
+from termite_toolkit.sharding import MERGEABLE_OUTPUTS, iter_shards, merge_responses
+from termite_toolkit.upload import MultipartStream, zip_documents
+
 
 class TermiteRequestBuilder():
     """
@@ -34,6 +46,8 @@ class TermiteRequestBuilder():
         self.binary_content = None
         self.basic_auth = ()
         self.verify_request = True
+        self.session = None
+        self.cache = None
 
     def set_basic_auth(self, username='', password='', verification=True):
         """
@@ -56,16 +70,42 @@ class TermiteRequestBuilder():
         """
         self.url = url
 
+    def set_session(self, session):
+        """
+        Bind the builder to a shared HttpSession so that connections are pooled and kept alive between requests
+
+        :param session: termite_toolkit.session.HttpSession instance
+        """
+        self.session = session
+
+    def set_cache(self, cache):
+        """
+        Bind the builder to a ResponseCache so that repeated identical requests are answered locally
+
+        :param cache: termite_toolkit.cache.ResponseCache instance
+        """
+        self.cache = cache
+
     def set_binary_content(self, input_file_path):
         """
         For annotating file content, send file path string and process file as a binary
         multiple files of the same type can be scanned at once if placed in a zip archive
+        the file is only opened while the request is being sent, and is streamed from disk rather than read into memory
 
         :param input_file_path: file path to the file to be sent to TERMite
         """
-        file_obj = open(input_file_path, 'rb')
+        self.input_file_path = input_file_path
         file_name = os.path.basename(input_file_path)
-        self.binary_content = {"binary": (file_name, file_obj)}
+        self.binary_content = {"binary": (file_name, input_file_path)}
+
+    def set_binary_data(self, data, file_name):
+        """
+        For annotating content that is already in memory, e.g. a zip archive built with upload.zip_documents()
+
+        :param data: bytes or binary file object to be sent to TERMite
+        :param file_name: file name reported to TERMite, its extension should match the content e.g. docs.zip
+        """
+        self.binary_content = {"binary": (file_name, data)}
 
     def set_text(self, string):
         """
@@ -175,32 +215,69 @@ class TermiteRequestBuilder():
         input = bool_to_string(bool)
         self.payload["noEmpty"] = input
 
-    def execute(self, display_request=False, return_text=False):
+    def execute(self, display_request=False, return_text=False, timeout=None, stream=False, result=False):
         """
         Once all settings are done, POST the parameters to the TERMite RESTful API
+        Failed requests are retried according to the session's RetryPolicy, see termite_toolkit.session
 
         :param display_request: if True request will be printed out before being submitted
-        :return: request response
+        :param return_text: if True return the raw response text rather than parsed JSON
+        :param timeout: timeout in seconds for this request, overriding the session default
+        :param stream: if True return a generator that parses the JSON response incrementally as it is downloaded and
+        yields one document at a time, see termite_toolkit.streaming.iter_json_documents
+        :param result: if True wrap a parsed JSON response in a TermiteResult, which caches the analysis views
+        :return: parsed JSON for JSON, doc.JSON and doc.JSONx output (a TermiteResult if result is True), otherwise
+        the response text
+        :raises TermiteConnectionError: if TERMite could not be reached
+        :raises TermiteHTTPError: if TERMite answered with an error status
+        :raises CircuitOpenError: if the session's circuit breaker is open
         """
         if display_request:
             print("REQUEST: ", self.url, self.payload)
-        try:
-            if self.binary_content and bool(self.basic_auth):
-                response = requests.post(self.url, data=self.payload, files=self.binary_content, auth=self.basic_auth,
-                                         verify=self.verify_request)
-            elif self.binary_content and bool(self.basic_auth) == False:
-                response = requests.post(self.url, data=self.payload, files=self.binary_content)
-            elif not self.binary_content and bool(self.basic_auth):
-                response = requests.post(self.url, data=self.payload, verify=self.verify_request, auth=self.basic_auth)
-            else:
-                response = requests.post(self.url, data=self.payload)
-        except Exception as e:
-            return print(
-                "Failed with the following error {}\n\nPlease check that TERMite can be accessed via the following URL {}\nAnd that the necessary credentials have been provided (done so using the set_basic_auth() function)".format(
-                    e, self.url))
+        if stream and (not "json" in self.payload["output"] or return_text):
+            raise ValueError('Only JSON, doc.JSON or doc.JSONx responses can be streamed')
+        cache_key = None
+        if self.cache is not None and not stream:
+            user = self.basic_auth[0] if self.basic_auth else None
+            cache_key = self.cache.key(self.url, self.payload, self.binary_content, user)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                if "json" in self.payload["output"] and not return_text:
+                    parsed = json.loads(cached)
+                    return TermiteResult(parsed) if result else parsed
+                return cached
+
+        session = self.session if self.session is not None else get_default_session()
+        request_kwargs = {"data": self.payload}
+        if bool(self.basic_auth):
+            request_kwargs["auth"] = self.basic_auth
+            request_kwargs["verify"] = self.verify_request
+        if self.binary_content:
+            with MultipartStream(self.payload, self.binary_content) as body:
+                request_kwargs["data"] = body
+                request_kwargs["headers"] = {"Content-Type": body.content_type}
+                response = session.post(self.url, timeout=timeout, stream=stream, **request_kwargs)
+        else:
+            response = session.post(self.url, timeout=timeout, stream=stream, **request_kwargs)
+
+        if not response.ok:
+            if stream:
+                # the body of a streamed response is never read, release the connection rather than leak it
+                response.close()
+            raise TermiteHTTPError(
+                "TERMite returned HTTP {} {} for {}\n\nPlease check that the necessary credentials have been provided (done so using the set_basic_auth() function)".format(
+                    response.status_code, response.reason, self.url), url=self.url, status_code=response.status_code,
+                response=response)
+
+        if stream:
+            return iter_response_documents(response)
+
+        if cache_key is not None:
+            self.cache.set(cache_key, response.text)
 
         if "json" in self.payload["output"] and not return_text:
-            return response.json()
+            parsed = response.json()
+            return TermiteResult(parsed) if result else parsed
         else:
             return response.text
 
@@ -218,17 +295,19 @@ def bool_to_string(bool):
     return string
 
 
-def annotate_files(url, input_file_path, options_dict):
+def annotate_files(url, input_file_path, options_dict, session=None):
     """
     Wrapper function to execute a TERMite request for annotating individual files or a zip archive
 
     :param url: url of TERMite instance
     :param input_file_path: path to file to be annotated
     :param options_dict: dictionary of options to be used during annotation
+    :param session: optional HttpSession to send the request over
     :return: result of request
     """
     t = TermiteRequestBuilder()
     t.set_url(url)
+    t.set_session(session)
     t.set_binary_content(input_file_path)
     t.set_options(options_dict)
     result = t.execute()
@@ -236,17 +315,95 @@ def annotate_files(url, input_file_path, options_dict):
     return result
 
 
-def annotate_text(url, text, options_dict):
+def annotate_files_sharded(url, input_file_path, options_dict, shard_size=100, max_docs=None, max_workers=4,
+                           max_in_flight=None, merge=True, session=None):
+    """
+    Wrapper function to annotate a large zip archive or multi-record XML file (e.g. a MEDLINE export) as a number of
+    smaller requests of at most shard_size documents each, submitted concurrently
+
+    :param url: url of TERMite instance
+    :param input_file_path: path to the zip archive or XML file to be annotated
+    :param options_dict: dictionary of options to be used during annotation
+    :param shard_size: number of documents sent per request
+    :param max_docs: optional limit on the total number of documents annotated, as set_max_docs
+    :param max_workers: number of shards sent in parallel
+    :param max_in_flight: maximum number of shards read but not yet returned, defaults to twice max_workers
+    :param merge: if True return one merged response, see sharding.merge_responses for how documents are keyed,
+    otherwise return a generator of per-shard responses so that only a bounded number of shards is held in memory.
+    Merging needs json, doc.json or doc.jsonx output
+    :param session: optional HttpSession to send the requests over
+    :return: merged response, or generator of responses in shard order
+    :raises ValueError: if merge is True and the output format cannot be merged, or a docID occurs in more than one
+    shard
+    """
+    if merge and options_dict.get('output', 'json') not in MERGEABLE_OUTPUTS:
+        raise ValueError('Only json, doc.json or doc.jsonx output can be merged, not %s' % options_dict['output'])
+    shards = _annotate_shards(url, input_file_path, options_dict, shard_size, max_docs, max_workers,
+                              max_in_flight, session)
+    if merge:
+        shards = list(shards)
+        return merge_responses([response for _, response in shards], names=[name for name, _ in shards])
+    return (response for _, response in shards)
+
+
+def _annotate_shards(url, input_file_path, options_dict, shard_size, max_docs, max_workers, max_in_flight,
+                     session):
+    owns_session = session is None
+    if owns_session:
+        session = HttpSession(pool_maxsize=max_workers)
+
+    def annotate(shard):
+        file_name, content = shard
+        t = TermiteRequestBuilder()
+        t.set_url(url)
+        t.set_session(session)
+        t.set_binary_data(content, file_name)
+        t.set_options(options_dict)
+        return file_name, t.execute()
+
+    try:
+        for result in bounded_map(annotate, iter_shards(input_file_path, shard_size, max_docs=max_docs),
+                                  max_workers=max_workers, max_in_flight=max_in_flight):
+            yield result
+    finally:
+        if owns_session:
+            session.close()
+
+
+def annotate_documents(url, documents, options_dict, session=None):
+    """
+    Wrapper function to execute a TERMite request for annotating in-memory documents, which are packed into a zip
+    archive without touching disk
+
+    :param url: url of TERMite instance
+    :param documents: iterable of (file_name, content) pairs, or of plain strings
+    :param options_dict: dictionary of options to be used during annotation
+    :param session: optional HttpSession to send the request over
+    :return: result of request
+    """
+    t = TermiteRequestBuilder()
+    t.set_url(url)
+    t.set_session(session)
+    t.set_binary_data(zip_documents(documents), 'documents.zip')
+    t.set_options(options_dict)
+    result = t.execute()
+
+    return result
+
+
+def annotate_text(url, text, options_dict, session=None):
     """
     Wrapper function to execute a TERMite request for annotating strings of text
 
     :param url: url of TERMite instance
     :param text: text to be annotated
     :param options_dict: dictionary of options to be used during annotation
+    :param session: optional HttpSession to send the request over
     :return: result of request
     """
     t = TermiteRequestBuilder()
     t.set_url(url)
+    t.set_session(session)
     t.set_text(text)
     t.set_options(options_dict)
     result = t.execute()
@@ -254,6 +411,37 @@ def annotate_text(url, text, options_dict):
     return result
 
 
+def annotate_many(url, texts, options_dict, max_workers=4, max_in_flight=None, ordered=True, session=None):
+    """
+    Wrapper function to execute TERMite requests for annotating many strings of text concurrently.
+    Texts are consumed lazily and at most max_in_flight requests are outstanding at once, so memory stays flat
+    however large the input iterable is
+
+    :param url: url of TERMite instance
+    :param texts: iterable of texts to be annotated
+    :param options_dict: dictionary of options to be used during annotation
+    :param max_workers: number of requests sent in parallel
+    :param max_in_flight: maximum number of texts submitted but not yet yielded, defaults to twice max_workers
+    :param ordered: if True yield results in input order, otherwise yield (index, result) tuples as they complete
+    :param session: optional HttpSession to send the requests over, by default one sized to max_workers is used
+    :return: generator of results
+    """
+    owns_session = session is None
+    if owns_session:
+        session = HttpSession(pool_maxsize=max_workers)
+
+    def annotate(text):
+        return annotate_text(url, text, options_dict, session=session)
+
+    try:
+        for result in bounded_map(annotate, texts, max_workers=max_workers, max_in_flight=max_in_flight,
+                                  ordered=ordered):
+            yield result
+    finally:
+        if owns_session:
+            session.close()
+
+
 def process_payload(filtered_hits, response_payload, filter_entity_types, doc_id='', reject_ambig=True, score_cutoff=0,
                     remove_subsumed=True):
     """
@@ -325,47 +513,64 @@ def get_entity_hits_from_json(termite_json_response, filter_entity_types, reject
     return filtered_hits
 
 
-def docjsonx_payload_records(docjsonx_response_payload, reject_ambig=True, score_cutoff=0, remove_subsumed=True):
+DOCJSONX_HIDDEN_KEYS = frozenset(['termiteTags'])
+
+
+def iter_docjsonx_payload_records(docjsonx_response_payload, reject_ambig=True, score_cutoff=0, remove_subsumed=True):
     """
-    Parses TERMite doc.JSONx payload into records, includes rules to filter out ambiguous and low-relevance hits
+    Generator version of docjsonx_payload_records, yields one record per entity hit.
+    Each record is a RecordView of the hit merged with its document's fields (document fields take precedence, as the
+    termiteTags are left out), the response itself is not modified
 
     :param docjsonx_response_payload: doc.JSONx TERMite response.
     :param reject_ambig: boolean
     :param score_cutoff: a numerical value between 1-5
     :param remove_subsumed: boolean
-    :return: TERMite response in records format
+    :return: generator of TERMite hit records
     """
-    payload = []
     for doc in docjsonx_response_payload:
         if 'termiteTags' in doc.keys():
             for entity_hit in doc['termiteTags']:
-                # update document record with entity hit record
-                entity_hit.update(doc)
-                del entity_hit['termiteTags']
+                # view of the entity hit record with the document record layered over it
+                record = RecordView((doc, entity_hit), DOCJSONX_HIDDEN_KEYS)
 
                 # filtering
-                if reject_ambig is True and entity_hit['nonambigsyns'] == 0:
+                if reject_ambig is True and record['nonambigsyns'] == 0:
                     continue
-                if "subsume" in entity_hit and remove_subsumed is True:
-                    if True in entity_hit['subsume']:
+                if "subsume" in record and remove_subsumed is True:
+                    if True in record['subsume']:
                         continue
-                if entity_hit['score'] >= score_cutoff:
-                    payload.append(entity_hit)
+                if record['score'] >= score_cutoff:
+                    yield record
 
-    return (payload)
 
-
-def json_payload_records(response_payload, reject_ambig=True, score_cutoff=0, remove_subsumed=True):
+def docjsonx_payload_records(docjsonx_response_payload, reject_ambig=True, score_cutoff=0, remove_subsumed=True):
     """
-    Parses TERMite json payload into records, includes rules to filter out ambiguous and low-relevance hits
+    Parses TERMite doc.JSONx payload into records, includes rules to filter out ambiguous and low-relevance hits
 
-    :param response_payload: REP_PAYLOAD of JSON TERMite response
+    :param docjsonx_response_payload: doc.JSONx TERMite response.
     :param reject_ambig: boolean
     :param score_cutoff: a numerical value between 1-5
     :param remove_subsumed: boolean
     :return: TERMite response in records format
     """
-    payload = []
+    return list(iter_docjsonx_payload_records(docjsonx_response_payload, reject_ambig=reject_ambig,
+                                              score_cutoff=score_cutoff, remove_subsumed=remove_subsumed))
+
+
+def iter_json_payload_records(response_payload, doc_id=None, reject_ambig=True, score_cutoff=0, remove_subsumed=True):
+    """
+    Generator version of json_payload_records, yields one record per entity hit. If doc_id is given it is attached to
+    every record as docID through a RecordView, leaving the response itself untouched
+
+    :param response_payload: REP_PAYLOAD of JSON TERMite response, or one document of RESP_MULTIDOC_PAYLOAD
+    :param doc_id: optional docID of the document the payload belongs to
+    :param reject_ambig: boolean
+    :param score_cutoff: a numerical value between 1-5
+    :param remove_subsumed: boolean
+    :return: generator of TERMite hit records
+    """
+    doc_fields = {'docID': doc_id}
     for entity_type, entity_hits in response_payload.items():
         for entity_hit in entity_hits:
             if reject_ambig is True and entity_hit['nonambigsyns'] == 0:
@@ -374,9 +579,62 @@ def json_payload_records(response_payload, reject_ambig=True, score_cutoff=0, re
                 if True in entity_hit['subsume']:
                     continue
             if entity_hit['score'] >= score_cutoff:
-                payload.append(entity_hit)
+                if doc_id is not None:
+                    entity_hit = RecordView((doc_fields, entity_hit))
+                yield entity_hit
+
+
+def json_payload_records(response_payload, reject_ambig=True, score_cutoff=0, remove_subsumed=True):
+    """
+    Parses TERMite json payload into records, includes rules to filter out ambiguous and low-relevance hits
 
-    return (payload)
+    :param response_payload: REP_PAYLOAD of JSON TERMite response
+    :param reject_ambig: boolean
+    :param score_cutoff: a numerical value between 1-5
+    :param remove_subsumed: boolean
+    :return: TERMite response in records format
+    """
+    return list(iter_json_payload_records(response_payload, reject_ambig=reject_ambig, score_cutoff=score_cutoff,
+                                          remove_subsumed=remove_subsumed))
+
+
+def iter_payload_records(termiteResponse, reject_ambig=True, score_cutoff=0, remove_subsumed=True):
+    """
+    Generator version of payload_records, walks the response once and yields records lazily, in linear time.
+    Records from RESP_MULTIDOC_PAYLOAD carry the docID of the document they were found in
+
+    :param termiteResponse: JSON or doc.JSONx TERMite response, or the documents streamed by execute(stream=True)
+    :param reject_ambig: boolean
+    :param score_cutoff: a numerical value between 1-5
+    :param remove_subsumed: boolean
+    :return: generator of TERMite hit records
+    """
+    if isinstance(termiteResponse, TermiteResult):
+        for record in termiteResponse.records(reject_ambig=reject_ambig, score_cutoff=score_cutoff,
+                                              remove_subsumed=remove_subsumed):
+            yield record
+    elif isinstance(termiteResponse, dict):
+        if "RESP_MULTIDOC_PAYLOAD" in termiteResponse:
+            for docID, termite_hits in termiteResponse['RESP_MULTIDOC_PAYLOAD'].items():
+                for record in iter_json_payload_records(termite_hits, doc_id=docID, reject_ambig=reject_ambig,
+                                                        score_cutoff=score_cutoff, remove_subsumed=remove_subsumed):
+                    yield record
+        elif "RESP_PAYLOAD" in termiteResponse:
+            for record in iter_json_payload_records(termiteResponse['RESP_PAYLOAD'], reject_ambig=reject_ambig,
+                                                    score_cutoff=score_cutoff, remove_subsumed=remove_subsumed):
+                yield record
+    elif isinstance(termiteResponse, list):
+        for record in iter_docjsonx_payload_records(termiteResponse, reject_ambig=reject_ambig,
+                                                    score_cutoff=score_cutoff, remove_subsumed=remove_subsumed):
+            yield record
+    else:
+        # documents streamed by execute(stream=True), each shaped like a whole response
+        for doc in termiteResponse:
+            if not (isinstance(doc, dict) and ("RESP_MULTIDOC_PAYLOAD" in doc or "RESP_PAYLOAD" in doc)):
+                doc = [doc]
+            for record in iter_payload_records(doc, reject_ambig=reject_ambig, score_cutoff=score_cutoff,
+                                               remove_subsumed=remove_subsumed):
+                yield record
 
 
 def payload_records(termiteResponse, reject_ambig=True, score_cutoff=0, remove_subsumed=True):
@@ -389,21 +647,48 @@ def payload_records(termiteResponse, reject_ambig=True, score_cutoff=0, remove_s
     :param remove_subsumed: boolean
     :return: TERMite response in records format
     """
-    payload = []
+    return list(iter_payload_records(termiteResponse, reject_ambig=reject_ambig, score_cutoff=score_cutoff,
+                                     remove_subsumed=remove_subsumed))
 
-    if "RESP_MULTIDOC_PAYLOAD" in termiteResponse:
-        for docID, termite_hits in termiteResponse['RESP_MULTIDOC_PAYLOAD'].items():
-            payload = payload + json_payload_records(termite_hits, reject_ambig=reject_ambig,
-                                                     score_cutoff=score_cutoff, remove_subsumed=remove_subsumed)
-    elif "RESP_PAYLOAD" in termiteResponse:
-        payload = payload + json_payload_records(termiteResponse['RESP_PAYLOAD'], reject_ambig=reject_ambig,
-                                                 score_cutoff=score_cutoff, remove_subsumed=remove_subsumed)
 
-    else:
-        payload = docjsonx_payload_records(termiteResponse, reject_ambig=reject_ambig,
-                                           score_cutoff=score_cutoff, remove_subsumed=remove_subsumed)
+TERMITE_DATAFRAME_COLUMNS = ["docID", "entityType", "hitID", "name", "score", "realSynList", "totnosyns",
+                             "nonambigsyns", "frag_vector_array", "hitCount"]
+CATEGORICAL_COLUMNS = ["docID", "entityType"]
 
-    return (payload)
+
+def records_to_columns(records, cols):
+    """
+    Collects the selected fields of hit records straight into per-column lists, without building a full record table.
+    Fields missing from a record are filled with None
+
+    :param records: iterable of TERMite hit records
+    :param cols: list of field names to extract
+    :return: tuple of (dictionary of column name to list of values, set of the columns found in any record)
+    """
+    columns = {col: [] for col in cols}
+    appenders = [(col, columns[col].append) for col in cols]
+    found = set()
+    for record in records:
+        if len(found) < len(cols):
+            found.update(col for col in cols if col in record)
+        for col, append in appenders:
+            append(record.get(col))
+    return columns, found
+
+
+def columns_to_dataframe(columns, cols):
+    """
+    Builds a dataframe from per-column lists, with docID and entityType stored as categoricals
+
+    :param columns: dictionary of column name to list of values
+    :param cols: column order
+    :return: pandas dataframe
+    """
+    df = pd.DataFrame(columns, columns=cols)
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df
 
 
 def get_termite_dataframe(termiteResponse, cols_to_add="", reject_ambig=True, score_cutoff=0,
@@ -412,36 +697,53 @@ def get_termite_dataframe(termiteResponse, cols_to_add="", reject_ambig=True, sc
     Parses TERMite JSON or doc.JSONx into a dataframe of hits, filtering out ambiguous and low-relevance hits
     By default returns docID, entityType, hitID, name, score, realSynList, totnosyns, nonambigsyns, frag_vector_array
     Additional hit information not included in the default output can be included by use of a comma separated list
+    Only the selected fields are extracted, so memory scales with the number of columns rather than the response;
+    docID and entityType are categorical
 
-    :param termiteResponse: JSON or doc.JSONx response from TERMite
+    :param termiteResponse: JSON or doc.JSONx response from TERMite, or the documents streamed by execute(stream=True)
     :param cols_to_add: comma separated list of additional fields to include
     :param reject_ambig: boolean
     :param score_cutoff: a numerical value between 1-5
     :param remove_subsumed: boolean
     :return: dataframe of TERMite hits
     """
+    if isinstance(termiteResponse, TermiteResult):
+        return _analyse(termiteResponse, 'dataframe', cols_to_add=cols_to_add, reject_ambig=reject_ambig,
+                        score_cutoff=score_cutoff, remove_subsumed=remove_subsumed)
+    records = iter_payload_records(termiteResponse, reject_ambig=reject_ambig, score_cutoff=score_cutoff,
+                                   remove_subsumed=remove_subsumed)
+    return records_to_dataframe(records, cols_to_add=cols_to_add)
 
-    payload = payload_records(termiteResponse, reject_ambig=reject_ambig,
-                              score_cutoff=score_cutoff, remove_subsumed=remove_subsumed)
-
-    df = pd.DataFrame(payload)
 
-    cols = ["docID", "entityType", "hitID", "name", "score", "realSynList", "totnosyns", "nonambigsyns",
-            "frag_vector_array", "hitCount"]
+def records_to_dataframe(records, cols_to_add=""):
+    """
+    Builds the get_termite_dataframe dataframe from TERMite hit records that have already been extracted and filtered
 
+    :param records: iterable of TERMite hit records
+    :param cols_to_add: comma separated list of additional fields to include
+    :return: dataframe of TERMite hits
+    """
+    cols = list(TERMITE_DATAFRAME_COLUMNS)
+    extra_cols = []
     if cols_to_add:
-        cols_to_add = cols_to_add.replace(" ", "").split(",")
-        try:
-            cols = cols + cols_to_add
-            if df.empty:
-                return pd.DataFrame(columns=cols)
-            return (df[cols])
-        except KeyError as e:
-            print("Invalid column selection.", e)
-    else:
-        if df.empty:
-            return pd.DataFrame(columns=cols)
-        return (df[cols])
+        extra_cols = cols_to_add.replace(" ", "").split(",")
+        cols = cols + extra_cols
+
+    # each field is extracted once, a default column also asked for in cols_to_add is repeated as before
+    unique_cols = list(dict.fromkeys(cols))
+    columns, found = records_to_columns(records, unique_cols)
+
+    if not columns[cols[0]]:
+        return pd.DataFrame(columns=cols)
+    missing = [col for col in extra_cols if col not in found]
+    if missing:
+        print("Invalid column selection.", KeyError(missing))
+        return None
+
+    df = columns_to_dataframe(columns, unique_cols)
+    if len(unique_cols) < len(cols):
+        df = df[cols]
+    return df
 
 
 def get_entity_hits_from_docjsonx(termite_response, filter_entity_types):
@@ -454,25 +756,41 @@ def get_entity_hits_from_docjsonx(termite_response, filter_entity_types):
     """
     processed = docjsonx_payload_records(termite_response)
 
+    return entity_hits_from_records(processed, filter_entity_types)
+
+
+def entity_hits_from_records(records, filter_entity_types=None):
+    """
+    Summarises TERMite hit records per entity: total hit count, maximum relevance score and the documents the entity
+    was found in, in order of first appearance. Document membership is tracked in a set per entity, so the summary is
+    built in linear time however many documents an entity appears in
+
+    :param records: iterable of TERMite hit records
+    :param filter_entity_types: optional entity types to include, by default all are included
+    :return: dictionary of filtered hits
+    """
     filtered_hits = {}
-    for entity_hit in processed:
+    entity_docs = {}
+    for entity_hit in records:
         hit_id = entity_hit['hitID']
         entityType = entity_hit['entityType']
         entity_id = entityType + '$' + hit_id
         entity_name = entity_hit['name']
         hit_count = entity_hit['hitCount']
         entity_score = entity_hit['score']
-        doc_id = entity_hit['docID']
+        doc_id = entity_hit.get('docID', '')
 
-        if entityType in filter_entity_types:
+        if filter_entity_types is None or entityType in filter_entity_types:
             if entity_id in filtered_hits:
                 filtered_hits[entity_id]['hit_count'] += hit_count
                 if entity_score > filtered_hits[entity_id]['max_relevance_score']:
                     filtered_hits[entity_id]['max_relevance_score'] = entity_score
-                if doc_id not in filtered_hits[entity_id]['doc_id']:
+                if doc_id not in entity_docs[entity_id]:
+                    entity_docs[entity_id].add(doc_id)
                     filtered_hits[entity_id]['doc_id'].append(doc_id)
                     filtered_hits[entity_id]['doc_count'] += 1
             else:
+                entity_docs[entity_id] = {doc_id}
                 filtered_hits[entity_id] = {"id": hit_id, "type": entityType, "name": entity_name,
                                             "hit_count": hit_count,
                                             "max_relevance_score": entity_score, "doc_id": [doc_id], "doc_count": 1}
@@ -480,86 +798,371 @@ def get_entity_hits_from_docjsonx(termite_response, filter_entity_types):
     return (filtered_hits)
 
 
+ENTITY_SUMMARY_COLUMNS = ["id", "type", "name", "hit_count", "max_relevance_score", "doc_id", "doc_count"]
+# number of hits above which entity summaries are computed with a pandas groupby rather than record by record
+GROUPBY_THRESHOLD = 50000
+
+
+def entity_summary_from_dataframe(df):
+    """
+    Vectorised equivalent of entity_hits_from_records for a get_termite_dataframe dataframe, returning the summary in
+    the all_entities_df format. Hits are grouped by entity type and ID with pandas, entities and their documents are
+    kept in order of first appearance
+
+    :param df: dataframe of TERMite hits
+    :return: pandas dataframe
+    """
+    if df is None or df.empty:
+        return pd.DataFrame()
+    frame = pd.DataFrame({"type": df["entityType"].astype(object), "id": df["hitID"].astype(object),
+                          "name": df["name"], "hitCount": df["hitCount"], "score": df["score"],
+                          "docID": df["docID"].astype(object).fillna('')})
+    keys = ["type", "id"]
+
+    summary = frame.groupby(keys, sort=False).agg(name=("name", "first"), hit_count=("hitCount", "sum"),
+                                                  max_relevance_score=("score", "max"))
+    docs = frame.drop_duplicates(keys + ["docID"]).groupby(keys, sort=False)["docID"].agg(list)
+    summary["doc_id"] = docs
+    summary["doc_count"] = docs.str.len()
+
+    summary = summary.reset_index()
+    summary.index = summary["type"] + '$' + summary["id"]
+    return summary[ENTITY_SUMMARY_COLUMNS].astype(object)
+
+
 def all_entities(termite_response):
     """
     Parses TERMite response and returns a list of VOCab modules with hits
 
-    :param termite_response: JSON or doc.JSONx TERMite response
+    :param termite_response: JSON or doc.JSONx TERMite response, or a TermiteResult
     :return: list
     """
-    payload = payload_records(termite_response)
-
-    entities_used = []
-    for entity_hit in payload:
-        if entity_hit['entityType'] not in entities_used:
-            entities_used.append(entity_hit['entityType'])
-
-    return (entities_used)
+    return _analyse(termite_response, 'entities')
 
 
 def all_entities_df(termite_response):
     """
     Parses JSON or doc.JSONx TERMite response into summary of hits dataframe
 
-    :param termite_response: JSON or doc.JSONx TERMite response
+    :param termite_response: JSON or doc.JSONx TERMite response, or a TermiteResult
     :return: pandas dataframe
     """
-
-    # identify all entitiy hit types in the text
-    entities_used = all_entities(termite_response)
-    entities_string = (',').join(entities_used)
-
-    if "RESP_MULTIDOC_PAYLOAD" in termite_response or "RESP_PAYLOAD" in termite_response:
-        filtered_hits = get_entity_hits_from_json(termite_response, entities_string)
-    else:
-        filtered_hits = get_entity_hits_from_docjsonx(termite_response, entities_string)
-
-    df = pd.DataFrame(filtered_hits).T
-
-    return (df)
+    return _analyse(termite_response, 'entity_summary')
 
 
 def entity_freq(termite_response):
     """
     Parses TERMite JSON or doc.JSONx response and returns dataframe of entity type frequencies
+    Documents streamed by execute(stream=True) are counted as they arrive, without building a dataframe
 
-    :param termite_response: JSON or doc.JSONx TERMite response
+    :param termite_response: JSON or doc.JSONx TERMite response, a TermiteResult, or a stream of documents
     :return: pandas dataframe
     """
+    if isinstance(termite_response, (dict, list, TermiteResult)):
+        return _analyse(termite_response, 'entity_freq')
+
+    counts = collections.Counter(record['entityType'] for record in iter_payload_records(termite_response))
+    values = pd.Series(counts, dtype='int64', name='count').sort_values(ascending=False, kind='stable')
+    values.index = pd.Index(values.index, dtype=object, name='entityType')
+    return pd.DataFrame(values)
 
-    df = get_termite_dataframe(termite_response)
 
-    values = pd.value_counts(df['entityType'])
-    values = pd.DataFrame(values)
-    return (values)
+TOP_HITS_COLUMNS = ["name", "realSynList", "totnosyns", "hitID"]
+AGGREGATED_TOP_HITS_COLUMNS = TOP_HITS_COLUMNS + ["entityType", "hitCount", "docCount"]
 
 
-def top_hits_df(termite_response, selection=10, entity_subset=None, include_docs=False):
+def top_hits_df(termite_response, selection=10, entity_subset=None, include_docs=False, aggregate=False):
     """
     Parses JSON or doc.JSONx TERMite response and returns a pandas dataframe of the most frequent hits. By default the
     top 10 most frequent hits are returned. The entity types to include can be set by a comma separated list
     For multidoc results the documents in which hits occur can be included
+    Only the top hits are selected, rather than sorting every hit. With aggregate, hit counts are totalled per entity
+    across documents first. Documents streamed by execute(stream=True) are processed incrementally, see TopHits
 
-    :param termite_response: JSON or doc.JSONx TERMite response
+    :param termite_response: JSON or doc.JSONx TERMite response, a TermiteResult, or a stream of documents
     :param selection: number of most frequent hits to return
     :param entity_subset: comma separated list
     :param include_docs: boolean
+    :param aggregate: if True return the entities with the highest total hit count over all documents
     :return: pandas dataframe
     """
+    if isinstance(termite_response, (dict, list, TermiteResult)):
+        return _analyse(termite_response, 'top_hits', selection=selection, entity_subset=entity_subset,
+                        include_docs=include_docs, aggregate=aggregate)
 
-    # get entity hits and sort by hit_count
-    df = get_termite_dataframe(termite_response)
-    df.sort_values(by=['hitCount'], ascending=False, inplace=True)
-    df2 = df.copy()
+    top_hits = TopHits(selection=selection, entity_subset=entity_subset, include_docs=include_docs,
+                       aggregate=aggregate)
+    top_hits.add(termite_response)
+    return top_hits.dataframe()
 
-    # select relevant columns and filtering
+
+def _top_hits_columns(include_docs, aggregate):
+    columns = AGGREGATED_TOP_HITS_COLUMNS if aggregate else TOP_HITS_COLUMNS
     if include_docs is True:
-        columns = [3, 5, 6, 2, 1]
-    else:
-        columns = [3, 5, 6, 2]
-    if entity_subset is not None:
-        entity_subset = entity_subset.replace(" ", "").split(",")
-        criteria = df2['entityType'].isin(entity_subset)
-        return (df2[criteria].iloc[0:selection, columns])
-    else:
-        return (df2.iloc[0:selection, columns])
+        columns = columns + ["docID"]
+    return columns
+
+
+def aggregate_hits(df):
+    """
+    Totals the hits of a get_termite_dataframe dataframe per entity across documents, in order of first appearance
+
+    :param df: dataframe of TERMite hits
+    :return: pandas dataframe with one row per entity, with the total hitCount, the number of documents as docCount and
+    the list of documents as docID
+    """
+    frame = df.assign(entityType=df["entityType"].astype(object), docID=df["docID"].astype(object))
+    grouped = frame.groupby(["entityType", "hitID"], sort=False)
+    aggregated = grouped.agg(name=("name", "first"), realSynList=("realSynList", "first"),
+                             totnosyns=("totnosyns", "first"), hitCount=("hitCount", "sum"))
+    docs = frame.drop_duplicates(["entityType", "hitID", "docID"]).groupby(["entityType", "hitID"], sort=False)
+    aggregated["docID"] = docs["docID"].agg(list)
+    aggregated["docCount"] = aggregated["docID"].str.len()
+    return aggregated.reset_index()
+
+
+def _analyse(termite_response, view, **kwargs):
+    """
+    Helper function. Compute a view of a response through TermiteResult. Cached views of an existing TermiteResult
+    are copied, so the caller can modify what it gets back.
+    """
+    if isinstance(termite_response, TermiteResult):
+        return copy.copy(getattr(termite_response, view)(**kwargs))
+    return getattr(TermiteResult(termite_response), view)(**kwargs)
+
+
+class TermiteResult():
+    """
+    Class wrapping a parsed JSON or doc.JSONx TERMite response, as returned by TermiteRequestBuilder.execute(result=True).
+    It can be indexed, iterated and searched like the response itself, which is available unchanged as raw (e.g. for
+    json.dump). The hit records, dataframe, entity summary, entity frequencies and top hits are computed on first use
+    and cached, so they are all derived from a single walk of the response. Cached views are returned as they are and
+    should be treated as read-only; the module level functions such as all_entities_df return copies
+    """
+
+    def __init__(self, raw):
+        """
+        :param raw: JSON or doc.JSONx TERMite response
+        """
+        self.raw = raw
+        self._views = {}
+
+    def _view(self, key, build):
+        if key not in self._views:
+            self._views[key] = build()
+        return self._views[key]
+
+    def records(self, reject_ambig=True, score_cutoff=0, remove_subsumed=True):
+        """
+        TERMite hit records, see payload_records
+
+        :param reject_ambig: boolean
+        :param score_cutoff: a numerical value between 1-5
+        :param remove_subsumed: boolean
+        :return: list of TERMite hit records
+        """
+        return self._view(('records', reject_ambig, score_cutoff, remove_subsumed),
+                          lambda: payload_records(self.raw, reject_ambig=reject_ambig, score_cutoff=score_cutoff,
+                                                  remove_subsumed=remove_subsumed))
+
+    def dataframe(self, cols_to_add="", reject_ambig=True, score_cutoff=0, remove_subsumed=True):
+        """
+        Dataframe of TERMite hits, see get_termite_dataframe
+
+        :param cols_to_add: comma separated list of additional fields to include
+        :param reject_ambig: boolean
+        :param score_cutoff: a numerical value between 1-5
+        :param remove_subsumed: boolean
+        :return: dataframe of TERMite hits
+        """
+        records = self.records(reject_ambig=reject_ambig, score_cutoff=score_cutoff, remove_subsumed=remove_subsumed)
+        return self._view(('dataframe', cols_to_add, reject_ambig, score_cutoff, remove_subsumed),
+                          lambda: records_to_dataframe(records, cols_to_add=cols_to_add))
+
+    def entities(self):
+        """
+        Entity types with hits, in order of first appearance, see all_entities
+
+        :return: list
+        """
+        return self._view(('entities',), self._entities)
+
+    def _entities(self):
+        # dictionary keys as an ordered set of the entity types seen
+        return list(dict.fromkeys(entity_hit['entityType'] for entity_hit in self.records()))
+
+    def entity_summary(self):
+        """
+        Summary of hits per entity, see all_entities_df. Large responses are summarised with a pandas groupby over
+        the cached dataframe
+
+        :return: pandas dataframe
+        """
+        return self._view(('entity_summary',), self._entity_summary)
+
+    def _entity_summary(self):
+        records = self.records()
+        if len(records) >= GROUPBY_THRESHOLD:
+            return entity_summary_from_dataframe(self.dataframe())
+        return pd.DataFrame(entity_hits_from_records(records)).T
+
+    def entity_freq(self):
+        """
+        Frequency of each entity type, see entity_freq
+
+        :return: pandas dataframe
+        """
+        return self._view(('entity_freq',), self._entity_freq)
+
+    def _entity_freq(self):
+        counts = self.dataframe()['entityType'].value_counts()
+        # entityType is categorical in the dataframe, the frequencies are indexed by plain entity type names
+        counts.index = counts.index.astype(object)
+        return pd.DataFrame(counts)
+
+    def top_hits(self, selection=10, entity_subset=None, include_docs=False, aggregate=False):
+        """
+        The most frequent hits, see top_hits_df
+
+        :param selection: number of most frequent hits to return
+        :param entity_subset: comma separated list
+        :param include_docs: boolean
+        :param aggregate: if True return the entities with the highest total hit count over all documents
+        :return: pandas dataframe
+        """
+        return self._view(('top_hits', selection, entity_subset, include_docs, aggregate),
+                          lambda: self._top_hits(selection, entity_subset, include_docs, aggregate))
+
+    def _top_hits(self, selection, entity_subset, include_docs, aggregate):
+        # selected straight from the records, so the hit dataframe is never built just to pick a few rows from it
+        top_hits = TopHits(selection=selection, entity_subset=entity_subset, include_docs=include_docs,
+                           aggregate=aggregate)
+        top_hits.add_records(self.records())
+        return top_hits.dataframe()
+
+    def __getattr__(self, name):
+        # methods of the raw response, e.g. keys() or items(), are available on the result
+        if name.startswith('__') or name in ('raw', '_views'):
+            raise AttributeError(name)
+        return getattr(self.raw, name)
+
+    def __getitem__(self, key):
+        return self.raw[key]
+
+    def __contains__(self, key):
+        return key in self.raw
+
+    def __iter__(self):
+        return iter(self.raw)
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __eq__(self, other):
+        if isinstance(other, TermiteResult):
+            other = other.raw
+        return self.raw == other
+
+    __hash__ = None
+
+    def __reduce__(self):
+        # cached views are not pickled, only the response
+        return (TermiteResult, (self.raw,))
+
+    def __repr__(self):
+        return 'TermiteResult(%r)' % (self.raw,)
+
+
+class TopHits():
+    """
+    Class selecting the most frequent hits from a stream of TERMite responses or documents, with the same output as
+    top_hits_df. Only the current top hits are kept, in a heap, so memory does not grow with the number of hits; with
+    aggregate a running total is kept per entity instead
+    """
+
+    def __init__(self, selection=10, entity_subset=None, include_docs=False, aggregate=False):
+        """
+        :param selection: number of most frequent hits to return
+        :param entity_subset: comma separated list
+        :param include_docs: boolean
+        :param aggregate: if True select the entities with the highest total hit count over all documents
+        """
+        self.selection = selection
+        self.entity_subset = None if entity_subset is None else set(entity_subset.replace(" ", "").split(","))
+        self.include_docs = include_docs
+        self.aggregate = aggregate
+        self.columns = _top_hits_columns(include_docs, aggregate)
+        self._heap = []
+        self._totals = {}
+        self._counter = itertools.count()
+        self._batches = itertools.count()
+
+    def add(self, termite_response):
+        """
+        Add the hits of a response, see iter_payload_records for the accepted formats
+
+        :param termite_response: JSON or doc.JSONx TERMite response, a TermiteResult, or a stream of documents
+        """
+        if isinstance(termite_response, (dict, list, TermiteResult)):
+            self.add_records(iter_payload_records(termite_response))
+            return
+        # each streamed document is added on its own, so those without a docID are still counted separately
+        for doc in termite_response:
+            self.add_records(iter_payload_records(iter([doc])))
+
+    def add_records(self, records):
+        """
+        Add TERMite hit records
+
+        :param records: iterable of TERMite hit records, those without a docID are counted as one document
+        """
+        # records without a docID are told apart from those of other calls by the number of the call
+        anonymous_doc = (None, next(self._batches))
+        entity_subset = self.entity_subset
+        if self.aggregate:
+            for record in records:
+                if entity_subset is None or record['entityType'] in entity_subset:
+                    self._add_total(record, anonymous_doc)
+            return
+
+        # the sort key is read once per record, the output columns only for records that enter the heap
+        heap, selection, counter, columns = self._heap, self.selection, self._counter, self.columns
+        for record in records:
+            if entity_subset is not None and record['entityType'] not in entity_subset:
+                continue
+            # ties are broken in favour of the earlier hit
+            key = (record['hitCount'], -next(counter))
+            if len(heap) < selection:
+                heapq.heappush(heap, (key, [record.get(col) for col in columns]))
+            elif heap and key > heap[0][0]:
+                heapq.heapreplace(heap, (key, [record.get(col) for col in columns]))
+
+    def _add_total(self, record, anonymous_doc):
+        entity_id = (record['entityType'], record['hitID'])
+        doc_id = record.get('docID')
+        doc_key = anonymous_doc if doc_id is None else doc_id
+        total = self._totals.get(entity_id)
+        if total is None:
+            total = self._totals[entity_id] = {"name": record['name'], "realSynList": record.get('realSynList'),
+                                               "totnosyns": record.get('totnosyns'), "hitID": record['hitID'],
+                                               "entityType": record['entityType'], "hitCount": 0, "docCount": 0,
+                                               "docID": [], "_docs": set()}
+        total["hitCount"] += record['hitCount']
+        if doc_key not in total["_docs"]:
+            total["_docs"].add(doc_key)
+            total["docCount"] += 1
+            if self.include_docs is True:
+                total["docID"].append(doc_id)
+
+    def dataframe(self):
+        """
+        The most frequent hits added so far
+
+        :return: pandas dataframe
+        """
+        if self.aggregate:
+            totals = heapq.nlargest(self.selection, self._totals.values(), key=lambda total: total["hitCount"])
+            rows = [[total[col] for col in self.columns] for total in totals]
+        else:
+            rows = [row for key, row in sorted(self._heap, key=lambda entry: entry[0], reverse=True)]
+        return pd.DataFrame(rows, columns=self.columns)
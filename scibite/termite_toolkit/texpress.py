@@ -16,10 +16,17 @@ __version__ = '0.2'
 __copyright__ = '(c) 2019, SciBite Ltd'
 __license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
 
-import requests
+import json
 import os
 import pandas as pd
 
+from termite_toolkit.exceptions import TermiteHTTPError
+from termite_toolkit.parallel import bounded_map
+from termite_toolkit.records import RecordView
+from termite_toolkit.session import HttpSession, get_default_session
+from termite_toolkit.streaming import iter_response_documents
+from termite_toolkit.upload import MultipartStream, zip_documents
+
 
 class TexpressRequestBuilder():
     """
@@ -34,6 +41,8 @@ class TexpressRequestBuilder():
         self.binary_content = None
         self.basic_auth = ()
         self.verify_request = True
+        self.session = None
+        self.cache = None
 
     def set_basic_auth(self, username='', password='', verification=True):
         """
@@ -55,16 +64,42 @@ class TexpressRequestBuilder():
         """
         self.url = url
 
+    def set_session(self, session):
+        """
+        Bind the builder to a shared HttpSession so that connections are pooled and kept alive between requests
+
+        :param session: termite_toolkit.session.HttpSession instance
+        """
+        self.session = session
+
+    def set_cache(self, cache):
+        """
+        Bind the builder to a ResponseCache so that repeated identical requests are answered locally
+
+        :param cache: termite_toolkit.cache.ResponseCache instance
+        """
+        self.cache = cache
+
     def set_binary_content(self, input_file_path):
         """
         For annotating file content, send file path string and process file as a binary
         multiple files of the same type can be scanned at once if placed in a zip archive
-        
+        the file is only opened while the request is being sent, and is streamed from disk rather than read into memory
+
         :param input_file_path: file path to the file to be sent to TERMite
         """
-        file_obj = open(input_file_path, 'rb')
+        self.input_file_path = input_file_path
         file_name = os.path.basename(input_file_path)
-        self.binary_content = {"binary": (file_name, file_obj)}
+        self.binary_content = {"binary": (file_name, input_file_path)}
+
+    def set_binary_data(self, data, file_name):
+        """
+        For annotating content that is already in memory, e.g. a zip archive built with upload.zip_documents()
+
+        :param data: bytes or binary file object to be sent to TERMite
+        :param file_name: file name reported to TERMite, its extension should match the content e.g. docs.zip
+        """
+        self.binary_content = {"binary": (file_name, data)}
 
     def set_text(self, string):
         """
@@ -163,29 +198,62 @@ class TexpressRequestBuilder():
         input = bool_to_string(bool)
         self.payload["noEmpty"] = input
 
-    def execute(self, display_request=False, return_text=False):
+    def execute(self, display_request=False, return_text=False, timeout=None, stream=False):
         """
         Once all settings are done, POST the parameters to the TERMite RESTful API
+        Failed requests are retried according to the session's RetryPolicy, see termite_toolkit.session
 
         :param display_request: if True request will be printed out before being submitted
+        :param return_text: if True return the raw response text rather than parsed JSON
+        :param timeout: timeout in seconds for this request, overriding the session default
+        :param stream: if True return a generator that parses the JSON response incrementally as it is downloaded and
+        yields one document at a time, see termite_toolkit.streaming.iter_json_documents
         :return: request response
+        :raises TermiteConnectionError: if TERMite could not be reached
+        :raises TermiteHTTPError: if TERMite answered with an error status
+        :raises CircuitOpenError: if the session's circuit breaker is open
         """
         if display_request:
             print("REQUEST: ", self.url, self.payload)
-        try:
-            if self.binary_content and bool(self.basic_auth):
-                response = requests.post(self.url, data=self.payload, files=self.binary_content, auth=self.basic_auth,
-                                         verify=self.verify_request)
-            elif self.binary_content and bool(self.basic_auth) == False:
-                response = requests.post(self.url, data=self.payload, files=self.binary_content)
-            elif not self.binary_content and bool(self.basic_auth):
-                response = requests.post(self.url, data=self.payload, verify=self.verify_request, auth=self.basic_auth)
-            else:
-                response = requests.post(self.url, data=self.payload)
-        except Exception as e:
-            return print(
-                "Failed with the following error {}\n\nPlease check that TERMite can be accessed via the following URL {}\nAnd that the necessary credentials have been provided (done so using the set_basic_auth() function)".format(
-                    e, self.url))
+        if stream and (self.payload["output"] not in ["json", "doc.json", "doc.jsonx"] or return_text):
+            raise ValueError('Only JSON, doc.JSON or doc.JSONx responses can be streamed')
+        cache_key = None
+        if self.cache is not None and not stream:
+            user = self.basic_auth[0] if self.basic_auth else None
+            cache_key = self.cache.key(self.url, self.payload, self.binary_content, user)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                if self.payload["output"] in ["json", "doc.json", "doc.jsonx"] and not return_text:
+                    return json.loads(cached)
+                return cached
+
+        session = self.session if self.session is not None else get_default_session()
+        request_kwargs = {"data": self.payload}
+        if bool(self.basic_auth):
+            request_kwargs["auth"] = self.basic_auth
+            request_kwargs["verify"] = self.verify_request
+        if self.binary_content:
+            with MultipartStream(self.payload, self.binary_content) as body:
+                request_kwargs["data"] = body
+                request_kwargs["headers"] = {"Content-Type": body.content_type}
+                response = session.post(self.url, timeout=timeout, stream=stream, **request_kwargs)
+        else:
+            response = session.post(self.url, timeout=timeout, stream=stream, **request_kwargs)
+
+        if not response.ok:
+            if stream:
+                # the body of a streamed response is never read, release the connection rather than leak it
+                response.close()
+            raise TermiteHTTPError(
+                "TERMite returned HTTP {} {} for {}\n\nPlease check that the necessary credentials have been provided (done so using the set_basic_auth() function)".format(
+                    response.status_code, response.reason, self.url), url=self.url, status_code=response.status_code,
+                response=response)
+
+        if stream:
+            return iter_response_documents(response)
+
+        if cache_key is not None:
+            self.cache.set(cache_key, response.text)
 
         if self.payload["output"] in ["json", "doc.json", "doc.jsonx"] and not return_text:
             return response.json()
@@ -288,16 +356,18 @@ def bool_to_string(bool):
     return string
 
 
-def annotate_files(url, input_file_path, options_dict):
+def annotate_files(url, input_file_path, options_dict, session=None):
     """
     Wrapper function to execute a TExpress request for annotating individual files or a zip archive
     
     :param url: url of TERMite instance
     :param input_file_path: path to file to be annotated
     :param options_dict: dictionary of options to be used during annotation
+    :param session: optional HttpSession to send the request over
     """
     t = TexpressRequestBuilder()
     t.set_url(url)
+    t.set_session(session)
     t.set_binary_content(input_file_path)
     t.set_options(options_dict)
     result = t.execute()
@@ -305,16 +375,39 @@ def annotate_files(url, input_file_path, options_dict):
     return result
 
 
-def annotate_text(url, text, options_dict):
+def annotate_documents(url, documents, options_dict, session=None):
+    """
+    Wrapper function to execute a TExpress request for annotating in-memory documents, which are packed into a zip
+    archive without touching disk
+
+    :param url: url of TERMite instance
+    :param documents: iterable of (file_name, content) pairs, or of plain strings
+    :param options_dict: dictionary of options to be used during annotation
+    :param session: optional HttpSession to send the request over
+    :return: result of request
+    """
+    t = TexpressRequestBuilder()
+    t.set_url(url)
+    t.set_session(session)
+    t.set_binary_data(zip_documents(documents), 'documents.zip')
+    t.set_options(options_dict)
+    result = t.execute()
+
+    return result
+
+
+def annotate_text(url, text, options_dict, session=None):
     """
     Wrapper function to execute a TExpress request for annotating strings of text
     
     :param url: url of TERMite instance
     :param text: text to be annotated
     :param options_dict: dictionary of options to be used during annotation
+    :param session: optional HttpSession to send the request over
     """
     t = TexpressRequestBuilder()
     t.set_url(url)
+    t.set_session(session)
     t.set_text(text)
     t.set_options(options_dict)
     result = t.execute()
@@ -322,6 +415,37 @@ def annotate_text(url, text, options_dict):
     return result
 
 
+def annotate_many(url, texts, options_dict, max_workers=4, max_in_flight=None, ordered=True, session=None):
+    """
+    Wrapper function to execute TExpress requests for pattern searching many strings of text concurrently.
+    Texts are consumed lazily and at most max_in_flight requests are outstanding at once, so memory stays flat
+    however large the input iterable is
+
+    :param url: url of TERMite instance
+    :param texts: iterable of texts to be annotated
+    :param options_dict: dictionary of options to be used during annotation
+    :param max_workers: number of requests sent in parallel
+    :param max_in_flight: maximum number of texts submitted but not yet yielded, defaults to twice max_workers
+    :param ordered: if True yield results in input order, otherwise yield (index, result) tuples as they complete
+    :param session: optional HttpSession to send the requests over, by default one sized to max_workers is used
+    :return: generator of results
+    """
+    owns_session = session is None
+    if owns_session:
+        session = HttpSession(pool_maxsize=max_workers)
+
+    def annotate(text):
+        return annotate_text(url, text, options_dict, session=session)
+
+    try:
+        for result in bounded_map(annotate, texts, max_workers=max_workers, max_in_flight=max_in_flight,
+                                  ordered=ordered):
+            yield result
+    finally:
+        if owns_session:
+            session.close()
+
+
 def process_payload(texpress_hits, response_payload, doc_id='', score_cutoff=0,
                     remove_subsumed=True):
     """
@@ -389,9 +513,15 @@ def get_entity_hits_from_json(termite_json_response, score_cutoff=0):
 #   v
 ######
 
+JSON_HIDDEN_KEYS = frozenset(['matches', 'meta'])
+DOCJSONX_HIDDEN_KEYS = frozenset(['matches', 'texpressTags'])
+
+
 def json_resp_records(json_resp_texpress, remove_subsumed=True):
     """
     parses JSON RESP_TEXPRESS into records, includes filter to remove subsumed hits.
+    Each record is a RecordView of the match with its docID, patternID, pattern hit fields and meta fields layered
+    over it, the response itself is not modified
 
     :param remove_subsumed: remove the subsumed hits
     :param json_resp_texpress: RESP_TEXPRESS of TExpress JSON response
@@ -401,23 +531,15 @@ def json_resp_records(json_resp_texpress, remove_subsumed=True):
     hits = []
     for docID, patterns in json_resp_texpress.items():
         for pattern_id, pattern_matches in patterns.items():
-            if len(pattern_matches) is not 0:
-                for pattern_hits in pattern_matches:
-                    for match in pattern_hits['matches']:
-                        match['docID'] = docID
-                        match['patternID'] = pattern_id
-                        for x in pattern_hits:
-                            if x == "matches":
-                                continue
-                            elif x == "meta":
-                                for k, v in pattern_hits[x].items():
-                                    match[k] = v
-                            else:
-                                match[x] = pattern_hits[x]
-                        if remove_subsumed is True and match['subsumed'] is True:
-                            continue
-                        else:
-                            hits.append(match)
+            ids = {'docID': docID, 'patternID': pattern_id}
+            for pattern_hits in pattern_matches:
+                meta = pattern_hits.get('meta', {})
+                for match in pattern_hits['matches']:
+                    record = RecordView((pattern_hits, meta, ids, match), JSON_HIDDEN_KEYS)
+                    if remove_subsumed is True and record['subsumed'] is True:
+                        continue
+                    else:
+                        hits.append(record)
 
     return (hits)
 
@@ -425,6 +547,8 @@ def json_resp_records(json_resp_texpress, remove_subsumed=True):
 def docjsonx_records(docjsonx_response, remove_subsumed=True):
     """
     Parses doc.JSONx TExpress into records, includes filter to remove subsumed hits
+    Each record is a RecordView of the match with its patternID, pattern hit fields and document fields layered over
+    it, the response itself is not modified
 
     :param docjsonx_response: TExpress doc.JSONx response
     :param remove_subsumed: boolean
@@ -434,18 +558,14 @@ def docjsonx_records(docjsonx_response, remove_subsumed=True):
     hits = []
     for doc in docjsonx_response:
         for patternID, pattern_matches in doc['texpressTags'].items():
-            if len(pattern_matches) is not 0:
-                for pattern_hits in pattern_matches:
-                    for match in pattern_hits['matches']:
-                        match['patternID'] = patternID
-                        match.update(pattern_hits)
-                        match.update(doc)
-                        del (match['matches'])
-                        del (match['texpressTags'])
-                        if remove_subsumed is True and match['subsumed'] is True:
-                            continue
-                        else:
-                            hits.append(match)
+            ids = {'patternID': patternID}
+            for pattern_hits in pattern_matches:
+                for match in pattern_hits['matches']:
+                    record = RecordView((doc, pattern_hits, ids, match), DOCJSONX_HIDDEN_KEYS)
+                    if remove_subsumed is True and record['subsumed'] is True:
+                        continue
+                    else:
+                        hits.append(record)
 
     return (hits)
 
@@ -454,19 +574,29 @@ def texpress_records(texpress_response, remove_subsumed=True):
     """
     Parses TExpress JSON or doc.JSONx response into records, with filtering to remove subsumed hits
 
-    :param texpress_response: TExpress JSON of doc.JSONx response
+    :param texpress_response: TExpress JSON or doc.JSONx response, or the documents streamed by execute(stream=True)
     :param remove_subsumed: boolean
     :return: records of TExpress hits
     """
 
-    if 'RESP_TEXPRESS' in texpress_response:
-        records = json_resp_records(texpress_response['RESP_TEXPRESS'], remove_subsumed=remove_subsumed)
-    else:
+    if isinstance(texpress_response, dict):
+        records = json_resp_records(texpress_response.get('RESP_TEXPRESS', {}), remove_subsumed=remove_subsumed)
+    elif isinstance(texpress_response, list):
         records = docjsonx_records(texpress_response, remove_subsumed=remove_subsumed)
+    else:
+        # documents streamed by execute(stream=True)
+        records = []
+        for doc in texpress_response:
+            records.extend(texpress_records(doc if isinstance(doc, dict) and 'RESP_TEXPRESS' in doc else [doc],
+                                            remove_subsumed=remove_subsumed))
 
     return (records)
 
 
+TEXPRESS_DATAFRAME_COLUMNS = ["docID", "patternID", "originalFragment", "matchEntities", "originalSentence",
+                              "sentence", "subsumed"]
+
+
 def get_texpress_dataframe(texpress_response, cols_to_add="", remove_subsumed=True):
     """
     Get a dataframe from TEXpress response
@@ -480,8 +610,7 @@ def get_texpress_dataframe(texpress_response, cols_to_add="", remove_subsumed=Tr
     texpressRecords = texpress_records(texpress_response, remove_subsumed=remove_subsumed)
     df = pd.DataFrame(texpressRecords)
 
-    cols = ["docID", "patternID", "originalFragment", "matchEntities", "originalSentence",
-            "sentence", "subsumed"]
+    cols = list(TEXPRESS_DATAFRAME_COLUMNS)
 
     if cols_to_add:
         cols_to_add = cols_to_add.replace(" ", "").split(",")
@@ -0,0 +1,155 @@
+"""
+
+  ____       _ ____  _ _         _____ _____ ____  __  __ _ _         _____           _ _    _ _
+ / ___|  ___(_) __ )(_) |_ ___  |_   _| ____|  _ \|  \/  (_) |_ ___  |_   _|__   ___ | | | _(_) |_
+ \___ \ / __| |  _ \| | __/ _ \   | | |  _| | |_) | |\/| | | __/ _ \   | |/ _ \ / _ \| | |/ / | __|
+  ___) | (__| | |_) | | ||  __/   | | | |___|  _ <| |  | | | ||  __/   | | (_) | (_) | |   <| | |_
+ |____/ \___|_|____/|_|\__\___|   |_| |_____|_| \_\_|  |_|_|\__\___|   |_|\___/ \___/|_|_|\_\_|\__|
+
+
+Upload helpers- streaming multipart request bodies and in-memory zip archives.
+
+"""
+
+__author__ = 'SciBite DataScience'
+__version__ = '0.2'
+__copyright__ = '(c) 2019, SciBite Ltd'
+__license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
+
+import io
+import os
+import uuid
+import zipfile
+
+CHUNK_SIZE = 64 * 1024
+
+
+def zip_documents(documents, compression=zipfile.ZIP_DEFLATED):
+    """
+    Build a zip archive in memory from an iterable of documents, without touching disk
+
+    :param documents: iterable of (file_name, content) pairs, or of plain strings which are named 0.txt, 1.txt, ...
+    content may be str or bytes
+    :param compression: zipfile compression method
+    :return: zip archive as bytes
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression) as archive:
+        for idx, document in enumerate(documents):
+            if isinstance(document, (str, bytes)):
+                file_name, content = '%d.txt' % idx, document
+            else:
+                file_name, content = document
+            archive.writestr(file_name, content)
+    return buffer.getvalue()
+
+
+def _quote(value):
+    """
+    Helper function. Escape a form field or file name for use in a Content-Disposition header.
+    """
+    return str(value).replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
+
+
+def _source_size(source):
+    """
+    Helper function. Number of bytes that will be read from a file source.
+
+    :param source: file path, bytes or binary file object, read from its current position
+    :return: size in bytes
+    """
+    if isinstance(source, (bytes, bytearray)):
+        return len(source)
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    position = source.tell()
+    size = source.seek(0, os.SEEK_END) - position
+    source.seek(position)
+    return size
+
+
+class MultipartStream():
+    """
+    Class producing a multipart/form-data request body chunk by chunk, so file content is streamed from disk rather
+    than loaded into memory. The body length is known up front so no chunked transfer encoding is needed, and the
+    stream can be iterated again, e.g. when a request is retried. Files opened from a path are closed after each pass
+    """
+
+    def __init__(self, fields, files, chunk_size=CHUNK_SIZE):
+        """
+        :param fields: dictionary of form fields
+        :param files: dictionary of {field_name: (file_name, source)}, where source is a file path, bytes or a binary
+        file object
+        :param chunk_size: number of bytes read from file sources at a time
+        """
+        self.boundary = uuid.uuid4().hex
+        self.chunk_size = chunk_size
+        self.content_type = 'multipart/form-data; boundary=%s' % self.boundary
+        self._open_files = []
+
+        self._parts = []
+        self._closing = ('--%s--\r\n' % self.boundary).encode('utf-8')
+        self._length = len(self._closing)
+        for name, value in fields.items():
+            header = ('--%s\r\nContent-Disposition: form-data; name="%s"\r\n\r\n' % (self.boundary, _quote(name))
+                      ).encode('utf-8')
+            body = str(value).encode('utf-8')
+            self._parts.append((header, body))
+            self._length += len(header) + len(body) + 2
+        for name, (file_name, source) in (files or {}).items():
+            header = ('--%s\r\nContent-Disposition: form-data; name="%s"; filename="%s"\r\n'
+                      'Content-Type: application/octet-stream\r\n\r\n' % (self.boundary, _quote(name),
+                                                                           _quote(file_name))).encode('utf-8')
+            start = None if isinstance(source, (bytes, bytearray, str, os.PathLike)) else source.tell()
+            self._parts.append((header, (source, start)))
+            self._length += len(header) + _source_size(source) + 2
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        for header, body in self._parts:
+            yield header
+            if isinstance(body, bytes):
+                yield body
+            else:
+                for chunk in self._read(*body):
+                    yield chunk
+            yield b'\r\n'
+        yield self._closing
+
+    def _read(self, source, start):
+        if isinstance(source, (bytes, bytearray)):
+            for offset in range(0, len(source), self.chunk_size):
+                yield bytes(source[offset:offset + self.chunk_size])
+            return
+        if isinstance(source, (str, os.PathLike)):
+            file_obj = open(source, 'rb')
+            self._open_files.append(file_obj)
+        else:
+            file_obj = source
+            file_obj.seek(start)
+        try:
+            while True:
+                chunk = file_obj.read(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            if file_obj is not source:
+                file_obj.close()
+                if file_obj in self._open_files:
+                    self._open_files.remove(file_obj)
+
+    def close(self):
+        """
+        Close any files this stream opened, e.g. if a request was abandoned part way through the upload
+        """
+        while self._open_files:
+            self._open_files.pop().close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -16,7 +16,14 @@ __version__ = '0.2'
 __copyright__ = '(c) 2019, SciBite Ltd'
 __license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
 
-import requests
+import copy
+import json
+
+import pandas as pd
+
+from termite_toolkit.exceptions import TermiteError
+from termite_toolkit.parallel import bounded_map
+from termite_toolkit.session import HttpSession, get_default_session
 
 
 class UtilitiesRequestBuilder():
@@ -28,6 +35,8 @@ class UtilitiesRequestBuilder():
         self.url = 'http://localhost:9090/termite'
         self.basic_auth = ()
         self.verify_request = True
+        self.session = None
+        self.cache = None
 
     def set_url(self, url):
         """
@@ -48,6 +57,36 @@ class UtilitiesRequestBuilder():
         self.basic_auth = (username, password)
         self.verify_request = verification
 
+    def set_session(self, session):
+        """
+        Bind the builder to a shared HttpSession so that connections are pooled and kept alive between requests
+
+        :param session: termite_toolkit.session.HttpSession instance
+        """
+        self.session = session
+
+    def set_cache(self, cache):
+        """
+        Bind the builder to an in-memory cache so repeated get_entity and call_autocomplete lookups are answered
+        without a request. The response text is cached and parsed again on every hit, so each caller gets its own
+        copy and changing it does not change what later callers get
+
+        :param cache: termite_toolkit.cache.LRUCache instance
+        """
+        self.cache = cache
+
+    def _request_kwargs(self):
+        """
+        Helper function. Collect the keyword arguments shared by every utility request.
+
+        :return: dictionary of keyword arguments
+        """
+        request_kwargs = {}
+        if bool(self.basic_auth):
+            request_kwargs["auth"] = self.basic_auth
+            request_kwargs["verify"] = self.verify_request
+        return request_kwargs
+
     def call_autocomplete(self, input, vocab, taxon=''):
         """
         Complete a call to the auto complete API
@@ -59,12 +98,21 @@ class UtilitiesRequestBuilder():
 
         if len(input) < 3:
             return 'Please provide a string longer than 3 chars..'
-        response = requests.post(("%s/toolkit/autocomplete.api" % self.url),
-                                 data={"term": input, "e": vocab, "limit": taxon})
+        cache_key = ('autocomplete', self.url, self.basic_auth[0] if self.basic_auth else None, input, vocab, taxon)
+        if self.cache is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return json.loads(cached)
+
+        session = self.session if self.session is not None else get_default_session()
+        response = session.post(("%s/toolkit/autocomplete.api" % self.url),
+                                data={"term": input, "e": vocab, "limit": taxon}, **self._request_kwargs())
 
         if response.ok:
-            ac_json = response.json()
-            return ac_json
+            result = response.json()
+            if self.cache is not None:
+                self.cache.set(cache_key, response.text)
+            return result
 
         else:
             return response.status_code
@@ -78,26 +126,34 @@ class UtilitiesRequestBuilder():
         :param entity_type: type of entity of interest
         :return: request response
         """
+        cache_key = ('describe', self.url, self.basic_auth[0] if self.basic_auth else None, entity_type, entity_id)
+        if self.cache is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return json.loads(cached)
+
         url = ("%s/toolkit/tool.api?t=describe&id=%s:%s" % (self.url, entity_type, entity_id))
-        response = requests.get(url)
+        session = self.session if self.session is not None else get_default_session()
+        response = session.get(url, **self._request_kwargs())
 
         if response.ok:
-            entity_json = response.json()
-            return entity_json
+            result = response.json()
+            if self.cache is not None:
+                self.cache.set(cache_key, response.text)
+            return result
 
         else:
             return response.status_code
 
-    def get_entity_details(self, entity_id, entity_type):
+    def _describe(self, entity_id, entity_type):
         """
-        Returns a subset of metadata from the get_entity result: ID, name, mappings to external IDs
-
-        :param entity_id: id of entity of interest
-        :param entity_type: type of entity of interest
-        :return: entity details
+        Helper function. Look up an entity, returning its details and the HTTP status of the lookup.
         """
         details = {"id": entity_id, "type": entity_type, "name": "", "mappings": []}
         entity_meta = self.get_entity(entity_id, entity_type)
+        if not isinstance(entity_meta, dict):
+            # get_entity returns the status code of a failed lookup
+            return details, entity_meta
         if len(entity_meta["TOOL_RESULT"]) > 0:
             e = entity_meta["TOOL_RESULT"][0]
             details["name"] = e["name"]
@@ -107,4 +163,53 @@ class UtilitiesRequestBuilder():
                     items = m.split('|')
                     details["mappings"].append(items)
 
+        return details, 200
+
+    def get_entity_details(self, entity_id, entity_type):
+        """
+        Returns a subset of metadata from the get_entity result: ID, name, mappings to external IDs
+
+        :param entity_id: id of entity of interest
+        :param entity_type: type of entity of interest
+        :return: entity details, with an empty name and mappings if the lookup failed
+        """
+        details, _ = self._describe(entity_id, entity_type)
         return details
+
+    def get_entities_details(self, entities, max_workers=8):
+        """
+        Bulk version of get_entity_details. Duplicate entities are looked up once and lookups run concurrently over a
+        connection pool, answered from the cache bound with set_cache() where possible. A failed lookup does not stop
+        the others: its row has an empty name and mappings, and its status is the HTTP status code of the lookup, or
+        None if no response was received or the response did not describe the entity.
+        e.g. to describe every hit in a summary: get_entities_details(zip(df['type'], df['id'])) for df from
+        termite.all_entities_df()
+
+        :param entities: iterable of (entity_type, entity_id) pairs
+        :param max_workers: number of lookups sent in parallel
+        :return: pandas dataframe with id, type, name, mappings and status columns, one row per distinct entity
+        """
+        unique_entities = list(dict.fromkeys((entity_type, entity_id) for entity_type, entity_id in entities))
+
+        builder = copy.copy(self)
+        owns_session = self.session is None
+        if owns_session:
+            builder.session = HttpSession(pool_maxsize=max_workers)
+
+        def describe(entity):
+            entity_type, entity_id = entity
+            try:
+                details, status = builder._describe(entity_id, entity_type)
+            except (TermiteError, ValueError, KeyError):
+                # no response, or a response without the entity description, fails this row only
+                details, status = {"id": entity_id, "type": entity_type, "name": "", "mappings": []}, None
+            details["status"] = status
+            return details
+
+        try:
+            details = list(bounded_map(describe, unique_entities, max_workers=max_workers))
+        finally:
+            if owns_session:
+                builder.session.close()
+
+        return pd.DataFrame(details, columns=["id", "type", "name", "mappings", "status"])
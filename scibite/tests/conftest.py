@@ -0,0 +1,58 @@
+import inspect
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+@pytest.fixture
+def http_server():
+    """
+    Start local HTTP servers answering every request with respond(method, path), which returns (status, body).
+    A respond taking a third argument is also passed the body of the request it answers.
+    The body of every request received is appended to start.request_bodies, and the client address it came from to
+    start.request_clients, so distinct addresses are distinct connections
+    """
+    servers = []
+    request_bodies = []
+    request_clients = []
+
+    def start(respond):
+        with_body = len(inspect.signature(respond).parameters) == 3
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _answer(self):
+                length = int(self.headers.get('Content-Length', 0))
+                request_body = self.rfile.read(length) if length else b''
+                request_bodies.append(request_body)
+                request_clients.append(self.client_address)
+                if with_body:
+                    status, body = respond(self.command, self.path, request_body)
+                else:
+                    status, body = respond(self.command, self.path)
+                body = json.dumps(body).encode() if body is not None else b''
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST = _answer
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return 'http://127.0.0.1:%d/termite' % server.server_address[1]
+
+    start.request_bodies = request_bodies
+    start.request_clients = request_clients
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
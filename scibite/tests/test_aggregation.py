@@ -0,0 +1,89 @@
+import pytest
+
+from termite_toolkit.aggregation import CorpusAggregator, BitMap
+from termite_toolkit.termite import all_entities_df
+
+
+def hit(hit_id, hit_count=1, score=3, doc_id=None):
+    record = {'entityType': 'GENE', 'hitID': hit_id, 'name': hit_id, 'score': score, 'hitCount': hit_count,
+              'nonambigsyns': 1, 'subsume': [False]}
+    if doc_id is not None:
+        record['docID'] = doc_id
+    return record
+
+
+def single_doc_response(*hits):
+    return {'RESP_PAYLOAD': {'GENE': list(hits)}}
+
+
+BITMAP_OPTIONS = [False] + ([True] if BitMap is not None else [])
+
+
+@pytest.mark.parametrize('use_bitmaps', BITMAP_OPTIONS)
+def test_single_document_responses_are_separate_documents(use_bitmaps):
+    aggregator = CorpusAggregator(use_bitmaps=use_bitmaps)
+    aggregator.absorb(single_doc_response(hit('BRCA1'), hit('TP53', score=4)))
+    aggregator.absorb(single_doc_response(hit('BRCA1', hit_count=2, score=5)))
+    aggregator.absorb(single_doc_response(hit('TP53')))
+
+    df = aggregator.to_dataframe()
+    assert aggregator.doc_count == 3
+    assert df.loc['GENE$BRCA1', 'hit_count'] == 3
+    assert df.loc['GENE$BRCA1', 'doc_count'] == 2
+    assert df.loc['GENE$BRCA1', 'max_relevance_score'] == 5
+    assert df.loc['GENE$TP53', 'doc_count'] == 2
+
+
+def test_anonymous_documents_match_all_entities_df():
+    response = single_doc_response(hit('BRCA1', hit_count=2), hit('TP53', score=4))
+    aggregator = CorpusAggregator(use_bitmaps=False)
+    aggregator.absorb(response)
+    assert aggregator.to_dataframe().equals(all_entities_df(response).astype(object))
+
+    aggregator.absorb(single_doc_response(hit('BRCA1')))
+    df = aggregator.to_dataframe()
+    assert df.loc['GENE$BRCA1', 'doc_id'] == ['', '']
+    assert df.loc['GENE$BRCA1', 'doc_count'] == 2
+
+
+def test_doc_id_names_single_document_responses():
+    aggregator = CorpusAggregator(use_bitmaps=False)
+    aggregator.absorb(single_doc_response(hit('BRCA1')), doc_id='a')
+    aggregator.absorb(single_doc_response(hit('BRCA1')), doc_id='b')
+    aggregator.absorb(single_doc_response(hit('BRCA1')), doc_id='a')
+
+    df = aggregator.to_dataframe()
+    assert df.loc['GENE$BRCA1', 'doc_id'] == ['a', 'b']
+    assert df.loc['GENE$BRCA1', 'doc_count'] == 2
+
+
+def test_multidoc_response_counts_each_document():
+    aggregator = CorpusAggregator(use_bitmaps=False)
+    aggregator.absorb({'RESP_MULTIDOC_PAYLOAD': {'d1': {'GENE': [hit('BRCA1')]},
+                                                 'd2': {'GENE': [hit('BRCA1'), hit('TP53')]}}})
+    df = aggregator.to_dataframe()
+    assert df.loc['GENE$BRCA1', 'doc_id'] == ['d1', 'd2']
+    assert df.loc['GENE$TP53', 'doc_count'] == 1
+
+
+@pytest.mark.parametrize('use_bitmaps', BITMAP_OPTIONS)
+def test_merge_and_checkpoint_keep_document_counts(tmp_path, use_bitmaps):
+    first = CorpusAggregator(use_bitmaps=use_bitmaps)
+    first.absorb(single_doc_response(hit('BRCA1')))
+    first.absorb(single_doc_response(hit('BRCA1')), doc_id='shared')
+    second = CorpusAggregator(use_bitmaps=use_bitmaps)
+    second.absorb(single_doc_response(hit('BRCA1')))
+    second.absorb(single_doc_response(hit('BRCA1', score=5)), doc_id='shared')
+
+    first.merge(second)
+    assert first.doc_count == 3
+    assert first.to_dataframe().loc['GENE$BRCA1', 'doc_count'] == 3
+
+    path = str(tmp_path / 'entities.npz')
+    first.checkpoint(path)
+    restored = CorpusAggregator.load(path, use_bitmaps=use_bitmaps)
+    restored.absorb(single_doc_response(hit('BRCA1')))
+    df = restored.to_dataframe()
+    assert df.loc['GENE$BRCA1', 'doc_count'] == 4
+    assert df.loc['GENE$BRCA1', 'hit_count'] == 5
+    assert df.loc['GENE$BRCA1', 'max_relevance_score'] == 5
@@ -0,0 +1,104 @@
+import asyncio
+import io
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('aiohttp')
+
+from termite_toolkit.aio import AsyncTermiteClient, AsyncTexpressClient
+from termite_toolkit.exceptions import TermiteHTTPError
+from termite_toolkit.session import RetryPolicy
+
+
+class ConcurrencyTracker():
+
+    def __init__(self, fail_after=None):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+        self.count = 0
+        self.fail_after = fail_after
+
+    def respond(self, method, path):
+        with self.lock:
+            self.active += 1
+            self.count += 1
+            count = self.count
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.02)
+        with self.lock:
+            self.active -= 1
+        if self.fail_after is not None and count > self.fail_after:
+            return 400, {}
+        return 200, {'RESP_PAYLOAD': {}}
+
+
+def test_annotate_many_bounds_requests_in_flight(http_server):
+    tracker = ConcurrencyTracker()
+    url = http_server(tracker.respond)
+    pulled = []
+
+    def texts():
+        for idx in range(20):
+            pulled.append(idx)
+            yield 'text %d' % idx
+
+    async def run():
+        async with AsyncTermiteClient(url, max_concurrency=50) as client:
+            return await client.annotate_many(texts(), {'output': 'json'}, max_in_flight=3)
+
+    results = asyncio.run(run())
+    assert len(results) == 20
+    assert results == [{'RESP_PAYLOAD': {}}] * 20
+    assert tracker.count == 20
+    assert tracker.peak <= 3
+
+
+def test_annotate_many_raises_and_stops_on_failure(http_server):
+    tracker = ConcurrencyTracker(fail_after=2)
+    url = http_server(tracker.respond)
+
+    async def run():
+        async with AsyncTermiteClient(url, retry=RetryPolicy(max_retries=0)) as client:
+            await client.annotate_many(('text %d' % idx for idx in range(100)), {'output': 'json'}, max_in_flight=2)
+
+    with pytest.raises(TermiteHTTPError):
+        asyncio.run(run())
+    assert tracker.count < 10
+
+
+def test_texpress_client_parses_json_outputs_only(http_server):
+    url = http_server(lambda method, path: (200, {'RESP_TEXPRESS': {}}))
+
+    async def run(output):
+        async with AsyncTexpressClient(url) as client:
+            request = client.new_request()
+            request.set_text('BRCA1')
+            request.set_output_format(output)
+            return await client.execute(request, result=True)
+
+    assert asyncio.run(run('json')) == {'RESP_TEXPRESS': {}}
+    assert asyncio.run(run('tsv')) == '{"RESP_TEXPRESS": {}}'
+
+
+def test_retried_upload_resends_file_object_from_its_start(http_server):
+    statuses = [503, 200]
+    url = http_server(lambda method, path: (statuses.pop(0), {'RESP_PAYLOAD': {}}))
+    content = b'BRCA1 is associated with breast cancer' * 100
+    data = io.BytesIO(b'header' + content)
+    data.seek(len(b'header'))
+
+    async def run():
+        async with AsyncTermiteClient(url, retry=RetryPolicy(max_retries=1, backoff_factor=0)) as client:
+            request = client.new_request()
+            request.set_binary_data(data, 'doc.txt')
+            request.set_output_format('json')
+            return await client.execute(request, result=True)
+
+    assert asyncio.run(run()).raw == {'RESP_PAYLOAD': {}}
+    first, second = http_server.request_bodies
+    assert content in first and b'header' not in first
+    assert content in second and b'header' not in second
+    assert len(second) == len(first)
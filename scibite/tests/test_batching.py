@@ -0,0 +1,80 @@
+import io
+import time
+import zipfile
+
+import pytest
+
+from termite_toolkit.batching import TextBatcher, _iter_batches, split_batch_response
+from termite_toolkit.termite import TermiteResult
+
+
+def test_json_batch_response_maps_docids_by_file_basename():
+    payload = {'GENE': [{'hitID': 'BRCA1'}]}
+    response = {'RESP_META': {'time': 1}, 'RESP_MULTIDOC_PAYLOAD': {
+        'batch.zip/2.txt': payload, 'dir\\0.txt': {'DRUG': []}, 'readme.md': {'GENE': []}, '7.txt': {'GENE': []}}}
+    responses = split_batch_response(response, 3)
+    assert responses == [{'RESP_META': {'time': 1}, 'RESP_PAYLOAD': {'DRUG': []}},
+                         {'RESP_META': {'time': 1}, 'RESP_PAYLOAD': {}},
+                         {'RESP_META': {'time': 1}, 'RESP_PAYLOAD': payload}]
+
+
+def test_single_text_batch_keeps_its_resp_payload():
+    response = TermiteResult({'RESP_PAYLOAD': {'GENE': [{'hitID': 'TP53'}]}})
+    assert split_batch_response(response, 1) == [{'RESP_PAYLOAD': {'GENE': [{'hitID': 'TP53'}]}}]
+
+
+def test_docjsonx_batch_response_groups_documents_by_text():
+    docs = [{'docID': 'batch.zip/1.txt', 'body': 'b'}, {'docID': 'x/y/0.txt', 'body': 'a'},
+            {'docID': '1.txt', 'body': 'b2'}, {'body': 'no docID'}]
+    assert split_batch_response(docs, 3) == [[docs[1]], [docs[0], docs[2]], []]
+
+
+def batch_server(http_server):
+    """
+    Answer each batch with one document per text, whose payload holds the text, and record the texts of each batch
+    """
+    batches = []
+
+    def respond(method, path, body):
+        archive = zipfile.ZipFile(io.BytesIO(body[body.index(b'PK\x03\x04'):body.rindex(b'\r\n--')]))
+        texts = {name: archive.read(name).decode() for name in archive.namelist()}
+        batches.append(sorted(texts.values()))
+        return 200, {'RESP_MULTIDOC_PAYLOAD': {name: {'TEXT': [text]} for name, text in texts.items()}}
+
+    url = http_server(respond)
+    return url, batches
+
+
+def test_partial_batch_is_sent_after_max_latency(http_server):
+    url, batches = batch_server(http_server)
+    with TextBatcher(url, {'output': 'json'}, max_docs=10, max_latency=0.2) as batcher:
+        started = time.monotonic()
+        futures = [batcher.submit('text %d' % idx) for idx in range(3)]
+        assert not any(future.done() for future in futures)
+        results = [future.result(timeout=5) for future in futures]
+        assert time.monotonic() - started >= 0.2
+    assert [result['RESP_PAYLOAD'] for result in results] == [{'TEXT': ['text %d' % idx]} for idx in range(3)]
+    assert batches == [['text 0', 'text 1', 'text 2']]
+
+
+def test_full_batches_are_sent_without_waiting_and_close_drains_the_rest(http_server):
+    url, batches = batch_server(http_server)
+    batcher = TextBatcher(url, {'output': 'json'}, max_docs=2, max_latency=60)
+    futures = [batcher.submit('text %d' % idx) for idx in range(5)]
+    assert futures[1].result(timeout=5)['RESP_PAYLOAD'] == {'TEXT': ['text 1']}
+    assert not futures[4].done()
+    batcher.close()
+    assert futures[4].result(timeout=0)['RESP_PAYLOAD'] == {'TEXT': ['text 4']}
+    assert sorted(batches) == [['text 0', 'text 1'], ['text 2', 'text 3'], ['text 4']]
+    with pytest.raises(RuntimeError):
+        batcher.submit('late')
+
+
+def test_batches_stay_within_max_bytes_like_annotate_text_batched(http_server):
+    url, batches = batch_server(http_server)
+    texts = ['%02d' % idx + 'x' * 58 for idx in range(3)] + ['short']
+    with TextBatcher(url, {'output': 'json'}, max_docs=10, max_bytes=100, max_latency=60) as batcher:
+        futures = [batcher.submit(text) for text in texts]
+    assert [future.result(timeout=0)['RESP_PAYLOAD'] for future in futures] == [{'TEXT': [text]} for text in texts]
+    assert sorted(batches) == sorted([[texts[0]], [texts[1]], [texts[2], 'short']])
+    assert sorted(batches) == sorted(sorted(batch) for batch in _iter_batches(texts, 10, 100))
@@ -0,0 +1,97 @@
+import io
+
+from termite_toolkit import cache as cache_module
+from termite_toolkit.cache import LRUCache, ResponseCache, request_key
+from termite_toolkit.termite import TermiteRequestBuilder
+
+
+def test_request_key_normalises_options_but_not_user_or_file_name():
+    payload = {'output': 'json', 'entities': 'GENE,DRUG', 'opts': 'a=1&b=2'}
+    reordered = {'opts': 'b=2&a=1', 'entities': 'DRUG, GENE', 'output': 'json'}
+    assert request_key('u', payload) == request_key('u', reordered)
+    assert request_key('u', payload, user='alice') != request_key('u', payload, user='bob')
+    assert request_key('u', payload) != request_key('u', payload, user='alice')
+
+    content = {'binary': ('a.zip', b'data')}
+    assert request_key('u', payload, content) != request_key('u', payload, {'binary': ('b.txt', b'data')})
+    source = io.BytesIO(b'xxdata')
+    source.seek(2)
+    assert request_key('u', payload, content) == request_key('u', payload, {'binary': ('a.zip', source)})
+    assert source.tell() == 2
+
+
+def test_response_cache_tracks_size_through_replace_and_eviction(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    with ResponseCache(path, max_bytes=25) as cache:
+        cache.set('a', 'x' * 10)
+        cache.set('b', 'y' * 10)
+        cache.set('a', 'z' * 5)
+        assert cache.stats()['bytes'] == 15
+        assert cache.get('b') == 'y' * 10
+        cache.set('c', 'w' * 12)
+        # 'a' was least recently used
+        assert cache.get('a') is None
+        assert cache.stats()['bytes'] == 22
+        assert cache.stats()['entries'] == 2
+        assert cache.evictions == 1
+
+    # the running total is kept in the database, so it survives reopening
+    with ResponseCache(path, max_bytes=25) as cache:
+        assert cache.stats()['bytes'] == 22
+        cache.clear()
+        assert cache.stats()['bytes'] == 0
+
+
+def test_expired_entries_leave_the_size_total(tmp_path):
+    with ResponseCache(str(tmp_path / 'cache.sqlite'), ttl=-1) as cache:
+        cache.set('a', 'x' * 10)
+        assert cache.get('a') is None
+        assert cache.stats()['bytes'] == 0
+
+
+def test_users_do_not_share_cached_responses(http_server, tmp_path):
+    seen = []
+
+    def respond(method, path):
+        seen.append(path)
+        return 200, {'RESP_PAYLOAD': {'n': len(seen)}}
+
+    url = http_server(respond)
+    with ResponseCache(str(tmp_path / 'cache.sqlite')) as cache:
+        results = []
+        for user in ['alice', 'bob', 'alice']:
+            t = TermiteRequestBuilder()
+            t.set_url(url)
+            t.set_cache(cache)
+            t.set_basic_auth(user, 'secret')
+            t.set_text('BRCA1')
+            t.set_output_format('json')
+            results.append(t.execute()['RESP_PAYLOAD']['n'])
+    assert results == [1, 2, 1]
+
+
+def test_lru_cache_evicts_least_recently_used_entry():
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert len(cache) == 2
+    assert cache.stats() == {'hits': 3, 'misses': 1, 'hit_rate': 0.75, 'evictions': 1, 'entries': 2}
+
+
+def test_lru_cache_entries_expire_after_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache_module.time, 'monotonic', lambda: now[0])
+    cache = LRUCache(ttl=10)
+    cache.set('a', 1)
+    now[0] = 110.0
+    assert cache.get('a') == 1
+    now[0] = 110.5
+    assert cache.get('a', 'expired') == 'expired'
+    assert len(cache) == 0
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
@@ -0,0 +1,125 @@
+import json
+import os
+
+import pytest
+
+from termite_toolkit import corpus
+
+
+def make_doc(idx):
+    body = 'BRCA1 in doc %d' % idx
+    return {'docID': 'doc%d' % idx, 'body': body,
+            'termiteTags': [{'entityType': 'GENE', 'hitID': 'BRCA1', 'name': 'BRCA1', 'subsume': [False],
+                             'exact_array': [{'fls': [1, 0, 5]}]}]}
+
+
+def shard_names(output_dir):
+    return sorted(name for name in os.listdir(output_dir) if name.startswith('part-'))
+
+
+def test_markup_corpus_writes_ordered_shards(tmp_path):
+    output_dir = str(tmp_path / 'out')
+    paths = corpus.markup_corpus((make_doc(i) for i in range(7)), output_dir, chunk_size=3, max_workers=2,
+                                 vocabs=['GENE'])
+    assert [os.path.basename(path) for path in paths] == ['part-00000.jsonl', 'part-00001.jsonl', 'part-00002.jsonl']
+    rows = list(corpus.read_shards(output_dir))
+    assert [row['docIdx'] for row in rows] == list(range(7))
+    assert rows[4] == {'docIdx': 4, 'docID': 'doc4', 'termited_text': 'GENE_BRCA1 in doc 4'}
+
+
+def test_resume_only_recomputes_missing_shards(tmp_path):
+    output_dir = str(tmp_path / 'out')
+    paths = corpus.markup_corpus([make_doc(i) for i in range(6)], output_dir, chunk_size=2, vocabs=['GENE'])
+    os.remove(paths[1])
+    with open(paths[0], 'w') as f:
+        f.write(json.dumps({'docIdx': 0, 'marker': 'kept'}) + '\n')
+
+    corpus.markup_corpus([make_doc(i) for i in range(6)], output_dir, chunk_size=2, vocabs=['GENE'], resume=True)
+    rows = list(corpus.read_shards(output_dir))
+    assert rows[0] == {'docIdx': 0, 'marker': 'kept'}
+    assert [row['docIdx'] for row in rows[1:]] == [2, 3, 4, 5]
+
+    with pytest.raises(ValueError):
+        corpus.markup_corpus([make_doc(i) for i in range(6)], output_dir, chunk_size=3, vocabs=['GENE'], resume=True)
+
+
+def test_resume_over_shorter_corpus_drops_trailing_shards(tmp_path):
+    output_dir = str(tmp_path / 'out')
+    corpus.markup_corpus([make_doc(i) for i in range(6)], output_dir, chunk_size=2)
+    corpus.markup_corpus([make_doc(i) for i in range(4)], output_dir, chunk_size=2, resume=True)
+    assert shard_names(output_dir) == ['part-00000.jsonl', 'part-00001.jsonl']
+    assert [row['docIdx'] for row in corpus.read_shards(output_dir)] == [0, 1, 2, 3]
+
+
+def test_rerun_without_resume_replaces_previous_output(tmp_path):
+    output_dir = str(tmp_path / 'out')
+    corpus.markup_corpus([make_doc(i) for i in range(6)], output_dir, chunk_size=2)
+    with open(os.path.join(output_dir, 'part-00009.jsonl.tmp'), 'w') as f:
+        f.write('partial')
+
+    corpus.markup_corpus([make_doc(i) for i in range(3)], output_dir, chunk_size=1, resume=False,
+                         normalisation='name')
+    assert shard_names(output_dir) == ['part-00000.jsonl', 'part-00001.jsonl', 'part-00002.jsonl']
+    rows = list(corpus.read_shards(output_dir))
+    assert [row['termited_text'] for row in rows] == ['BRCA1 in doc 0', 'BRCA1 in doc 1', 'BRCA1 in doc 2']
+
+
+def test_resume_refuses_changed_documents(tmp_path):
+    output_dir = str(tmp_path / 'out')
+    corpus.markup_corpus([make_doc(i) for i in range(4)], output_dir, chunk_size=2)
+    edited = [make_doc(i) for i in range(4)]
+    edited[2]['body'] = 'BRCA1 was edited'
+    with pytest.raises(ValueError):
+        corpus.markup_corpus(edited, output_dir, chunk_size=2, resume=True)
+
+    reordered = [make_doc(i) for i in [1, 0, 2, 3]]
+    with pytest.raises(ValueError):
+        corpus.markup_corpus(reordered, output_dir, chunk_size=2, resume=True)
+
+
+def test_default_rerun_recomputes_every_shard(tmp_path):
+    output_dir = str(tmp_path / 'out')
+    corpus.markup_corpus([make_doc(i) for i in range(4)], output_dir, chunk_size=2)
+    edited = [make_doc(i) for i in range(4)]
+    edited[0]['docID'] = 'renamed'
+    corpus.markup_corpus(edited, output_dir, chunk_size=2)
+    assert [row['docID'] for row in corpus.read_shards(output_dir)] == ['renamed', 'doc1', 'doc2', 'doc3']
+
+
+def test_shard_without_recorded_fingerprint_is_recomputed(tmp_path):
+    output_dir = str(tmp_path / 'out')
+    corpus.markup_corpus([make_doc(i) for i in range(4)], output_dir, chunk_size=2)
+    os.remove(os.path.join(output_dir, corpus.SHARD_LOG))
+    with open(os.path.join(output_dir, 'part-00001.jsonl'), 'w') as f:
+        f.write(json.dumps({'docIdx': 2, 'marker': 'unverified'}) + '\n')
+    corpus.markup_corpus([make_doc(i) for i in range(4)], output_dir, chunk_size=2, resume=True)
+    assert [row['docID'] for row in corpus.read_shards(output_dir)] == ['doc0', 'doc1', 'doc2', 'doc3']
+
+
+def test_other_files_in_output_dir_are_left_alone(tmp_path):
+    output_dir = tmp_path / 'out'
+    output_dir.mkdir()
+    for name in ['part-0.parquet', 'part-00000-1a2b.snappy.parquet', 'notes.txt']:
+        (output_dir / name).write_text('not a shard')
+    corpus.markup_corpus([make_doc(i) for i in range(3)], str(output_dir), chunk_size=2)
+    corpus.markup_corpus([make_doc(i) for i in range(1)], str(output_dir), chunk_size=2)
+    assert sorted(os.listdir(str(output_dir))) == ['_manifest.json', '_shards.jsonl', 'notes.txt',
+                                                   'part-0.parquet', 'part-00000-1a2b.snappy.parquet',
+                                                   'part-00000.jsonl']
+
+
+def test_rerun_in_another_format_reads_only_new_shards(tmp_path):
+    pytest.importorskip('pyarrow')
+    output_dir = str(tmp_path / 'out')
+    corpus.label_corpus([make_doc(i) for i in range(4)], output_dir, ['GENE'], scheme='bio', chunk_size=2)
+    corpus.label_corpus([make_doc(i) for i in range(3)], output_dir, ['GENE'], scheme='bio', chunk_size=2,
+                        output_format='parquet', resume=False)
+    assert shard_names(output_dir) == ['part-00000.parquet', 'part-00001.parquet']
+    rows = list(corpus.read_shards(output_dir))
+    assert [row['docID'] for row in rows] == ['doc0', 'doc1', 'doc2']
+    assert rows[0]['labels'][:2] == ['B-GENE', 'O']
+
+
+def test_read_shards_needs_a_manifest(tmp_path):
+    with pytest.raises(ValueError):
+        list(corpus.read_shards(str(tmp_path)))
@@ -0,0 +1,60 @@
+import pytest
+
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+
+from termite_toolkit import export
+from termite_toolkit.termite import iter_payload_records
+
+
+def termite_hit(hit_id, score=3):
+    return {'entityType': 'GENE', 'hitID': hit_id, 'name': hit_id, 'score': score, 'realSynList': [hit_id.lower()],
+            'totnosyns': 1, 'nonambigsyns': 1, 'frag_vector_array': ['...' + hit_id + '...'], 'hitCount': 1,
+            'subsume': [False], 'taxon': 9606}
+
+
+RESPONSE = {'RESP_MULTIDOC_PAYLOAD': {'d1': {'GENE': [termite_hit('BRCA1'), termite_hit('TP53', score=5)]},
+                                      'd2': {'GENE': [termite_hit('BRCA1')],
+                                             'DRUG': [dict(termite_hit('ASPIRIN'), entityType='DRUG')]}}}
+
+
+def test_termite_record_batches_follow_the_schema():
+    batches = list(export.termite_record_batches(iter_payload_records(RESPONSE), cols_to_add="taxon", batch_size=3))
+    assert [batch.num_rows for batch in batches] == [3, 1]
+    table = pa.Table.from_batches(batches)
+    assert table.schema == export.termite_schema("taxon")
+    assert table.column('docID').to_pylist() == ['d1', 'd1', 'd2', 'd2']
+    assert table.column('realSynList').to_pylist()[0] == ['brca1']
+    assert table.column('taxon').to_pylist() == ['9606'] * 4
+
+
+def test_write_termite_parquet_single_file(tmp_path):
+    path = str(tmp_path / 'hits.parquet')
+    export.write_termite_parquet(iter_payload_records(RESPONSE), path, batch_size=2)
+    table = pq.read_table(path)
+    assert table.num_rows == 4
+    assert table.column('hitID').to_pylist() == ['BRCA1', 'TP53', 'BRCA1', 'ASPIRIN']
+
+
+def test_write_termite_parquet_partitioned(tmp_path):
+    path = str(tmp_path / 'hits')
+    export.write_termite_parquet(iter_payload_records(RESPONSE), path, partition_cols=['entityType'])
+    assert sorted(p.name for p in (tmp_path / 'hits').iterdir()) == ['entityType=DRUG', 'entityType=GENE']
+    table = pq.read_table(str(tmp_path / 'hits' / 'entityType=GENE'))
+    assert sorted(table.column('hitID').to_pylist()) == ['BRCA1', 'BRCA1', 'TP53']
+
+
+def test_partitioned_rewrite_needs_overwrite_and_drops_stale_partitions(tmp_path):
+    path = str(tmp_path / 'hits')
+    export.write_termite_parquet(iter_payload_records(RESPONSE), path, partition_cols=['entityType'])
+    genes_only = {'RESP_MULTIDOC_PAYLOAD': {'d3': {'GENE': [termite_hit('EGFR')]}}}
+    with pytest.raises(ValueError):
+        export.write_termite_parquet(iter_payload_records(genes_only), path, partition_cols=['entityType'])
+    assert pq.read_table(path).num_rows == 4
+
+    export.write_termite_parquet(iter_payload_records(genes_only), path, partition_cols=['entityType'],
+                                 overwrite=True)
+    assert [p.name for p in (tmp_path / 'hits').iterdir()] == ['entityType=GENE']
+    table = pq.read_table(path)
+    assert table.num_rows == 1
+    assert table.column('hitID').to_pylist() == ['EGFR']
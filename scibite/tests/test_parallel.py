@@ -0,0 +1,87 @@
+import itertools
+import threading
+import time
+from urllib.parse import parse_qs
+
+import pytest
+
+from termite_toolkit import termite, texpress
+from termite_toolkit.exceptions import TermiteHTTPError
+
+
+class EchoServer():
+    """
+    Answer each request with the text it was sent, later texts faster so that they complete out of order, and
+    record how many requests are being answered at once
+    """
+
+    def __init__(self, fail_on=None):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+        self.fail_on = fail_on
+
+    def respond(self, method, path, body):
+        text = parse_qs(body.decode())['text'][0]
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.05 / (1 + int(text[4:])))
+        with self.lock:
+            self.active -= 1
+        if text == self.fail_on:
+            return 400, {}
+        return 200, {'RESP_PAYLOAD': {'text': text}}
+
+
+def texts(n):
+    return ['text%d' % idx for idx in range(n)]
+
+
+@pytest.mark.parametrize('module', [termite, texpress])
+def test_annotate_many_yields_results_in_input_order(http_server, module):
+    url = http_server(EchoServer().respond)
+    results = list(module.annotate_many(url, texts(8), {'output': 'json'}, max_workers=4))
+    assert [result['RESP_PAYLOAD']['text'] for result in results] == texts(8)
+
+
+@pytest.mark.parametrize('module', [termite, texpress])
+def test_annotate_many_unordered_yields_indexed_results_as_they_complete(http_server, module):
+    url = http_server(EchoServer().respond)
+    results = list(module.annotate_many(url, texts(8), {'output': 'json'}, max_workers=4, ordered=False))
+    assert sorted(idx for idx, _ in results) == list(range(8))
+    assert all(result['RESP_PAYLOAD']['text'] == 'text%d' % idx for idx, result in results)
+    assert [idx for idx, _ in results] != list(range(8))
+
+
+def test_annotate_many_consumes_input_lazily_within_max_in_flight(http_server):
+    server = EchoServer()
+    url = http_server(server.respond)
+    consumed = []
+
+    def endless_texts():
+        for idx in itertools.count():
+            consumed.append(idx)
+            yield 'text%d' % idx
+
+    results = termite.annotate_many(url, endless_texts(), {'output': 'json'}, max_workers=2, max_in_flight=3)
+    first = next(results)
+    assert first['RESP_PAYLOAD']['text'] == 'text0'
+    assert len(consumed) == 3
+    for n_yielded in range(2, 7):
+        next(results)
+        # each result yielded lets exactly one more text in
+        assert len(consumed) == n_yielded + 2
+    results.close()
+    assert server.peak <= 2
+
+
+@pytest.mark.parametrize('module', [termite, texpress])
+def test_annotate_many_raises_a_failed_request(http_server, module):
+    url = http_server(EchoServer(fail_on='text2').respond)
+    results = module.annotate_many(url, texts(6), {'output': 'json'}, max_workers=2)
+    assert next(results)['RESP_PAYLOAD']['text'] == 'text0'
+    assert next(results)['RESP_PAYLOAD']['text'] == 'text1'
+    with pytest.raises(TermiteHTTPError) as excinfo:
+        next(results)
+    assert excinfo.value.status_code == 400
@@ -0,0 +1,125 @@
+import json
+import os
+
+import pandas as pd
+
+from termite_toolkit import pipeline
+from termite_toolkit.parallel import bounded_map
+from termite_toolkit.termite import get_termite_dataframe
+from termite_toolkit.texpress import get_texpress_dataframe
+
+
+def hit(hit_id, entity_type='GENE', hit_count=1):
+    return {'entityType': entity_type, 'hitID': hit_id, 'name': hit_id, 'score': 3, 'hitCount': hit_count,
+            'nonambigsyns': 1, 'realSynList': [hit_id], 'totnosyns': 1, 'subsume': [False]}
+
+
+def pattern_match(doc_id, pattern_id, fragment, subsumed=False):
+    return {'RESP_TEXPRESS': {doc_id: {pattern_id: [{'meta': {'sentence': 1},
+                                                      'matches': [{'originalFragment': fragment,
+                                                                   'matchEntities': [], 'originalSentence': fragment,
+                                                                   'subsumed': subsumed}]}]}}}
+
+
+TERMITE_RESPONSES = [
+    {'RESP_MULTIDOC_PAYLOAD': {'d1': {'GENE': [hit('BRCA1', hit_count=2), hit('TP53')]}}},
+    {'RESP_MULTIDOC_PAYLOAD': {'d2': {'DRUG': [hit('TAM', 'DRUG')]}}},
+    [{'docID': 'd3', 'termiteTags': [hit('EGFR', 'INDICATION', 4)]}],
+]
+
+TEXPRESS_RESPONSES = [pattern_match('d1', 'p1', 'BRCA1 binds TP53'),
+                      pattern_match('d2', 'p2', 'TAM treats cancer'),
+                      pattern_match('d3', 'p1', 'subsumed', subsumed=True)]
+
+
+def worker_pid(item):
+    return item, os.getpid()
+
+
+def as_objects(df):
+    return df.astype(object).reset_index(drop=True)
+
+
+def test_termite_dataframe_matches_single_process_dataframe():
+    expected = pd.concat([get_termite_dataframe(response, cols_to_add='hitCount') for response in TERMITE_RESPONSES],
+                         ignore_index=True)
+    payloads = [json.dumps(response) for response in TERMITE_RESPONSES]
+    df = pipeline.termite_dataframe(payloads, cols_to_add='hitCount', max_workers=2)
+    assert list(df.columns) == list(expected.columns)
+    assert as_objects(df).equals(as_objects(expected))
+
+    batches = list(pipeline.iter_termite_batches(payloads, cols_to_add='hitCount', max_workers=2))
+    assert [list(batch['hitID']) for batch in batches] == [['BRCA1', 'TP53'], ['TAM'], ['EGFR']]
+
+
+def test_texpress_dataframe_matches_single_process_dataframe():
+    expected = pd.concat([get_texpress_dataframe(response) for response in TEXPRESS_RESPONSES[:2]],
+                         ignore_index=True)
+    payloads = [json.dumps(response).encode() for response in TEXPRESS_RESPONSES]
+    df = pipeline.texpress_dataframe(payloads, max_workers=2)
+    assert list(df.columns) == list(expected.columns)
+    assert as_objects(df).equals(as_objects(expected))
+    assert list(df['originalFragment']) == ['BRCA1 binds TP53', 'TAM treats cancer']
+
+
+def test_duplicate_cols_to_add_are_repeated_like_the_single_process_functions():
+    payloads = [json.dumps(response) for response in TERMITE_RESPONSES]
+    expected = get_termite_dataframe(TERMITE_RESPONSES[0], cols_to_add='hitCount,hitID')
+    df = pipeline.termite_dataframe(payloads[:1], cols_to_add='hitCount,hitID', max_workers=1)
+    assert list(df.columns) == list(expected.columns)
+    assert as_objects(df).equals(as_objects(expected))
+    batch = next(pipeline.iter_termite_batches(payloads[:1], cols_to_add='hitID', max_workers=1))
+    assert list(batch.columns).count('hitID') == 2
+
+    texpress_payloads = [json.dumps(response) for response in TEXPRESS_RESPONSES]
+    df = pipeline.texpress_dataframe(texpress_payloads, cols_to_add='patternID', max_workers=1)
+    assert list(df.columns).count('patternID') == 2
+    assert len(df) == 2
+
+
+def test_invalid_cols_to_add_returns_none():
+    payloads = [json.dumps(response) for response in TERMITE_RESPONSES]
+    assert pipeline.termite_dataframe(payloads, cols_to_add='missing', max_workers=1) is None
+    texpress_payloads = [json.dumps(response) for response in TEXPRESS_RESPONSES]
+    assert pipeline.texpress_dataframe(texpress_payloads, cols_to_add='missing', max_workers=1) is None
+    assert len(pipeline.termite_dataframe([], cols_to_add='missing', max_workers=1)) == 0
+
+
+def test_invalid_cols_to_add_in_batches_are_none_like_get_termite_dataframe(capsys):
+    responses = TERMITE_RESPONSES + [{'RESP_MULTIDOC_PAYLOAD': {}}]
+    payloads = [json.dumps(response) for response in responses]
+    batches = list(pipeline.iter_termite_batches(payloads, cols_to_add='missing', max_workers=1))
+    assert batches[:3] == [None, None, None]
+    assert len(batches[3]) == 0
+    assert get_termite_dataframe(responses[0], cols_to_add='missing') is None
+    assert 'Invalid column selection.' in capsys.readouterr().out
+
+    payloads = [json.dumps([{'docID': 'd1', 'termiteTags': [dict(hit('BRCA1'), extra=1)]}]),
+                json.dumps(TERMITE_RESPONSES[1])]
+    batches = list(pipeline.iter_termite_batches(payloads, cols_to_add='extra', max_workers=1))
+    assert list(batches[0]['extra']) == [1]
+    assert batches[1] is None
+
+    texpress_payloads = [json.dumps(response) for response in TEXPRESS_RESPONSES]
+    batches = list(pipeline.iter_texpress_batches(texpress_payloads, cols_to_add='missing', max_workers=1))
+    assert batches[:2] == [None, None]
+    assert len(batches[2]) == 0
+
+
+def test_categoricals_are_unioned_across_chunks():
+    payloads = [json.dumps(response) for response in TERMITE_RESPONSES]
+    df = pipeline.termite_dataframe(payloads, max_workers=2, max_in_flight=1)
+    assert isinstance(df['docID'].dtype, pd.CategoricalDtype)
+    assert isinstance(df['entityType'].dtype, pd.CategoricalDtype)
+    assert sorted(df['docID'].cat.categories) == ['d1', 'd2', 'd3']
+    assert sorted(df['entityType'].cat.categories) == ['DRUG', 'GENE', 'INDICATION']
+    assert list(df['docID']) == ['d1', 'd1', 'd2', 'd3']
+
+
+def test_bounded_map_with_processes_runs_items_in_worker_processes():
+    results = list(bounded_map(worker_pid, range(6), max_workers=2, processes=True))
+    assert [item for item, _ in results] == list(range(6))
+    assert os.getpid() not in {pid for _, pid in results}
+
+    unordered = list(bounded_map(worker_pid, range(6), max_workers=2, ordered=False, processes=True))
+    assert sorted((idx, item) for idx, (item, _) in unordered) == [(i, i) for i in range(6)]
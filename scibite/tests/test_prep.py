@@ -0,0 +1,169 @@
+import io
+import itertools
+import zipfile
+
+import numpy as np
+import pytest
+
+from termite_toolkit.prep import get_hits, label, markup, text_markup_many
+
+
+def tag(entity_type, hit_id, *locations, subsume=None):
+    return {'entityType': entity_type, 'hitID': hit_id, 'name': hit_id.lower(),
+            'exact_array': [{'fls': [1, start, end]} for start, end in locations],
+            'subsume': subsume or [False] * len(locations)}
+
+
+def spans(hits):
+    return [(hit['entityID'], hit['startLoc'], hit['endLoc']) for hit in hits]
+
+
+def test_get_hits_prefers_hierarchy_then_longest_then_earliest():
+    tags = [tag('GENE', 'G1', (0, 5), (20, 24)), tag('DRUG', 'D1', (2, 12)), tag('DRUG', 'D2', (18, 22))]
+    hits = get_hits(tags, hierarchy={'GENE': 0, 'DRUG': 1}, vocabs=['GENE', 'DRUG'])
+    assert spans(hits) == [('G1', 0, 5), ('G1', 20, 24)]
+
+    # without a hierarchy entity types rank in order of appearance
+    assert spans(get_hits(tags[::-1])) == [('D1', 2, 12), ('D2', 18, 22)]
+
+    same_rank = [tag('GENE', 'SHORT', (0, 4)), tag('GENE', 'LONG', (2, 9)), tag('GENE', 'TIE', (7, 14))]
+    assert spans(get_hits(same_rank)) == [('LONG', 2, 9)]
+    ties = [tag('GENE', 'LATE', (3, 8)), tag('GENE', 'EARLY', (0, 5))]
+    assert spans(get_hits(ties)) == [('EARLY', 0, 5)]
+
+
+def test_get_hits_keeps_subsumed_hits_only_where_nothing_else_overlaps():
+    tags = [tag('GENE', 'SUB', (0, 10), (30, 40), subsume=[True, True]), tag('DRUG', 'D1', (5, 8))]
+    hits = get_hits(tags, hierarchy={'GENE': 0, 'DRUG': 1}, vocabs=['GENE', 'DRUG'])
+    assert spans(hits) == [('D1', 5, 8), ('SUB', 30, 40)]
+
+
+def test_get_hits_adjacent_hits_do_not_overlap_and_vocabs_filter():
+    tags = [tag('GENE', 'A', (0, 5)), tag('GENE', 'B', (5, 9)), tag('SPECIES', 'S', (9, 12))]
+    assert spans(get_hits(tags, hierarchy={'GENE': 0}, vocabs=['GENE'])) == [('A', 0, 5), ('B', 5, 9)]
+    # hits with no exact locations are skipped
+    missing = dict(tag('GENE', 'M', (0, 3)), exact_array=[{'fls': [0, 0, 3]}])
+    assert get_hits([missing]) == []
+
+
+def test_get_hits_matches_pairwise_overlap_check():
+    def brute_force(tags):
+        kept = []
+        for hit in sorted(tags, key=lambda hit: (hit['subsume'][0], hit['exact_array'][0]['fls'][1] -
+                                                 hit['exact_array'][0]['fls'][2], hit['exact_array'][0]['fls'][1])):
+            start, end = hit['exact_array'][0]['fls'][1:]
+            if all(end <= other[1] or other[2] <= start for other in kept):
+                kept.append((hit['hitID'], start, end))
+        return sorted(kept, key=lambda span: span[1])
+
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        starts = rng.integers(0, 60, size=rng.integers(1, 15))
+        tags = [tag('GENE', 'H%d' % idx, (int(start), int(start + rng.integers(1, 12))),
+                    subsume=[bool(rng.random() < 0.2)]) for idx, start in enumerate(starts)]
+        assert spans(get_hits(tags)) == brute_force(tags)
+
+    # kept right to left, each new hit starting before all those already kept
+    tags = [tag('GENE', 'H%d' % idx, (10 * idx, 10 * idx + 1 + idx)) for idx in range(8)]
+    assert spans(get_hits(tags)) == [('H%d' % idx, 10 * idx, 10 * idx + 1 + idx) for idx in range(8)]
+
+
+DOC = {'body': 'BRCA1 and TP53 mutations in breast cancer, treated with tamoxifen.',
+       'termiteTags': [tag('GENE', 'BRCA1', (0, 5)), tag('GENE', 'TP53', (10, 14)),
+                       tag('INDICATION', 'D001943', (28, 41)), tag('INDICATION', 'D009369', (35, 41)),
+                       tag('DRUG', 'CHEMBL83', (56, 65))]}
+
+
+def spliced_markup(doc, normalisation, substitute, wrap, replacementDict=None):
+    # the markup algorithm before the single pass rewrite: each hit is spliced into the text, last hit first
+    templates = {'id': lambda sub: '_'.join([sub['entityType'], sub['entityID']]),
+                 'type': lambda sub: sub['entityType'],
+                 'name': lambda sub: sub['entityName'],
+                 'typeplusname': lambda sub: '%s %s' % (sub['entityType'], sub['entityName']),
+                 'typeplusid': lambda sub: '%s %s_%s' % (sub['entityType'], sub['entityType'], sub['entityID'])}
+    prefix, postfix = ('{!', '!}') if wrap else ('', '')
+    text = doc['body']
+    for sub in reversed(get_hits(doc['termiteTags'])):
+        if replacementDict:
+            subText = replacementDict[sub['entityType']].replace('~TYPE~', sub['entityType']).replace(
+                '~ID~', sub['entityID']).replace('~NAME~', sub['entityName'])
+        else:
+            subText = templates[normalisation](sub)
+            if not substitute:
+                subText += ' %s' % text[sub['startLoc']:sub['endLoc']]
+        text = text[:sub['startLoc']] + prefix + subText + postfix + text[sub['endLoc']:]
+    return text
+
+
+@pytest.mark.parametrize('normalisation,substitute,wrap',
+                         list(itertools.product(['id', 'type', 'name', 'typeplusname', 'typeplusid'], [True, False],
+                                                [True, False])))
+def test_markup_matches_spliced_output(normalisation, substitute, wrap):
+    result = markup([DOC], normalisation=normalisation, substitute=substitute, wrap=wrap)
+    assert result[0]['termited_text'] == spliced_markup(DOC, normalisation, substitute, wrap)
+
+
+def test_markup_replacement_dict_and_documents_without_hits():
+    replacements = {'GENE': '~TYPE~%s_~ID~', 'INDICATION': '<~NAME~>', 'DRUG': '100% ~ID~'}
+    result = markup([DOC, {'body': 'no hits here'}], replacementDict=replacements, wrap=True)
+    assert result[0]['termited_text'] == spliced_markup(DOC, 'id', True, True, replacements)
+    assert result[0]['termited_text'].startswith('{!GENE%s_BRCA1!} and {!GENE%s_TP53!}')
+    assert result[1]['termited_text'] == 'no hits here'
+
+
+NEWLINE_DOC = {'body': 'BRCA1\n\nbreast  cancer risk', 'termiteTags': [tag('GENE', 'BRCA1', (0, 5)),
+                                                                       tag('INDICATION', 'D001943', (7, 21))]}
+
+
+def test_label_words_follow_character_offsets_across_newlines():
+    result = label([NEWLINE_DOC], ['GENE', 'INDICATION'])[0]
+    assert result['split_text'] == ['BRCA1', 'breast', 'cancer', 'risk']
+    assert result['labels'] == [1, 2, 2, 0]
+
+    for scheme in ['bio', 'iob2']:
+        tagged = label([NEWLINE_DOC], ['GENE', 'INDICATION'], scheme=scheme)[0]['labels']
+        assert tagged == ['B-GENE', 'B-INDICATION', 'I-INDICATION', 'O']
+
+
+def test_label_as_numpy_and_char_level():
+    labels = label([NEWLINE_DOC], ['GENE', 'INDICATION'], as_numpy=True)[0]['labels']
+    assert labels.dtype == np.int32 and labels.tolist() == [1, 2, 2, 0]
+    tagged = label([NEWLINE_DOC], ['GENE', 'INDICATION'], scheme='bio', as_numpy=True)[0]['labels']
+    assert tagged.tolist() == ['B-GENE', 'B-INDICATION', 'I-INDICATION', 'O']
+
+    chars = label([NEWLINE_DOC], ['INDICATION'], labelLevel='char', scheme='bio')[0]
+    assert len(chars['split_text']) == len(NEWLINE_DOC['body'])
+    assert chars['labels'][:8] == ['O'] * 7 + ['B-INDICATION']
+    assert chars['labels'][8:21] == ['I-INDICATION'] * 13 and chars['labels'][21:] == ['O'] * 5
+
+
+def test_label_rejects_unknown_scheme():
+    with pytest.raises(ValueError):
+        label([NEWLINE_DOC], ['GENE'], scheme='bilou')
+
+
+def docjsonx_server(http_server, vocab):
+    # answers a batch with a doc.JSONx document for each text containing a word from vocab, like TERMite with noEmpty
+    def respond(method, path):
+        body = http_server.request_bodies[-1]
+        start, end = body.index(b'PK\x03\x04'), body.rindex(b'PK\x05\x06') + 22
+        docs = []
+        with zipfile.ZipFile(io.BytesIO(body[start:end])) as archive:
+            for name in archive.namelist():
+                text = archive.read(name).decode()
+                tags = [tag(entity_type, word, (text.index(word), text.index(word) + len(word)))
+                        for word, entity_type in vocab.items() if word in text]
+                if tags:
+                    docs.append({'docID': 'batch.zip/' + name, 'body': text, 'termiteTags': tags})
+        return 200, docs
+
+    return http_server(respond)
+
+
+def test_text_markup_many_marks_up_texts_in_order(http_server):
+    url = docjsonx_server(http_server, {'BRCA1': 'GENE', 'tamoxifen': 'DRUG'})
+    texts = ['BRCA1 is a gene', 'nothing to see', 'tamoxifen treats BRCA1 carriers'] * 3
+    marked = list(text_markup_many(iter(texts), termiteAddr=url, vocabs=['GENE', 'DRUG'], max_docs=2,
+                                   max_workers=1))
+    assert marked == ['GENE_BRCA1 is a gene', 'nothing to see', 'DRUG_tamoxifen treats GENE_BRCA1 carriers'] * 3
+    assert len(http_server.request_bodies) == 5
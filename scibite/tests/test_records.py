@@ -0,0 +1,39 @@
+import pytest
+
+from termite_toolkit.records import RecordView
+from termite_toolkit.termite import docjsonx_payload_records
+
+
+def test_earlier_layers_take_precedence_and_excluded_keys_are_hidden():
+    doc = {'docID': 'd1', 'score': 'doc', 'termiteTags': []}
+    entity_hit = {'hitID': 'BRCA1', 'score': 3}
+    view = RecordView((doc, entity_hit), frozenset(['termiteTags']))
+    assert view['score'] == 'doc'
+    assert 'termiteTags' not in view and view.get('termiteTags') is None
+    with pytest.raises(KeyError):
+        view['termiteTags']
+    assert list(view) == ['hitID', 'score', 'docID']
+    assert len(view) == 3
+    assert dict(view) == {'hitID': 'BRCA1', 'score': 'doc', 'docID': 'd1'}
+
+
+def test_views_read_through_to_the_response_without_copying():
+    entity_hit = {'hitID': 'BRCA1'}
+    view = RecordView(({'docID': 'd1'}, entity_hit))
+    with pytest.raises(TypeError):
+        view['hitID'] = 'TP53'
+    entity_hit['name'] = 'brca1'
+    assert view['name'] == 'brca1'
+    copy = dict(view)
+    entity_hit['name'] = 'changed'
+    assert copy['name'] == 'brca1'
+
+
+def test_docjsonx_records_layer_document_fields_over_hits():
+    hits = [{'hitID': 'BRCA1', 'score': 3, 'nonambigsyns': 1, 'subsume': [False], 'docID': 'stale'},
+            {'hitID': 'TP53', 'score': 1, 'nonambigsyns': 0}]
+    response = [{'docID': 'd1', 'body': 'text', 'termiteTags': hits}]
+    records = docjsonx_payload_records(response)
+    assert [dict(record) for record in records] == [
+        {'hitID': 'BRCA1', 'score': 3, 'nonambigsyns': 1, 'subsume': [False], 'docID': 'd1', 'body': 'text'}]
+    assert response[0]['termiteTags'] is hits and hits[0]['docID'] == 'stale'
@@ -0,0 +1,165 @@
+import asyncio
+import time
+
+import pytest
+import requests
+
+from termite_toolkit import session as session_module
+from termite_toolkit.exceptions import CircuitOpenError, TermiteConnectionError, TermiteHTTPError
+from termite_toolkit.session import CircuitBreaker, HttpSession, RetryPolicy, get_default_session, \
+    set_default_session
+from termite_toolkit.termite import TermiteRequestBuilder
+from termite_toolkit.texpress import TexpressRequestBuilder
+from termite_toolkit.utilities import UtilitiesRequestBuilder
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+def builders(url):
+    t = TermiteRequestBuilder()
+    t.set_url(url)
+    t.set_text('BRCA1')
+    x = TexpressRequestBuilder()
+    x.set_url(url)
+    x.set_text('BRCA1')
+    u = UtilitiesRequestBuilder()
+    u.set_url(url)
+    return t, x, u
+
+
+def execute_all(t, x, u):
+    for _ in range(3):
+        t.execute()
+        x.execute()
+        u.get_entity('BRCA1', 'GENE')
+
+
+def test_builders_share_the_default_session_until_it_is_replaced(http_server, monkeypatch):
+    monkeypatch.setattr(session_module, '_default_session', None)
+    url = http_server(lambda method, path: (200, {}))
+    t, x, u = builders(url)
+    execute_all(t, x, u)
+    assert len(http_server.request_clients) == 9
+    assert len(set(http_server.request_clients)) == 1
+    first = get_default_session()
+
+    replacement = HttpSession()
+    set_default_session(replacement)
+    assert get_default_session() is replacement
+    execute_all(t, x, u)
+    assert len(set(http_server.request_clients[9:])) == 1
+    assert http_server.request_clients[9] != http_server.request_clients[0]
+    first.close()
+    replacement.close()
+
+
+def test_set_session_binds_builders_to_their_own_pool(http_server, monkeypatch):
+    monkeypatch.setattr(session_module, '_default_session', None)
+    url = http_server(lambda method, path: (200, {}))
+    t, x, u = builders(url)
+    shared = HttpSession()
+    for builder in (t, x, u):
+        builder.set_session(shared)
+    execute_all(t, x, u)
+    assert len(set(http_server.request_clients)) == 1
+    assert session_module._default_session is None
+
+    closing = HttpSession(keep_alive=False)
+    t.set_session(closing)
+    for _ in range(3):
+        t.execute()
+    assert len(set(http_server.request_clients[9:])) == 3
+    assert not set(http_server.request_clients[9:]) & set(http_server.request_clients[:9])
+    shared.close()
+    closing.close()
+
+
+def test_backoff_is_bounded_and_honours_retry_after():
+    retry = RetryPolicy(backoff_factor=1, max_backoff=5)
+    for attempt in range(10):
+        assert 0 <= retry.backoff(attempt) <= min(5, 2 ** attempt)
+    assert retry.backoff(0, '2') == 2
+    assert retry.backoff(0, '120') == 5
+    assert 0 <= retry.backoff(0, 'not a date') <= 1
+    assert 0 <= RetryPolicy(respect_retry_after=False, backoff_factor=0.1).backoff(0, '120') <= 0.1
+
+
+def test_circuit_opens_after_threshold_and_allows_one_trial():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    assert breaker.before_request() is False
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+    time.sleep(0.06)
+    assert breaker.state == 'half-open'
+    assert breaker.before_request() is True
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+
+    time.sleep(0.06)
+    assert breaker.before_request() is True
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    assert breaker.failures == 0
+
+
+def test_retryable_status_is_retried_and_counted_as_failure(http_server):
+    statuses = [503, 503, 200]
+    url = http_server(lambda method, path: (statuses.pop(0), {}))
+    breaker = CircuitBreaker(failure_threshold=5)
+    session = HttpSession(retry=RetryPolicy(max_retries=3, backoff_factor=0), circuit_breaker=breaker)
+    assert session.post(url).status_code == 200
+    assert statuses == []
+    assert breaker.failures == 0
+
+    url = http_server(lambda method, path: (429, {}))
+    session = HttpSession(retry=RetryPolicy(max_retries=2, backoff_factor=0), circuit_breaker=breaker)
+    assert session.post(url).status_code == 429
+    assert breaker.failures == 3
+
+
+def test_connection_errors_open_the_circuit():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    session = HttpSession(retry=RetryPolicy(max_retries=1, backoff_factor=0), circuit_breaker=breaker)
+    with pytest.raises(TermiteConnectionError):
+        session.get('http://127.0.0.1:9/termite')
+    with pytest.raises(CircuitOpenError):
+        session.get('http://127.0.0.1:9/termite')
+
+
+def test_unexpected_error_during_trial_releases_the_trial_slot(http_server):
+    url = http_server(lambda method, path: (200, {}))
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    session = HttpSession(circuit_breaker=breaker)
+
+    with pytest.raises(requests.RequestException):
+        session.get('http://')
+    assert session.get(url).status_code == 200
+    assert breaker.state == 'closed'
+
+
+@pytest.mark.skipif(aiohttp is None, reason='aiohttp is not installed')
+def test_async_retryable_status_counts_as_failure(http_server):
+    from termite_toolkit.aio import AsyncTermiteClient
+
+    url = http_server(lambda method, path: (429, {}))
+    breaker = CircuitBreaker(failure_threshold=10)
+
+    async def run():
+        async with AsyncTermiteClient(url, retry=RetryPolicy(max_retries=1, backoff_factor=0),
+                                      circuit_breaker=breaker) as client:
+            await client.annotate_text('BRCA1', {'output': 'json'})
+
+    with pytest.raises(TermiteHTTPError):
+        asyncio.run(run())
+    assert breaker.failures == 2
@@ -0,0 +1,144 @@
+import re
+import xml.etree.ElementTree as ET
+import zipfile
+
+import pytest
+
+from termite_toolkit.sharding import iter_shards, iter_xml_shards, merge_responses
+from termite_toolkit.termite import annotate_files_sharded
+
+MEDLINE = b'''<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE PubmedArticleSet PUBLIC "-//NLM//DTD PubMedArticle, 1st January 2019//EN" "pubmed_190101.dtd">
+<!-- export -->
+<PubmedArticleSet xmlns="urn:example:pubmed" xmlns:m="urn:example:mesh" release="2019">
+  <PubmedArticle id="1"><Title>BRCA1 &amp; breast cancer</Title><m:Heading>D001943</m:Heading></PubmedArticle>
+  <PubmedArticle id="2"><Title><![CDATA[TP53 > 1]]></Title></PubmedArticle>
+  <!-- between records -->
+  <PubmedArticle id="3" note="a &gt; b"/>
+  <PubmedArticle id="4"><Title>caf\xc3\xa9</Title></PubmedArticle>
+  <PubmedArticle id="5"><Title>Aspirin</Title></PubmedArticle>
+</PubmedArticleSet>
+'''
+
+NS = '{urn:example:pubmed}'
+
+
+def write(tmp_path, content, name='medline.xml'):
+    path = tmp_path / name
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_xml_shards_keep_prolog_root_and_records(tmp_path):
+    path = write(tmp_path, MEDLINE)
+    shards = list(iter_xml_shards(path, 2, chunk_size=16))
+    assert len(shards) == 3
+
+    head = MEDLINE[:MEDLINE.index(b'release="2019">') + len(b'release="2019">')]
+    ids = []
+    for shard in shards:
+        assert shard.startswith(head)
+        root = ET.fromstring(shard)
+        assert root.tag == NS + 'PubmedArticleSet'
+        assert root.get('release') == '2019'
+        ids.append([record.get('id') for record in root])
+    assert ids == [['1', '2'], ['3', '4'], ['5']]
+
+    first = ET.fromstring(shards[0])
+    assert first[0].find(NS + 'Title').text == 'BRCA1 & breast cancer'
+    assert first[0].find('{urn:example:mesh}Heading').text == 'D001943'
+    assert first[1].find(NS + 'Title').text == 'TP53 > 1'
+    second = ET.fromstring(shards[1])
+    assert second[0].get('note') == 'a > b'
+    assert second[1].find(NS + 'Title').text == 'café'
+    assert b'<PubmedArticle id="3" note="a &gt; b"/>' in shards[1]
+
+
+def test_xml_shards_respect_max_docs(tmp_path):
+    path = write(tmp_path, MEDLINE)
+    shards = list(iter_xml_shards(path, 2, max_docs=3))
+    assert [[record.get('id') for record in ET.fromstring(shard)] for shard in shards] == [['1', '2'], ['3']]
+
+
+def test_iter_shards_names_shards(tmp_path):
+    path = write(tmp_path, b'<set><doc>a</doc><doc>b</doc><doc>c</doc></set>', name='corpus.xml')
+    shards = list(iter_shards(path, 2))
+    assert [name for name, _ in shards] == ['corpus-shard0.xml', 'corpus-shard1.xml']
+    assert shards[1][1] == b'<set>\n<doc>c</doc>\n</set>\n'
+
+
+def test_merge_responses():
+    merged = merge_responses([{'RESP_MULTIDOC_PAYLOAD': {'a': {}}, 'RESP_META': 1},
+                              {'RESP_MULTIDOC_PAYLOAD': {'b': {'GENE': []}}}])
+    assert merged == {'RESP_META': 1, 'RESP_MULTIDOC_PAYLOAD': {'a': {}, 'b': {'GENE': []}}}
+    assert merge_responses([[{'docID': 'a'}], [{'docID': 'b'}]]) == [{'docID': 'a'}, {'docID': 'b'}]
+
+
+def test_merge_responses_keys_single_document_shards_and_refuses_collisions():
+    merged = merge_responses([{'RESP_MULTIDOC_PAYLOAD': {'a': {}}}, {'RESP_PAYLOAD': {'GENE': []}}],
+                             names=['corpus-shard0.zip', 'corpus-shard1.zip'])
+    assert merged == {'RESP_MULTIDOC_PAYLOAD': {'a': {}, 'corpus-shard1.zip': {'GENE': []}}}
+    with pytest.raises(ValueError):
+        merge_responses([{'RESP_PAYLOAD': {}}])
+    with pytest.raises(ValueError):
+        merge_responses([{'RESP_MULTIDOC_PAYLOAD': {'a': {}}}, {'RESP_MULTIDOC_PAYLOAD': {'a': {'GENE': []}}}])
+    with pytest.raises(ValueError):
+        merge_responses([[{'docID': 'a'}], [{'docID': 'a'}]])
+    with pytest.raises(ValueError):
+        merge_responses(['docID\thitID'])
+
+
+def zip_corpus(tmp_path, n_docs):
+    path = tmp_path / 'corpus.zip'
+    with zipfile.ZipFile(str(path), 'w') as archive:
+        for idx in range(n_docs):
+            archive.writestr('doc%d.txt' % idx, 'BRCA1 text %d' % idx)
+    return str(path)
+
+
+def shard_server(http_server):
+    """
+    Answer every shard with one document per file in its zip, as TERMite does, in a single-document RESP_PAYLOAD
+    when the shard holds one file
+    """
+    def respond(method, path):
+        names = list(dict.fromkeys(re.findall(rb'doc\d+\.txt', http_server.request_bodies[-1])))
+        payloads = {name.decode(): {'GENE': [{'hitID': name.decode()}]} for name in names}
+        if len(payloads) == 1:
+            return 200, {'RESP_META': {}, 'RESP_PAYLOAD': payloads.popitem()[1]}
+        return 200, {'RESP_META': {}, 'RESP_MULTIDOC_PAYLOAD': payloads}
+
+    return http_server(respond)
+
+
+def test_annotate_files_sharded_merges_shard_responses(http_server, tmp_path):
+    url = shard_server(http_server)
+    path = zip_corpus(tmp_path, 5)
+    # one worker, so the server answers each shard from the body it received last
+    merged = annotate_files_sharded(url, path, {'output': 'json'}, shard_size=2, max_workers=1)
+    assert len(http_server.request_bodies) == 3
+    assert merged['RESP_META'] == {}
+    assert list(merged['RESP_MULTIDOC_PAYLOAD']) == ['doc0.txt', 'doc1.txt', 'doc2.txt', 'doc3.txt',
+                                                     'corpus-shard2.zip']
+    assert merged['RESP_MULTIDOC_PAYLOAD']['corpus-shard2.zip'] == {'GENE': [{'hitID': 'doc4.txt'}]}
+
+
+def test_annotate_files_sharded_yields_unmerged_responses_in_shard_order(http_server, tmp_path):
+    url = shard_server(http_server)
+    path = zip_corpus(tmp_path, 5)
+    responses = annotate_files_sharded(url, path, {'output': 'json'}, shard_size=2, max_workers=1, merge=False)
+    assert not isinstance(responses, (dict, list))
+    responses = list(responses)
+    assert [list(response.get('RESP_MULTIDOC_PAYLOAD', {})) for response in responses] == [
+        ['doc0.txt', 'doc1.txt'], ['doc2.txt', 'doc3.txt'], []]
+    assert responses[2]['RESP_PAYLOAD'] == {'GENE': [{'hitID': 'doc4.txt'}]}
+
+
+def test_annotate_files_sharded_refuses_to_merge_colliding_or_non_json_output(http_server, tmp_path):
+    url = http_server(lambda method, path: (200, {'RESP_MULTIDOC_PAYLOAD': {'doc.txt': {}}}))
+    path = zip_corpus(tmp_path, 4)
+    with pytest.raises(ValueError):
+        annotate_files_sharded(url, path, {'output': 'tsv'}, shard_size=2)
+    assert not http_server.request_bodies
+    with pytest.raises(ValueError):
+        annotate_files_sharded(url, path, {'output': 'json'}, shard_size=2)
@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from termite_toolkit import TermiteHTTPError
+from termite_toolkit.streaming import iter_json_documents
+from termite_toolkit.termite import TermiteRequestBuilder
+from termite_toolkit.texpress import TexpressRequestBuilder
+
+
+def split(raw, size):
+    return [raw[i:i + size] for i in range(0, len(raw), size)]
+
+
+def test_multi_chunk_document_is_decoded_whole():
+    docs = [{'docID': 'big', 'body': 'BRCA1 é中 ' * 50000, 'termiteTags': []},
+            {'docID': 'small', 'body': 'TP53', 'termiteTags': [{'hitID': 'TP53', 'score': 1.5e3}]}]
+    raw = json.dumps(docs, ensure_ascii=False).encode('utf-8')
+    # chunk boundaries fall inside multi-byte characters and inside the large value
+    assert list(iter_json_documents(split(raw, 4093))) == docs
+
+
+@pytest.mark.parametrize('size', [1, 7, 64 * 1024])
+def test_multidoc_payload_yields_one_document_at_a_time(size):
+    response = {'RESP_META': {'x': [1, 2]},
+                'RESP_MULTIDOC_PAYLOAD': {'d1': {'GENE': [{'hitID': 'BRCA1'}]}, 'd2': {}},
+                'RESP_PAYLOAD_SIZE': 12345}
+    docs = list(iter_json_documents(split(json.dumps(response), size)))
+    assert docs == [{'RESP_MULTIDOC_PAYLOAD': {'d1': {'GENE': [{'hitID': 'BRCA1'}]}}},
+                    {'RESP_MULTIDOC_PAYLOAD': {'d2': {}}}]
+
+
+def test_single_document_payload_and_trailing_number():
+    raw = b'{"RESP_PAYLOAD": {"GENE": []}, "count": 1234567}'
+    assert list(iter_json_documents(split(raw, 3))) == [{'RESP_PAYLOAD': {'GENE': []}}]
+    assert list(iter_json_documents(split(b'[1, 22, 333]', 1))) == [1, 22, 333]
+
+
+def test_empty_and_malformed_input():
+    assert list(iter_json_documents([])) == []
+    with pytest.raises(ValueError):
+        list(iter_json_documents([b'[{"a": 1}, {"b": ']))
+    with pytest.raises(ValueError):
+        list(iter_json_documents([b'"text"']))
+
+
+@pytest.mark.parametrize('builder_class', [TermiteRequestBuilder, TexpressRequestBuilder])
+def test_execute_streams_documents_and_closes_failed_responses(http_server, builder_class):
+    docs = [{'docID': 'd%d' % i, 'body': 'BRCA1 ' * 1000, 'termiteTags': []} for i in range(3)]
+    statuses = [200, 400]
+    url = http_server(lambda method, path: (statuses.pop(0), docs))
+    builder = builder_class()
+    builder.set_url(url)
+    builder.set_text('BRCA1')
+    builder.set_output_format('doc.jsonx')
+
+    stream = builder.execute(stream=True)
+    assert next(stream) == docs[0]
+    assert list(stream) == docs[1:]
+
+    with pytest.raises(TermiteHTTPError) as error:
+        builder.execute(stream=True)
+    assert error.value.status_code == 400
+    assert error.value.response.raw.closed
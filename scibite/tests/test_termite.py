@@ -0,0 +1,153 @@
+import json
+
+import pytest
+
+import termite_toolkit.termite as termite
+from termite_toolkit.termite import TermiteRequestBuilder, TermiteResult, TopHits, aggregate_hits, all_entities_df, \
+    entity_freq, get_termite_dataframe, payload_records, top_hits_df
+
+
+def hit(hit_id, hit_count=1):
+    return {'entityType': 'GENE', 'hitID': hit_id, 'name': hit_id, 'score': 3, 'hitCount': hit_count,
+            'nonambigsyns': 1, 'realSynList': [hit_id], 'totnosyns': 1, 'subsume': [False]}
+
+
+def totals(df):
+    return {row.hitID: (row.hitCount, row.docCount) for row in df.itertuples()}
+
+
+def test_aggregated_top_hits_count_interleaved_documents_once():
+    top_hits = TopHits(aggregate=True, include_docs=True)
+    records = [dict(hit('BRCA1'), docID='d1'), dict(hit('BRCA1'), docID='d2'), dict(hit('BRCA1', 3), docID='d1'),
+               dict(hit('TP53'), docID='d2')]
+    top_hits.add_records(records)
+    df = top_hits.dataframe()
+    assert totals(df) == {'BRCA1': (5, 2), 'TP53': (1, 1)}
+    assert list(df['docID'][0]) == ['d1', 'd2']
+
+
+def test_aggregated_top_hits_count_each_single_document_response():
+    top_hits = TopHits(aggregate=True)
+    top_hits.add({'RESP_PAYLOAD': {'GENE': [hit('BRCA1'), hit('TP53')]}})
+    top_hits.add({'RESP_PAYLOAD': {'GENE': [hit('BRCA1', 2)]}})
+    assert totals(top_hits.dataframe()) == {'BRCA1': (3, 2), 'TP53': (1, 1)}
+
+
+def test_streamed_single_document_payloads_are_separate_documents():
+    stream = iter([{'RESP_PAYLOAD': {'GENE': [hit('BRCA1')]}}, {'RESP_PAYLOAD': {'GENE': [hit('BRCA1')]}}])
+    df = top_hits_df(stream, aggregate=True)
+    assert totals(df) == {'BRCA1': (2, 2)}
+
+
+def test_top_hits_select_most_frequent_hits():
+    response = {'RESP_MULTIDOC_PAYLOAD': {'d1': {'GENE': [hit('A', 1), hit('B', 5)]},
+                                          'd2': {'GENE': [hit('C', 3), hit('A', 4)]}}}
+    df = top_hits_df(response, selection=3)
+    assert list(df['hitID']) == ['B', 'A', 'C']
+    streamed = top_hits_df(iter([response]), selection=3)
+    assert list(streamed['hitID']) == ['B', 'A', 'C']
+
+
+def test_top_hits_match_a_selection_from_the_dataframe():
+    response = [{'docID': 'd1', 'termiteTags': [hit('A', 2), dict(hit('T'), entityType='DRUG'), hit('B', 2)]},
+                {'docID': 'd2', 'termiteTags': [hit('C', 5), hit('A', 4), dict(hit('U', 9), entityType='DRUG')]}]
+    df = get_termite_dataframe(response)
+    genes = df[df['entityType'] == 'GENE']
+    top = top_hits_df(response, selection=3, entity_subset='GENE', include_docs=True)
+    expected = genes.nlargest(3, 'hitCount')
+    assert list(top['hitID']) == list(expected['hitID']) == ['C', 'A', 'A']
+    assert list(top['docID']) == ['d2', 'd2', 'd1']
+
+    aggregated = top_hits_df(response, selection=2, aggregate=True, include_docs=True)
+    expected = aggregate_hits(df).nlargest(2, 'hitCount')
+    assert list(aggregated['hitID']) == list(expected['hitID']) == ['U', 'A']
+    assert list(aggregated['docID']) == [['d2'], ['d1', 'd2']]
+
+
+def test_execute_returns_parsed_response_unless_result_requested(http_server):
+    response = {'RESP_PAYLOAD': {'GENE': [hit('BRCA1')]}}
+    url = http_server(lambda method, path: (200, response))
+    t = TermiteRequestBuilder()
+    t.set_url(url)
+    t.set_text('BRCA1')
+    t.set_output_format('json')
+    parsed = t.execute()
+    assert isinstance(parsed, dict) and json.loads(json.dumps(parsed)) == response
+
+    result = t.execute(result=True)
+    assert isinstance(result, TermiteResult)
+    assert result.raw == response and result == response
+
+
+def test_result_views_are_cached_and_module_functions_return_copies():
+    result = TermiteResult({'RESP_MULTIDOC_PAYLOAD': {'d1': {'GENE': [hit('BRCA1', 2)]},
+                                                      'd2': {'GENE': [hit('BRCA1'), hit('TP53')]}}})
+    assert result.dataframe() is result.dataframe()
+    assert result.dataframe(remove_subsumed=False) is not result.dataframe()
+    assert result.entity_summary() is result.entity_summary()
+
+    df = get_termite_dataframe(result)
+    assert df is not result.dataframe()
+    df.loc[:, 'hitCount'] = 0
+    assert list(result.dataframe()['hitCount']) == [2, 1, 1]
+    summary = all_entities_df(result)
+    summary.drop(summary.index, inplace=True)
+    assert list(result.entity_summary()['id']) == ['BRCA1', 'TP53']
+
+
+def test_entity_freq_is_indexed_by_entity_type_names_like_the_streamed_path():
+    docs = [{'docID': 'd1', 'termiteTags': [hit('BRCA1'), hit('TP53'), dict(hit('TAM'), entityType='DRUG')]}]
+    freq = entity_freq(docs)
+    streamed = entity_freq(iter(docs))
+    assert freq.index.dtype == object and streamed.index.dtype == object
+    assert freq.index.name == streamed.index.name == 'entityType'
+    assert freq.to_dict() == streamed.to_dict() == {'count': {'GENE': 2, 'DRUG': 1}}
+
+
+def test_multidoc_records_carry_their_docid_without_changing_the_response():
+    d1_hits = [hit('BRCA1'), dict(hit('AMBIG'), nonambigsyns=0)]
+    response = {'RESP_MULTIDOC_PAYLOAD': {'d1': {'GENE': d1_hits}, 'd2': {'GENE': [hit('TP53')]}}}
+    records = payload_records(response)
+    assert [(record['docID'], record['hitID']) for record in records] == [('d1', 'BRCA1'), ('d2', 'TP53')]
+    assert 'docID' not in d1_hits[0]
+
+    single = payload_records({'RESP_PAYLOAD': {'GENE': [hit('BRCA1')]}})
+    assert single == [hit('BRCA1')] and 'docID' not in single[0]
+
+
+def test_dataframe_is_built_column_wise_with_categorical_ids():
+    response = [{'docID': 'd1', 'termiteTags': [hit('BRCA1', 2), hit('TP53')]},
+                {'docID': 'd2', 'termiteTags': [dict(hit('BRCA1'), entityType='INDICATION')]}]
+    df = get_termite_dataframe(response, cols_to_add='hitCount')
+    assert list(df.columns) == ['docID', 'entityType', 'hitID', 'name', 'score', 'realSynList', 'totnosyns',
+                                'nonambigsyns', 'frag_vector_array', 'hitCount', 'hitCount']
+    assert df['docID'].dtype == 'category' and df['entityType'].dtype == 'category'
+    assert list(df['docID'].cat.categories) == ['d1', 'd2']
+    assert list(df['hitID']) == ['BRCA1', 'TP53', 'BRCA1']
+    assert df['frag_vector_array'].isna().all()
+
+    assert list(get_termite_dataframe([]).columns)[:2] == ['docID', 'entityType']
+    assert get_termite_dataframe(response, cols_to_add='missing') is None
+
+
+@pytest.mark.parametrize('response', [
+    {'RESP_MULTIDOC_PAYLOAD': {'d1': {'GENE': [hit('BRCA1', 2), hit('TP53')], 'DRUG': [dict(hit('TAM'), score=5)]},
+                               'd2': {'GENE': [dict(hit('BRCA1'), score=4)]}}},
+    {'RESP_PAYLOAD': {'GENE': [hit('BRCA1'), hit('TP53', 3)]}},
+])
+def test_groupby_summary_matches_record_summary_at_the_threshold(monkeypatch, response):
+    expected = all_entities_df(response)
+    n_records = len(payload_records(response))
+    grouped = []
+    monkeypatch.setattr(termite, 'entity_summary_from_dataframe',
+                        lambda df: grouped.append(df) or termite.pd.DataFrame())
+    monkeypatch.setattr(termite, 'GROUPBY_THRESHOLD', n_records + 1)
+    all_entities_df(response)
+    assert not grouped
+    monkeypatch.setattr(termite, 'GROUPBY_THRESHOLD', n_records)
+    all_entities_df(response)
+    assert len(grouped) == 1
+    monkeypatch.undo()
+
+    monkeypatch.setattr(termite, 'GROUPBY_THRESHOLD', n_records)
+    assert all_entities_df(response).equals(expected.astype(object))
@@ -0,0 +1,84 @@
+import io
+import zipfile
+
+import requests
+
+from termite_toolkit.session import HttpSession, RetryPolicy
+from termite_toolkit.termite import TermiteRequestBuilder
+from termite_toolkit.upload import MultipartStream, zip_documents
+
+FIELDS = {'output': 'json', 'opts': 'subsume=true&rejectAmbig=false'}
+
+
+def requests_body(fields, file_name, content, boundary):
+    """
+    Encode the same form with requests, using the boundary of a MultipartStream
+    """
+    body, _ = requests.models.RequestEncodingMixin._encode_files(
+        {'binary': (file_name, content, 'application/octet-stream')}, fields)
+    requests_boundary = body[2:body.index(b'\r\n')]
+    return body.replace(requests_boundary, boundary.encode())
+
+
+def test_streamed_body_matches_requests_and_its_length(tmp_path):
+    content = bytes(range(256)) * 1000
+    path = tmp_path / 'docs.zip'
+    path.write_bytes(content)
+    for source in [str(path), content, io.BytesIO(content)]:
+        with MultipartStream(FIELDS, {'binary': ('docs.zip', source)}, chunk_size=4096) as stream:
+            body = b''.join(stream)
+            assert body == requests_body(FIELDS, 'docs.zip', content, stream.boundary)
+            assert len(stream) == len(body)
+            assert stream.content_type == 'multipart/form-data; boundary=%s' % stream.boundary
+
+
+def test_body_can_be_iterated_again_from_the_start_of_each_source(tmp_path):
+    path = tmp_path / 'docs.zip'
+    path.write_bytes(b'a' * 10000)
+    file_obj = io.BytesIO(b'header' + b'b' * 10000)
+    file_obj.seek(6)
+    files = {'binary': ('docs.zip', str(path)), 'other': ('other.zip', file_obj)}
+    with MultipartStream(FIELDS, files, chunk_size=1000) as stream:
+        first = b''.join(stream)
+        assert b''.join(stream) == first
+        assert b'header' not in first and len(first) == len(stream)
+
+
+def test_files_opened_by_the_stream_are_closed(tmp_path):
+    path = tmp_path / 'docs.zip'
+    path.write_bytes(b'a' * 10000)
+    with MultipartStream(FIELDS, {'binary': ('docs.zip', str(path))}, chunk_size=1000) as stream:
+        chunks = iter(stream)
+        while not stream._open_files:
+            next(chunks)
+        opened = stream._open_files[0]
+        assert not opened.closed
+    assert opened.closed and not stream._open_files
+
+    with MultipartStream(FIELDS, {'binary': ('docs.zip', str(path))}) as stream:
+        b''.join(stream)
+        assert not stream._open_files
+
+
+def test_upload_sends_content_length_and_resends_whole_body_on_retry(http_server, tmp_path):
+    statuses = [503, 200]
+    url = http_server(lambda method, path: (statuses.pop(0), {'RESP_PAYLOAD': {}}))
+    content = zip_documents(['BRCA1 text %d' % idx for idx in range(50)])
+    path = tmp_path / 'docs.zip'
+    path.write_bytes(content)
+
+    t = TermiteRequestBuilder()
+    t.set_url(url)
+    t.set_session(HttpSession(retry=RetryPolicy(max_retries=2, backoff_factor=0)))
+    t.set_binary_content(str(path))
+    assert t.execute() == {'RESP_PAYLOAD': {}}
+    assert statuses == []
+    first, retried = http_server.request_bodies
+    assert first == retried
+    assert content in first and first.endswith(b'--\r\n')
+
+
+def test_zip_documents_names_plain_texts_by_position():
+    archive = zipfile.ZipFile(io.BytesIO(zip_documents(['first', ('named.xml', b'<doc/>'), 'third'])))
+    assert archive.namelist() == ['0.txt', 'named.xml', '2.txt']
+    assert archive.read('0.txt') == b'first' and archive.read('named.xml') == b'<doc/>'
@@ -0,0 +1,99 @@
+from termite_toolkit.cache import LRUCache
+from termite_toolkit.session import HttpSession, RetryPolicy
+from termite_toolkit.utilities import UtilitiesRequestBuilder
+
+
+def describe_server(path):
+    entity_id = path.split(':')[-1]
+    if entity_id == 'MISSING':
+        return 404, {'error': 'not found'}
+    if entity_id == 'EMPTY':
+        return 200, None
+    if entity_id == 'NORESULT':
+        return 200, {'error': 'no result'}
+    return 200, {'TOOL_RESULT': [{'name': 'name-' + entity_id, 'mappings': ['HGNC|1100']}]}
+
+
+def test_failed_lookup_does_not_abort_bulk_details(http_server):
+    url = http_server(lambda method, path: describe_server(path))
+    u = UtilitiesRequestBuilder()
+    u.set_url(url)
+
+    df = u.get_entities_details([('GENE', 'BRCA1'), ('GENE', 'MISSING'), ('GENE', 'BRCA1'), ('GENE', 'TP53')],
+                                max_workers=2)
+    assert list(df['id']) == ['BRCA1', 'MISSING', 'TP53']
+    assert list(df['name']) == ['name-BRCA1', '', 'name-TP53']
+    assert list(df['status']) == [200, 404, 200]
+    assert df['mappings'][0] == [['HGNC', '1100']]
+    assert df['mappings'][1] == []
+
+
+def test_unreadable_lookup_response_fails_its_row_only(http_server):
+    url = http_server(lambda method, path: describe_server(path))
+    u = UtilitiesRequestBuilder()
+    u.set_url(url)
+    u.set_cache(LRUCache())
+
+    df = u.get_entities_details([('GENE', 'EMPTY'), ('GENE', 'BRCA1'), ('GENE', 'NORESULT')], max_workers=2)
+    assert list(df['id']) == ['EMPTY', 'BRCA1', 'NORESULT']
+    assert list(df['name']) == ['', 'name-BRCA1', '']
+    assert list(df['status'].isna()) == [True, False, True]
+    assert df['status'][1] == 200
+    assert df['mappings'][2] == []
+    assert u.cache.stats()['entries'] == 2
+
+
+def test_single_failed_lookup_returns_empty_details(http_server):
+    url = http_server(lambda method, path: describe_server(path))
+    u = UtilitiesRequestBuilder()
+    u.set_url(url)
+    assert u.get_entity_details('MISSING', 'GENE') == {'id': 'MISSING', 'type': 'GENE', 'name': '', 'mappings': []}
+
+
+def test_unreachable_server_is_reported_per_entity():
+    u = UtilitiesRequestBuilder()
+    u.set_url('http://127.0.0.1:9/termite')
+    u.set_session(HttpSession(retry=RetryPolicy(max_retries=0)))
+    df = u.get_entities_details([('GENE', 'BRCA1'), ('GENE', 'TP53')])
+    assert list(df['status']) == [None, None]
+    assert list(df['name']) == ['', '']
+
+
+def test_bulk_details_use_bound_cache(http_server):
+    requests_seen = []
+
+    def respond(method, path):
+        requests_seen.append(path)
+        return describe_server(path)
+
+    url = http_server(respond)
+    u = UtilitiesRequestBuilder()
+    u.set_url(url)
+    u.set_cache(LRUCache())
+    u.get_entities_details([('GENE', 'BRCA1')])
+    df = u.get_entities_details([('GENE', 'BRCA1')])
+    assert len(requests_seen) == 1
+    assert list(df['status']) == [200]
+
+
+def test_autocomplete_is_cached_and_callers_get_their_own_copy(http_server):
+    requests_seen = []
+
+    def respond(method, path):
+        requests_seen.append(path)
+        return 200, {'RESP_PAYLOAD': [{'id': 'BRCA1', 'syns': ['BRCA1']}]}
+
+    url = http_server(respond)
+    u = UtilitiesRequestBuilder()
+    u.set_url(url)
+    cache = LRUCache()
+    u.set_cache(cache)
+    first = u.call_autocomplete('BRC', 'GENE')
+    first['RESP_PAYLOAD'].append('changed')
+    second = u.call_autocomplete('BRC', 'GENE')
+    second['RESP_PAYLOAD'][0]['syns'].append('changed')
+    assert u.call_autocomplete('BRC', 'GENE') == {'RESP_PAYLOAD': [{'id': 'BRCA1', 'syns': ['BRCA1']}]}
+    u.call_autocomplete('BRC', 'DRUG')
+    assert len(requests_seen) == 2
+    assert cache.stats()['hits'] == 2
+    assert cache.stats()['misses'] == 2